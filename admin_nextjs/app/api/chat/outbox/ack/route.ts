@@ -21,9 +21,11 @@ export async function POST(request: NextRequest) {
       )
     }
 
+    // Bridge повторяет ack из своего журнала: повтор безопасен, а удаленное
+    // сообщение (updateMany без ошибки) не блокирует остальные подтверждения
     for (const item of items) {
       if (!item.id) continue
-      await prisma.chatMessage.update({
+      await prisma.chatMessage.updateMany({
         where: { id: item.id },
         data: {
           telegramMessageId: item.telegram_message_id
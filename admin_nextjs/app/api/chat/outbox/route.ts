@@ -1,6 +1,12 @@
 import { NextRequest, NextResponse } from 'next/server'
 import { requireAuth, createApiResponse } from '@/lib/api-helpers'
 import { prisma } from '@/lib/prisma'
+import { waitForOutbox } from '@/lib/outbox-events'
+
+// Максимальное ожидание long-poll (nginx держит соединение до 60 сек)
+const MAX_WAIT_MS = 25_000
+// Даже без уведомления перепроверяем БД (сообщение могло появиться из другого процесса)
+const RECHECK_MS = 5_000
 
 export async function GET(request: NextRequest) {
   try {
@@ -9,16 +15,27 @@ export async function GET(request: NextRequest) {
     const { searchParams } = new URL(request.url)
     const limit = Number(searchParams.get('limit') || 50)
     const channel = searchParams.get('channel') || 'bot'
+    // wait=N (сек) - long-poll: если outbox пуст, ответ придет сразу после нового сообщения или через N сек
+    const waitMs = Math.min(Math.max(Number(searchParams.get('wait') || 0), 0) * 1000, MAX_WAIT_MS) || 0
+
+    const fetchMessages = () =>
+      prisma.chatMessage.findMany({
+        where: {
+          direction: 'out',
+          telegramMessageId: null,
+          channel,
+        },
+        orderBy: { createdAt: 'asc' },
+        take: Math.min(Math.max(limit, 1), 200),
+      })
 
-    const messages = await prisma.chatMessage.findMany({
-      where: {
-        direction: 'out',
-        telegramMessageId: null,
-        channel,
-      },
-      orderBy: { createdAt: 'asc' },
-      take: Math.min(Math.max(limit, 1), 200),
-    })
+    let messages = await fetchMessages()
+    const deadline = Date.now() + waitMs
+    while (messages.length === 0 && Date.now() < deadline && !request.signal.aborted) {
+      await waitForOutbox(channel, Math.min(deadline - Date.now(), RECHECK_MS), request.signal)
+      if (request.signal.aborted) break
+      messages = await fetchMessages()
+    }
 
     return NextResponse.json(
       createApiResponse({
@@ -30,7 +47,9 @@ export async function GET(request: NextRequest) {
           mediaUrl: m.mediaUrl,
           createdAt: m.createdAt,
         })),
-      })
+      }),
+      // Bridge по этому заголовку понимает, что сервер поддерживает long-poll
+      { headers: { 'X-Outbox-Long-Poll': '1' } }
     )
   } catch (error: any) {
     console.error('Outbox API error:', error)
@@ -42,5 +61,3 @@ export async function GET(request: NextRequest) {
 }
 
 export const dynamic = 'force-dynamic'
-
-
@@ -11,6 +11,40 @@ import {
 } from '@/lib/security'
 import { getAdminInternalUrl, getAdminPublicUrl } from '@/config/domains'
 import { AUTO_DEPOSIT_CONFIG, DEPOSIT_CONFIG } from '@/config/app'
+import fs from 'fs'
+import path from 'path'
+import { randomUUID } from 'crypto'
+import { Readable } from 'stream'
+import { pipeline } from 'stream/promises'
+
+// Максимальный размер фото, загружаемого через multipart/form-data
+const MAX_UPLOAD_PHOTO_SIZE = 20 * 1024 * 1024
+// Расширение сохраненного файла - по проверенному MIME типу, а не по имени от клиента
+// (те же расширения отдает /api/receipts/[fileId]); остальные image/* сохраняются как .jpg
+const PHOTO_EXTENSIONS: Record<string, string> = {
+  'image/jpeg': '.jpg',
+  'image/jpg': '.jpg',
+  'image/pjpeg': '.jpg',
+  'image/png': '.png',
+  'image/webp': '.webp',
+  'image/gif': '.gif',
+}
+
+/**
+ * Сохраняет фото из multipart-запроса в tmp/receipts (потоково, без base64)
+ * и возвращает URL для photoFileUrl (отдается через /api/receipts/[fileId])
+ */
+async function saveUploadedPhoto(file: File): Promise<string> {
+  const uploadDir = path.join(process.cwd(), 'tmp', 'receipts')
+  await fs.promises.mkdir(uploadDir, { recursive: true })
+  const ext = PHOTO_EXTENSIONS[file.type.toLowerCase()] || '.jpg'
+  const fileId = `${Date.now()}-${randomUUID()}${ext}`
+  await pipeline(
+    Readable.fromWeb(file.stream() as any),
+    fs.createWriteStream(path.join(uploadDir, fileId))
+  )
+  return `/api/receipts/${fileId}`
+}
 
 /**
  * Планирует отложенное уведомление о депозите через минуту
@@ -93,7 +127,32 @@ export async function POST(request: NextRequest) {
       return rateLimitResult
     }
 
-    const body = await request.json()
+    // Бот отправляет фото чека/QR файлом в multipart/form-data (без base64),
+    // мини-приложение - JSON с base64 строкой
+    let body: any
+    let uploadedPhotoUrl: string | null = null
+    const contentType = request.headers.get('content-type') || ''
+    if (contentType.includes('multipart/form-data')) {
+      const formData = await request.formData()
+      body = {}
+      for (const [key, value] of formData.entries()) {
+        if (typeof value === 'string') {
+          body[key] = value
+        }
+      }
+      const photo = (formData.get('receipt_photo') || formData.get('qr_photo')) as File | string | null
+      if (photo && typeof photo !== 'string') {
+        if (!photo.type.startsWith('image/') || photo.size > MAX_UPLOAD_PHOTO_SIZE) {
+          return NextResponse.json(
+            createApiResponse(null, 'Photo must be an image less than 20MB'),
+            { status: 400 }
+          )
+        }
+        uploadedPhotoUrl = await saveUploadedPhoto(photo)
+      }
+    } else {
+      body = await request.json()
+    }
 
     // 🛡️ Валидация и очистка входных данных
     const sanitizedBody = sanitizeInput(body)
@@ -642,8 +701,8 @@ export async function POST(request: NextRequest) {
     }
 
     // Нормализуем фото чека: убеждаемся что это валидный base64 с префиксом
-    let photoUrl = receipt_photo || qr_photo || null
-    if (photoUrl) {
+    let photoUrl = uploadedPhotoUrl || receipt_photo || qr_photo || null
+    if (photoUrl && !uploadedPhotoUrl) {
       // Функция для нормализации base64 строки
       const normalizeBase64 = (str: string): string | null => {
         // Удаляем все пробелы и переносы строк
@@ -721,6 +780,7 @@ export async function POST(request: NextRequest) {
       hasPhoto: !!photoUrl,
       photoLength: photoUrl?.length || 0,
       isBase64: photoUrl?.startsWith('data:image') || false,
+      isUploadedFile: !!uploadedPhotoUrl,
       requestType: type,
       photoPreview: photoUrl ? photoUrl.substring(0, 50) + '...' : null
     })
@@ -741,7 +801,7 @@ export async function POST(request: NextRequest) {
         phone,
         status: 'pending',
         statusDetail: statusDetail, // Для error_log содержит JSON с информацией об ошибке
-        photoFileUrl: photoUrl, // Сохраняем base64 фото чека (для deposit) или QR-кода (для withdraw)
+        photoFileUrl: photoUrl, // base64 или URL загруженного файла: фото чека (для deposit) или QR-кода (для withdraw)
         paymentMethod: 'bank',
         withdrawalCode: site_code || null, // Код ордера на вывод (для 1xbet)
         source: source, // 'bot' или 'mini_app'
@@ -1,4 +1,5 @@
 import { NextRequest, NextResponse } from 'next/server'
+import { createHash } from 'crypto'
 import { prisma } from '@/lib/prisma'
 import { createApiResponse } from '@/lib/api-helpers'
 import { 
@@ -150,7 +151,17 @@ export async function GET(request: NextRequest) {
       require_receipt_photo: settingsMap.require_receipt_photo === 'true' || settingsMap.require_receipt_photo === true,
     }
 
+    // ETag позволяет ботам делать условные запросы (If-None-Match -> 304 без тела)
+    const etag = `"${createHash('sha1').update(JSON.stringify(response)).digest('hex')}"`
+    if (request.headers.get('if-none-match') === etag) {
+      const notModified = new NextResponse(null, { status: 304 })
+      notModified.headers.set('ETag', etag)
+      notModified.headers.set('Access-Control-Allow-Origin', '*')
+      return notModified
+    }
+
     const res = NextResponse.json(response)
+    res.headers.set('ETag', etag)
     res.headers.set('Access-Control-Allow-Origin', '*')
     return res
   } catch (error: any) {
@@ -0,0 +1,66 @@
+import { NextRequest } from 'next/server'
+import { protectAPI } from '@/lib/security'
+import { onSettingsChanged } from '@/lib/settings-events'
+
+// Комментарий-пинг, чтобы nginx (proxy_read_timeout 60s) не закрыл тихое соединение
+const HEARTBEAT_MS = 25_000
+
+// SSE для ботов (SETTINGS_EVENTS_URL): событие "data:" после каждого сохранения
+// настроек, бот сразу перезагружает /api/public/payment-settings.
+// В событии нет самих настроек - только сигнал, поэтому endpoint публичный, как payment-settings
+export async function GET(request: NextRequest) {
+  const protectionResult = protectAPI(request)
+  if (protectionResult) return protectionResult
+
+  const encoder = new TextEncoder()
+  let cleanup = () => {}
+
+  const stream = new ReadableStream({
+    start(controller) {
+      const send = (chunk: string) => {
+        try {
+          controller.enqueue(encoder.encode(chunk))
+        } catch {
+          cleanup()
+        }
+      }
+
+      const unsubscribe = onSettingsChanged(() => {
+        send(`event: settings\ndata: ${JSON.stringify({ changedAt: new Date().toISOString() })}\n\n`)
+      })
+      const heartbeat = setInterval(() => send(': ping\n\n'), HEARTBEAT_MS)
+
+      cleanup = () => {
+        clearInterval(heartbeat)
+        unsubscribe()
+        request.signal.removeEventListener('abort', onAbort)
+        try {
+          controller.close()
+        } catch {
+          // Поток уже закрыт
+        }
+        cleanup = () => {}
+      }
+      const onAbort = () => cleanup()
+      request.signal.addEventListener('abort', onAbort)
+
+      // Первый комментарий сразу: клиент видит 200 и считает подписку установленной
+      send(': connected\n\n')
+    },
+    cancel() {
+      cleanup()
+    },
+  })
+
+  return new Response(stream, {
+    headers: {
+      'Content-Type': 'text/event-stream; charset=utf-8',
+      'Cache-Control': 'no-cache, no-transform',
+      Connection: 'keep-alive',
+      // Без буферизации в nginx события доходят сразу
+      'X-Accel-Buffering': 'no',
+    },
+  })
+}
+
+export const dynamic = 'force-dynamic'
@@ -1,6 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server'
 import { prisma } from '@/lib/prisma'
 import { requireAuth, createApiResponse } from '@/lib/api-helpers'
+import { notifySettingsChanged } from '@/lib/settings-events'
 
 export async function GET(request: NextRequest) {
   try {
@@ -167,6 +168,9 @@ export async function POST(request: NextRequest) {
       await updateSetting('bookmaker_settings', body.bookmaker_settings, 'Настройки депозитов и выводов по букмекерам')
     }
 
+    // Боты, подписанные на SETTINGS_EVENTS_URL, сразу перезагрузят настройки
+    notifySettingsChanged()
+
     return NextResponse.json(
       createApiResponse(null, undefined)
     )
@@ -2,6 +2,7 @@ import { NextRequest, NextResponse } from 'next/server'
 import { requireAuth, createApiResponse } from '@/lib/api-helpers'
 import { prisma } from '@/lib/prisma'
 import { emitToUser } from '@/lib/socket-server'
+import { notifyOutbox } from '@/lib/outbox-events'
 import fs from 'fs'
 import path from 'path'
 import { randomUUID } from 'crypto'
@@ -278,6 +279,11 @@ export async function POST(
       console.warn('⚠️ Failed to emit Socket.IO event:', socketError)
     }
 
+    // Сообщение ушло в outbox (bridge mode) - будим bridge, ожидающий в long-poll
+    if (saved.telegramMessageId === null) {
+      notifyOutbox(channel)
+    }
+
     return NextResponse.json(
       createApiResponse({
         success: true,
@@ -0,0 +1,44 @@
+import { EventEmitter } from 'events'
+
+// Уведомления о новых сообщениях в outbox (для long-poll /api/chat/outbox?wait=...)
+// Эмиттер хранится в global: у каждого route свой бандл, а процесс админки один
+function getEmitter(): EventEmitter {
+  const g = global as any
+  if (!g.outboxEvents) {
+    g.outboxEvents = new EventEmitter()
+    // Каждый ожидающий bridge - отдельный слушатель
+    g.outboxEvents.setMaxListeners(0)
+  }
+  return g.outboxEvents as EventEmitter
+}
+
+// Сообщить ожидающим bridge, что в канале появилось исходящее сообщение
+export function notifyOutbox(channel: string) {
+  getEmitter().emit(`outbox:${channel}`)
+}
+
+// Ждет нового сообщения в канале. true - пришло уведомление, false - таймаут или клиент отключился
+export function waitForOutbox(channel: string, timeoutMs: number, signal?: AbortSignal): Promise<boolean> {
+  return new Promise((resolve) => {
+    const emitter = getEmitter()
+    const event = `outbox:${channel}`
+    let timer: ReturnType<typeof setTimeout>
+
+    const finish = (notified: boolean) => {
+      clearTimeout(timer)
+      emitter.off(event, onNotify)
+      signal?.removeEventListener('abort', onAbort)
+      resolve(notified)
+    }
+    const onNotify = () => finish(true)
+    const onAbort = () => finish(false)
+
+    if (signal?.aborted) {
+      resolve(false)
+      return
+    }
+    timer = setTimeout(() => finish(false), timeoutMs)
+    emitter.on(event, onNotify)
+    signal?.addEventListener('abort', onAbort)
+  })
+}
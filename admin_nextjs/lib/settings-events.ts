@@ -0,0 +1,27 @@
+import { EventEmitter } from 'events'
+
+// Уведомления об изменении настроек бота (SSE /api/public/settings-events)
+// Эмиттер хранится в global: у каждого route свой бандл, а процесс админки один
+function getEmitter(): EventEmitter {
+  const g = global as any
+  if (!g.settingsEvents) {
+    g.settingsEvents = new EventEmitter()
+    // Каждый подключенный бот - отдельный слушатель
+    g.settingsEvents.setMaxListeners(0)
+  }
+  return g.settingsEvents as EventEmitter
+}
+
+// Сообщить подписанным ботам, что настройки изменились
+export function notifySettingsChanged() {
+  getEmitter().emit('settings')
+}
+
+// Подписка на изменения настроек, возвращает функцию отписки
+export function onSettingsChanged(listener: () => void): () => void {
+  const emitter = getEmitter()
+  emitter.on('settings', listener)
+  return () => {
+    emitter.off('settings', listener)
+  }
+}
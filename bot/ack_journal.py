@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Журнал подтверждений outbox для bridge.py (SQLite, WAL)
+
+- сообщение записывается в журнал сразу после отправки, до ack в админку:
+  если bridge упадет или ack не дойдет, после перезапуска ack повторяется,
+  а само сообщение повторно не отправляется;
+- подтвержденные записи хранятся еще ACKED_TTL секунд: outbox, прочитанный
+  до того, как ack дошел, может вернуть их снова - повторы отсекаются по id;
+- чтение из памяти, запись - сразу в БД (это и есть гарантия после падения).
+"""
+
+import json
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Union
+
+logger = logging.getLogger(__name__)
+
+# Сколько хранить подтвержденные записи для отсечения повторов (секунд)
+ACKED_TTL = 3600
+# Как часто удалять старые подтвержденные записи (секунд)
+SWEEP_INTERVAL = 300
+
+
+class AckJournal:
+    """outbox id -> {entry (тело ack), acked_at}"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = str(db_path)
+        self._pending: Dict[str, dict] = {}
+        self._acked: Dict[str, float] = {}
+        self._last_sweep = time.time()
+
+        self._conn = sqlite3.connect(self.db_path, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox_acks ("
+            " id TEXT PRIMARY KEY,"
+            " entry TEXT NOT NULL,"
+            " sent_at REAL NOT NULL,"
+            " acked_at REAL)"
+        )
+        self._conn.commit()
+        self._sweep()
+        for key, entry, acked_at in self._conn.execute("SELECT id, entry, acked_at FROM outbox_acks ORDER BY sent_at"):
+            if acked_at is None:
+                try:
+                    self._pending[key] = json.loads(entry)
+                except Exception:
+                    continue
+            else:
+                self._acked[key] = acked_at
+        logger.info(f"📋 Журнал outbox: {len(self._pending)} без ack, {len(self._acked)} подтвержденных")
+
+    def record(self, entry: dict) -> None:
+        """Сообщение отправлено - запоминаем до ack"""
+        key = str(entry["id"])
+        self._pending[key] = entry
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO outbox_acks(id, entry, sent_at, acked_at) VALUES (?, ?, ?, NULL)",
+                    (key, json.dumps(entry, ensure_ascii=True), time.time())
+                )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось записать в журнал outbox: {e}")
+
+    def confirm(self, outbox_ids: Iterable) -> None:
+        """Админка приняла ack"""
+        now_ts = time.time()
+        keys = [str(outbox_id) for outbox_id in outbox_ids]
+        for key in keys:
+            self._pending.pop(key, None)
+            self._acked[key] = now_ts
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE outbox_acks SET acked_at = ? WHERE id = ?",
+                    [(now_ts, key) for key in keys]
+                )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось обновить журнал outbox: {e}")
+        if now_ts - self._last_sweep >= SWEEP_INTERVAL:
+            self._sweep()
+
+    def seen(self, outbox_id) -> bool:
+        """Сообщение уже отправлялось (ack ждет или недавно подтвержден)"""
+        key = str(outbox_id)
+        return key in self._pending or key in self._acked
+
+    def pending(self, limit: int) -> List[dict]:
+        """Записи без ack в порядке отправки"""
+        result = []
+        for entry in self._pending.values():
+            if len(result) >= limit:
+                break
+            result.append(entry)
+        return result
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _sweep(self) -> None:
+        self._last_sweep = time.time()
+        cutoff = self._last_sweep - ACKED_TTL
+        for key in [k for k, acked_at in self._acked.items() if acked_at <= cutoff]:
+            self._acked.pop(key, None)
+        try:
+            with self._conn:
+                self._conn.execute("DELETE FROM outbox_acks WHERE acked_at IS NOT NULL AND acked_at <= ?", (cutoff,))
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось очистить журнал outbox: {e}")
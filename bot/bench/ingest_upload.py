@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пересылки входящих медиа в админку (bridge.py, ingest-upload)
+
+100 одновременных файлов по 5 МБ проходят через handle_incoming двумя путями:
+- stream: app.stream_media(msg) сразу в тело запроса (INGEST_STREAM_MAX_BYTES);
+- temp file: скачивание во временный файл и отправка с диска (порог 0).
+Telegram заменен объектом с stream_media (чанки по 1 МБ с задержкой сети),
+админка - локальным aiohttp-сервером, который разбирает multipart и сверяет
+sha256. Сколько байт записал процесс (диск + сокет), берется из /proc/self/io.
+Клиент и сервер делят один процесс, цифры шумные - запускается несколько раундов.
+
+    python bench/ingest_upload.py [--files 100] [--size-mb 5] [--rounds 2]
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+PORT = 9923
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "bench")
+os.environ.setdefault("SESSION_STRING", "bench")
+os.environ["API_BASE"] = f"http://127.0.0.1:{PORT}"
+
+import httpx
+from aiohttp import web
+
+import bridge
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class FakeMedia:
+    """Как pyrogram Photo: размер известен, имени и mime нет"""
+
+    def __init__(self, size: int):
+        self.file_size = size
+        self.mime_type = None
+        self.file_name = None
+
+
+class FakeApp:
+    """Вместо pyrogram Client: stream_media отдает payload чанками"""
+
+    def __init__(self, payload: bytes, latency: float):
+        self.payload = payload
+        self.latency = latency
+
+    async def stream_media(self, message):
+        for start in range(0, len(self.payload), CHUNK_SIZE):
+            await asyncio.sleep(self.latency)
+            yield self.payload[start:start + CHUNK_SIZE]
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, app: FakeApp, size: int):
+        self.id = message_id
+        self.from_user = SimpleNamespace(id=1000 + message_id)
+        self.text = None
+        self.caption = 'подпись "с кавычками"'
+        self.photo = FakeMedia(size)
+        self.video = self.voice = self.audio = self.document = None
+        self._app = app
+
+    async def download(self, file_name: str) -> str:
+        # Как pyrogram: файл пишется на диск из stream_media
+        with open(file_name, "wb") as f:
+            async for chunk in self._app.stream_media(self):
+                f.write(chunk)
+        return file_name
+
+
+def bytes_written() -> int:
+    """wchar из /proc/self/io: все записи процесса (файлы и сокеты); 0 вне Linux"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+async def run_round(label: str, threshold: int, args, app: FakeApp, received: list) -> None:
+    received.clear()
+    bridge.INGEST_STREAM_MAX_BYTES = threshold
+    size = len(app.payload)
+    written_before = bytes_written()
+    started = time.perf_counter()
+    await asyncio.gather(*(bridge.handle_incoming(None, FakeMessage(i, app, size)) for i in range(args.files)))
+    elapsed = time.perf_counter() - started
+    written = bytes_written() - written_before
+    ok = sum(1 for matched, *_ in received if matched)
+    print(
+        f"{label}: {elapsed:6.2f} с, {args.files * size / elapsed / 1e6:5.0f} МБ/с, "
+        f"sha256 совпал {ok}/{args.files}, записано процессом {written / 1e6:5.0f} МБ"
+    )
+    if received:
+        print(f"    пример: {received[0][1:]}")
+
+
+async def main_async(args) -> None:
+    size = int(args.size_mb * 1024 * 1024)
+    payload = random.Random(args.seed).randbytes(size)
+    digest = hashlib.sha256(payload).hexdigest()
+    received = []
+
+    async def ingest_upload(request: web.Request) -> web.Response:
+        form = await request.post()
+        upload = form["file"]
+        matched = hashlib.sha256(upload.file.read()).hexdigest() == digest
+        received.append((matched, upload.filename, upload.content_type, form["message"], form["telegram_message_id"]))
+        return web.json_response({"success": True})
+
+    server = web.Application(client_max_size=size * 2 + 1024 * 1024)
+    server.router.add_post("/api/users/{uid}/chat/ingest-upload", ingest_upload)
+    runner = web.AppRunner(server)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    bridge.http = httpx.AsyncClient(timeout=60.0, limits=httpx.Limits(max_connections=args.files))
+    app = FakeApp(payload, args.latency)
+    bridge.app = app
+    stream_threshold = size + 1
+    try:
+        for round_no in range(args.rounds):
+            # Чередуем порядок, чтобы прогрев не доставался одному варианту
+            variants = [("stream   ", stream_threshold), ("temp file", 0)]
+            if round_no % 2:
+                variants.reverse()
+            for label, threshold in variants:
+                await run_round(label, threshold, args, app, received)
+    finally:
+        await bridge.http.aclose()
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100, help="одновременных файлов")
+    parser.add_argument("--size-mb", type=float, default=5, help="размер файла, МБ")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка на чанк (сеть MTProto), сек")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Фаззинг и бенчмарк validate_input (security.py в bot/ и bot_new/)
+
+Эталон - прежний набор регулярных выражений (до перехода на проверку без
+возвратов), он встроен ниже. Случайные тексты из "опасных" фрагментов
+сравниваются с эталоном, затем замеряются худшие случаи длиной ~4 КБ.
+Эталон на quotes_or работает десятки секунд, поэтому его замер включается
+отдельно (--slow).
+
+    python bench/validate_input_fuzz.py [--cases 300000] [--slow]
+"""
+
+import re
+import sys
+import time
+import random
+import argparse
+import importlib.util
+from pathlib import Path
+from typing import Optional
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# Прежние правила validate_input (эталон поведения)
+REFERENCE_SQL_PATTERNS = [
+    r'\b(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION|SCRIPT)\s+.*(FROM|INTO|TABLE|DATABASE|WHERE)',
+    r'(--|#)\s*(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION)',
+    r'/\*.*(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION).*\*/',
+    r'\bOR\b.*=.*=',
+    r'\bAND\b.*=.*=',
+    r"('|`|\").*(\bOR\b|\bAND\b).*('|`|\")",
+    r';.*(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION)',
+]
+REFERENCE_XSS_PATTERNS = [
+    r'<script',
+    r'javascript:',
+    r'onerror=',
+    r'onload=',
+    r'<iframe',
+]
+
+TOKENS = [
+    'select ', 'SELECT', 'from', 'FROM', ' or ', 'OR', 'and', ' AND ', '=', '==', "'", '"', '`',
+    ';', '--', '#', '/*', '*/', '\n', '  ', ' ', 'x', 'exec', 'EXECUTE ', 'union', '<script',
+    'javascript:', 'onload=', '<iframe', 'where', 'table', 'Привет', 'ORDER', 'for', 'é', '\t',
+    'drop', 'into',
+]
+
+WORST_CASES = {
+    'normal': ('Здравствуйте, пополнил счет на 500 сом, проверьте пожалуйста. ' * 70)[:4000],
+    'quotes_or': ("'" * 1000 + ' or ' * 700)[:4000],
+    'or_eq': (' or ' * 999 + '=')[:4000],
+    'select': ('select ' * 570)[:4000],
+    'semicolons': ';' * 4000,
+}
+# Эталону на этих случаях нужны секунды
+SLOW_CASES = {'quotes_or'}
+
+
+def reference_validate(text: Optional[str], max_length: int = 4096):
+    if text is None:
+        return True, None
+    if len(text) > max_length:
+        return False, f"Text too long. Maximum length is {max_length} characters."
+    for pattern in REFERENCE_SQL_PATTERNS + REFERENCE_XSS_PATTERNS:
+        if re.search(pattern, text, re.IGNORECASE):
+            return False, "Invalid input detected."
+    return True, None
+
+
+def load_security(bot_dir: str):
+    spec = importlib.util.spec_from_file_location(f"security_{bot_dir}", ROOT / bot_dir / "security.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fuzz(validate, cases: int, seed: int) -> int:
+    rng = random.Random(seed)
+    mismatches = 0
+    for _ in range(cases):
+        text = ''.join(rng.choice(TOKENS) for _ in range(rng.randint(0, 12)))
+        expected = reference_validate(text)
+        actual = validate(text)
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"❌ {text!r}: эталон {expected}, сейчас {actual}")
+    return mismatches
+
+
+def timed(fn, text: str, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=300000, help="случайных текстов на каждую копию")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--slow", action="store_true", help="замерить эталон и на самых медленных случаях")
+    args = parser.parse_args()
+
+    total_mismatches = 0
+    for bot_dir in ("bot", "bot_new"):
+        validate = load_security(bot_dir).validate_input
+        mismatches = fuzz(validate, args.cases, args.seed)
+        total_mismatches += mismatches
+        print(f"{bot_dir}/security.py: {args.cases} случаев, расхождений с эталоном: {mismatches}")
+
+        for name, text in WORST_CASES.items():
+            new_ms = timed(validate, text, 200)
+            if name in SLOW_CASES and not args.slow:
+                print(f"  {name:12s} эталон   (--slow)   сейчас {new_ms:7.3f} мс")
+                continue
+            if validate(text) != reference_validate(text):
+                total_mismatches += 1
+                print(f"  ❌ {name}: результат отличается от эталона")
+            old_ms = timed(reference_validate, text, 1 if name in SLOW_CASES else 3)
+            print(f"  {name:12s} эталон {old_ms:9.2f} мс  сейчас {new_ms:7.3f} мс")
+    sys.exit(1 if total_mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
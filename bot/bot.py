@@ -7,7 +7,6 @@
 import logging
 import re
 import httpx
-import base64
 import random
 import os
 import json
@@ -25,6 +24,13 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppI
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from telegram.constants import ParseMode
 from security import validate_input, sanitize_input
+from http_client import api_client, init_api_client, close_api_client, get_api_client
+from chat_ingest import ChatIngestQueue
+from scheduler import DeadlineScheduler
+from rate_governor import GovernorRateLimiter, rate_governor
+from pending_store import PendingDepositStore
+from receipt_upload import post_with_telegram_file
+from cpu_executor import CPUExecutor
 import asyncio
 
 # Настройка логирования
@@ -67,89 +73,83 @@ WEBSITE_URL = os.getenv("MINI_APP_URL", "https://lux-on.org")
 API_URL = os.getenv("ADMIN_PUBLIC_URL", os.getenv("NEXT_PUBLIC_API_URL", "https://pipiska.net"))
 SUPPORT_BOT_URL = os.getenv("SUPPORT_BOT_URL", "https://t.me/operator_luxon_bot")
 
+# Фоновое обновление настроек из админки
+SETTINGS_REFRESH_SECONDS = float(os.getenv("SETTINGS_REFRESH_SECONDS", "30"))
+# Если настройки старше этого (например, фоновая задача упала) - обработчик запустит обновление сам
+SETTINGS_MAX_AGE_SECONDS = float(os.getenv("SETTINGS_MAX_AGE_SECONDS", "300"))
+# Необязательный SSE-канал админки: любое событие сразу сбрасывает кеш настроек
+# (админка: https://<домен админки>/api/public/settings-events, событие после каждого сохранения настроек)
+SETTINGS_EVENTS_URL = os.getenv("SETTINGS_EVENTS_URL", "")
+
+# Webhook вместо long polling: включается, если задан LEGACY_WEBHOOK_URL (публичный https-адрес за nginx).
+# Переменные с префиксом: bot_new читает тот же .env, но свои BOT_NEW_WEBHOOK_*
+WEBHOOK_URL = os.getenv("LEGACY_WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("LEGACY_WEBHOOK_PATH", "/telegram/bot/webhook")
+# Секрет, который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -)
+WEBHOOK_SECRET = os.getenv("LEGACY_WEBHOOK_SECRET", "")
+# Локальный адрес webhook-сервера (на него проксирует nginx)
+WEBHOOK_HOST = os.getenv("LEGACY_WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("LEGACY_WEBHOOK_PORT", "8082"))
+# Сколько одновременных HTTPS-соединений Telegram открывает к webhook (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("LEGACY_WEBHOOK_MAX_CONNECTIONS", "40"))
+# Обработчики бота используют только сообщения и нажатия inline-кнопок -
+# остальные типы обновлений Telegram не присылает вовсе
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# Шардирование по процессам (см. shard_router.py): воркер получает обновления от роутера
+SHARD_ROUTER_ADDR = os.getenv("SHARD_ROUTER_ADDR", "")
+# Постоянное имя воркера (A-Z, a-z, 0-9, _ и -): от него зависит, какие пользователи ему достаются
+SHARD_WORKER_ID = os.getenv("SHARD_WORKER_ID", "")
+# У каждого воркера свои файлы состояния
+_SHARD_SUFFIX = f".{SHARD_WORKER_ID}" if SHARD_ROUTER_ADDR and SHARD_WORKER_ID else ""
+
 # Словарь для хранения состояний пользователей
 user_states = {}
 
-# Словарь для хранения активных таймеров (user_id -> task)
+# Единый планировщик таймеров депозита (одна задача на все дедлайны)
+timer_scheduler = DeadlineScheduler("deposit_timers")
+# Пул для CPU-задач (рисование QR-кодов): event loop не блокируется
+cpu_executor = CPUExecutor("cpu")
+# Интервал обновления сообщения с таймером (на последней минуте - каждую секунду)
+TIMER_UPDATE_INTERVAL = int(os.getenv("TIMER_UPDATE_INTERVAL", "5"))
+
+# Словарь для хранения активных таймеров (user_id -> хендл в планировщике)
 active_timers = {}
 
-# Путь к файлу для сохранения ожидания фото чека (переживает рестарт бота)
+# Старый JSON-файл ожиданий фото чека (переносится в SQLite при первом запуске)
 PENDING_DEPOSIT_STATE_FILE = os.path.join(
     os.path.dirname(os.path.abspath(__file__)),
     'pending_deposit_states.json'
 )
+PENDING_DEPOSIT_DB_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    f'pending_deposit_states{_SHARD_SUFFIX}.db'
+)
 
-# Кеш ожиданий фото чека (user_id -> {data, expires_at})
-pending_deposit_states = {}
-
-def _write_pending_deposit_states(states: dict) -> None:
-    """Сохраняет ожидания фото чека в файл (атомарно)."""
-    try:
-        tmp_path = f"{PENDING_DEPOSIT_STATE_FILE}.tmp"
-        with open(tmp_path, 'w', encoding='utf-8') as f:
-            json.dump(states, f, ensure_ascii=True)
-        os.replace(tmp_path, PENDING_DEPOSIT_STATE_FILE)
-    except Exception as e:
-        logger.warning(f"⚠️ Не удалось сохранить pending_deposit_states: {e}")
-
-def _load_pending_deposit_states() -> dict:
-    """Загружает ожидания фото чека из файла и очищает истекшие."""
-    if not os.path.exists(PENDING_DEPOSIT_STATE_FILE):
-        return {}
-    try:
-        with open(PENDING_DEPOSIT_STATE_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        if not isinstance(data, dict):
-            return {}
-    except Exception as e:
-        logger.warning(f"⚠️ Не удалось загрузить pending_deposit_states: {e}")
-        return {}
-    
-    now_ts = time.time()
-    cleaned = {}
-    for key, value in data.items():
-        if not isinstance(value, dict):
-            continue
-        expires_at = value.get('expires_at')
-        if isinstance(expires_at, (int, float)) and expires_at > now_ts:
-            cleaned[key] = value
-    
-    if cleaned != data:
-        _write_pending_deposit_states(cleaned)
-    return cleaned
+# Ожидания фото чека (переживают рестарт бота): SQLite (WAL) + кеш в памяти, запись в фоновом потоке
+pending_deposit_store = PendingDepositStore(
+    PENDING_DEPOSIT_DB_FILE,
+    legacy_json_path=None if _SHARD_SUFFIX else PENDING_DEPOSIT_STATE_FILE
+)
 
 def set_pending_deposit_state(user_id: int, data: dict, expires_at: float) -> None:
-    """Сохраняет ожидание фото чека для пользователя."""
-    if not data:
-        return
-    pending_deposit_states[str(user_id)] = {
-        'data': data,
-        'expires_at': expires_at
-    }
-    _write_pending_deposit_states(pending_deposit_states)
+    """Сохраняет ожидание фото чека для пользователя (expires_at - unix time)."""
+    pending_deposit_store.set(user_id, data, expires_at)
 
 def get_pending_deposit_state(user_id: int) -> dict | None:
     """Возвращает сохраненные данные ожидания фото чека, если они актуальны."""
-    key = str(user_id)
-    state = pending_deposit_states.get(key)
-    if not state:
-        return None
-    expires_at = state.get('expires_at')
-    if not isinstance(expires_at, (int, float)) or expires_at <= time.time():
-        pending_deposit_states.pop(key, None)
-        _write_pending_deposit_states(pending_deposit_states)
-        return None
-    return state.get('data')
+    return pending_deposit_store.get(user_id)
 
 def clear_pending_deposit_state(user_id: int) -> None:
     """Очищает ожидание фото чека для пользователя."""
-    key = str(user_id)
-    if key in pending_deposit_states:
-        pending_deposit_states.pop(key, None)
-        _write_pending_deposit_states(pending_deposit_states)
+    pending_deposit_store.clear(user_id)
 
-# Загружаем ожидания фото чека при старте
-pending_deposit_states = _load_pending_deposit_states()
+# Очередь сохранения сообщений пользователей в чат админки (запускается в post_init)
+chat_ingest_queue = ChatIngestQueue(
+    API_URL,
+    Path(__file__).resolve().parent / f'chat_ingest_spill{_SHARD_SUFFIX}.jsonl',
+    client_factory=get_api_client
+)
 
 # Кеш настроек (обновляется при старте и периодически)
 settings_cache = {
@@ -413,11 +413,57 @@ def get_text(key: str, lang: str = 'ru', **kwargs) -> str:
         logger.warning(f"⚠️ Отсутствует переменная {e} в тексте '{key}'")
         return text
 
-async def load_settings():
-    """Загружает настройки из API"""
+# ETag последнего успешного ответа настроек (для If-None-Match)
+_settings_etag = None
+# Текущий запрос настроек (single-flight) и фоновые задачи обновления
+_settings_inflight = None
+# Безусловный запрос по событию изменения уже запланирован, но еще не отправлен
+_settings_forced_queued = False
+_settings_refresher_task = None
+_settings_events_task = None
+
+async def load_settings(force: bool = False):
+    """
+    Загружает настройки из API.
+    Если запрос уже выполняется - ждет его, а не запускает второй параллельно.
+    force=True (событие изменения настроек) отправляет безусловный запрос (без If-None-Match).
+    Уже идущий запрос мог уйти до изменения и вернуть 304 или старые данные, поэтому
+    безусловный запрос выполняется после него; события, пришедшие до его отправки, ждут его же.
+    """
+    global _settings_inflight, _settings_forced_queued
+    if force:
+        if not _settings_forced_queued:
+            _settings_forced_queued = True
+            _settings_inflight = asyncio.create_task(_fetch_settings_after(_settings_inflight))
+    elif _settings_inflight is None or _settings_inflight.done():
+        _settings_inflight = asyncio.create_task(_fetch_settings())
+    # shield: отмена одного ожидающего не отменяет общий запрос для остальных
+    await asyncio.shield(_settings_inflight)
+
+async def _fetch_settings_after(previous):
+    """Безусловный запрос настроек после завершения предыдущего запроса"""
+    global _settings_forced_queued
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{API_URL}/api/public/payment-settings")
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+    finally:
+        _settings_forced_queued = False
+    await _fetch_settings(force=True)
+
+async def _fetch_settings(force: bool = False):
+    """Выполняет запрос настроек и обновляет кеш"""
+    global _settings_etag
+    try:
+        headers = {}
+        if _settings_etag and not force and settings_cache.get('last_update', 0):
+            headers['If-None-Match'] = _settings_etag
+        async with api_client(timeout=5.0) as client:
+            response = await client.get(f"{API_URL}/api/public/payment-settings", headers=headers)
+            if response.status_code == 304:
+                # Настройки не менялись
+                settings_cache['last_update'] = asyncio.get_event_loop().time()
+                logger.debug("✅ Настройки не изменились (304)")
+                return
             if response.status_code == 200:
                 result = response.json()
                 if result.get('success'):
@@ -450,8 +496,13 @@ async def load_settings():
                 settings_cache['pause'] = data.get('pause', False)
                 settings_cache['maintenance_message'] = data.get('maintenance_message', 'Технические работы. Попробуйте позже.')
                 settings_cache['last_update'] = asyncio.get_event_loop().time()
+                _settings_etag = response.headers.get('ETag')
                 logger.info(f"✅ Настройки загружены: букмекеры={len(settings_cache['casinos'])}, депозиты={settings_cache['deposits_enabled']} (банки: {len(settings_cache['deposit_banks'])}), выводы={settings_cache['withdrawals_enabled']} (банки: {len(settings_cache['withdrawal_banks'])}), букмекеры={len(bookmaker_settings)}, пауза={settings_cache['pause']}")
     except Exception as e:
+        if settings_cache.get('last_update', 0):
+            # Уже есть актуальные настройки - не затираем их значениями по умолчанию
+            logger.warning(f"⚠️ Не удалось обновить настройки: {e}, оставляем предыдущие")
+            return
         logger.warning(f"⚠️ Не удалось загрузить настройки: {e}, используем значения по умолчанию")
         # Значения по умолчанию
         settings_cache['casinos'] = {'1xbet': True, '1win': True, 'melbet': True, 'mostbet': True, 'winwin': True, '888starz': True}
@@ -469,6 +520,78 @@ async def load_settings():
         settings_cache['pause'] = False
         settings_cache['maintenance_message'] = 'Технические работы. Попробуйте позже.'
 
+async def ensure_settings_fresh():
+    """
+    Вызывается из обработчиков вместо проверки возраста кеша.
+    Ждет загрузку только если настройки еще ни разу не загружались;
+    устаревший кеш обновляется в фоне, не задерживая ответ пользователю.
+    """
+    last_update = settings_cache.get('last_update', 0)
+    if not last_update:
+        await load_settings()
+        return
+    if asyncio.get_event_loop().time() - last_update > SETTINGS_MAX_AGE_SECONDS:
+        if _settings_inflight is None or _settings_inflight.done():
+            asyncio.create_task(load_settings())
+
+async def _settings_refresher():
+    """Периодически обновляет настройки (условными запросами)"""
+    while True:
+        await asyncio.sleep(SETTINGS_REFRESH_SECONDS)
+        try:
+            await load_settings()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка фонового обновления настроек: {e}")
+
+async def _settings_events_listener():
+    """Слушает SSE-канал админки и перезагружает настройки на каждое событие"""
+    backoff = 1
+    while True:
+        try:
+            async with get_api_client().stream(
+                'GET',
+                SETTINGS_EVENTS_URL,
+                headers={'Accept': 'text/event-stream'},
+                timeout=httpx.Timeout(10.0, read=None)
+            ) as response:
+                if response.status_code != 200:
+                    raise RuntimeError(f"HTTP {response.status_code}")
+                logger.info("✅ Подписка на изменения настроек установлена")
+                backoff = 1
+                async for line in response.aiter_lines():
+                    if line.startswith('data:'):
+                        logger.info("🔄 Получено событие изменения настроек, обновляю кеш")
+                        await load_settings(force=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Канал изменений настроек недоступен: {e}, переподключение через {backoff} сек")
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+def start_settings_refresher():
+    """Запускает фоновое обновление настроек (и SSE-подписку, если задан SETTINGS_EVENTS_URL)"""
+    global _settings_refresher_task, _settings_events_task
+    if _settings_refresher_task is None or _settings_refresher_task.done():
+        _settings_refresher_task = asyncio.create_task(_settings_refresher())
+    if SETTINGS_EVENTS_URL and (_settings_events_task is None or _settings_events_task.done()):
+        _settings_events_task = asyncio.create_task(_settings_events_listener())
+
+async def stop_settings_refresher():
+    """Останавливает фоновые задачи обновления настроек"""
+    global _settings_refresher_task, _settings_events_task
+    for task in (_settings_refresher_task, _settings_events_task):
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    _settings_refresher_task = None
+    _settings_events_task = None
+
 async def check_channel_subscription(user_id: int, channel_id: str) -> bool:
     """Проверяет подписку пользователя на канал"""
     try:
@@ -546,8 +669,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info(f"📥 Получена команда /start от пользователя {user_id} (@{user.username})")
     
     # Загружаем настройки если они устарели
-    if asyncio.get_event_loop().time() - settings_cache.get('last_update', 0) > 300:
-        await load_settings()
+    await ensure_settings_fresh()
     
     # Проверяем паузу
     if settings_cache.get('pause', False):
@@ -562,7 +684,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Проверяем настройки канала
     logger.info(f"🔍 Проверяю настройки канала для пользователя {user_id}")
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with api_client(timeout=10.0) as client:
             logger.info(f"📡 Запрос к API: {API_URL}/api/channel/settings")
             response = await client.get(
                 f"{API_URL}/api/channel/settings",
@@ -662,7 +784,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                         
                         for attempt in range(max_retries):
                             try:
-                                async with httpx.AsyncClient(timeout=timeout) as client:
+                                async with api_client(timeout=timeout) as client:
                                     response = await client.post(
                                         f"{API_URL}/api/referral/register",
                                         json={
@@ -750,6 +872,305 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             logger.error(f"❌ Ошибка при отправке ответа пользователю {user_id}: {e}")
             raise
 
+def render_deposit_qr_png(qr_url: str) -> bytes:
+    """Рисует QR-код депозита с надписями (CPU-задача, выполняется в cpu_executor)"""
+    # Генерируем QR-код с текстом (увеличенный box_size для больших модулей)
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=28,  # Оптимальный размер модулей QR-кода
+        border=4,
+    )
+    qr.add_data(qr_url)
+    qr.make(fit=True)
+
+    # Создаем изображение QR-кода
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+
+    # Создаем новое изображение с белым фоном
+    img_width = 900  # Оптимальная ширина для QR-кода
+    img_height = 1200  # Временная высота, будет обрезана после красной линии
+    img = Image.new('RGBA', (img_width, img_height), (255, 255, 255, 255))  # RGBA для поддержки прозрачности водяных знаков
+
+    # Водяной знак удален по запросу пользователя
+
+    # Вставляем QR-код в центр (с отступом сверху, увеличенный размер)
+    qr_size = 780  # Увеличенный размер QR-кода как на втором фото
+    qr_img_resized = qr_img.resize((qr_size, qr_size))
+    qr_x = (img_width - qr_size) // 2
+    qr_y = 50
+    img.paste(qr_img_resized, (qr_x, qr_y))
+
+    # Добавляем текст
+    draw = ImageDraw.Draw(img)
+
+    # Загружаем шрифты (пробуем разные варианты)
+    font_large = None
+    font_medium = None
+    font_small = None
+    font_info = None
+
+    # Пробуем загрузить шрифты из разных мест (Linux/Windows/Mac)
+    font_paths = [
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+        "/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf",
+        "/System/Library/Fonts/Helvetica.ttc",
+        "arial.ttf",
+        "Arial.ttf",
+        "/Windows/Fonts/arial.ttf",
+        "/Windows/Fonts/ARIAL.TTF",
+    ]
+
+    font_path = None
+    for path in font_paths:
+        try:
+            if os.path.exists(path):
+                # Пробуем загрузить шрифт
+                test_font = ImageFont.truetype(path, 16)
+                font_path = path
+                break
+        except Exception as e:
+            continue
+
+    if font_path:
+        try:
+            font_large = ImageFont.truetype(font_path, 32)
+            font_medium = ImageFont.truetype(font_path, 55)  # Значительно увеличен для текста "ОТСКАНИРУЙТЕ QR"
+            font_small = ImageFont.truetype(font_path, 42)  # Увеличен для текста "В любом банке"
+            font_info = ImageFont.truetype(font_path, 16)
+            logger.info(f"✅ Загружен шрифт: {font_path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось загрузить шрифт {font_path}: {e}")
+            font_path = None
+
+    # Fallback на стандартный шрифт (НЕ поддерживает кириллицу!)
+    if not font_path:
+        # Пробуем использовать встроенный шрифт PIL с большим размером
+        try:
+            # Пробуем загрузить любой доступный шрифт из системы
+            import subprocess
+            result = subprocess.run(['fc-list'], capture_output=True, text=True, timeout=2)
+            if result.returncode == 0 and result.stdout:
+                # Парсим первый найденный шрифт
+                for line in result.stdout.split('\n')[:5]:
+                    if '.ttf' in line or '.otf' in line:
+                        try:
+                            font_file = line.split(':')[0].strip()
+                            if os.path.exists(font_file):
+                                font_large = ImageFont.truetype(font_file, 32)
+                                font_medium = ImageFont.truetype(font_file, 55)  # Значительно увеличен для текста "ОТСКАНИРУЙТЕ QR"
+                                font_small = ImageFont.truetype(font_file, 42)  # Увеличен для текста "В любом банке"
+                                font_info = ImageFont.truetype(font_file, 16)
+                                logger.info(f"✅ Найден шрифт через fc-list: {font_file}")
+                                font_path = font_file
+                                break
+                        except:
+                            continue
+        except:
+            pass
+
+        if not font_path:
+            font_large = ImageFont.load_default()
+            font_medium = ImageFont.load_default()
+            font_small = ImageFont.load_default()
+            font_info = ImageFont.load_default()
+            logger.error("❌ Шрифт не найден! Текст может не отображаться (стандартный шрифт не поддерживает кириллицу)")
+            logger.error("💡 Установите шрифты: sudo apt-get install fonts-dejavu fonts-liberation")
+
+    # Изображение уже в RGBA режиме, пересоздаем draw для работы с текстом
+    draw = ImageDraw.Draw(img)
+
+    # Текст "ПОПОЛНЕНИЕ" поверх QR-кода по диагонали
+    text_line1 = "ПОПОЛНЕНИЕ"
+    text_line2 = ""
+
+    # Увеличиваем размер шрифта для текста поверх QR-кода (более заметный, чтобы закрывал QR-код)
+    try:
+        font_overlay = ImageFont.truetype(font_path, 85) if font_path else font_large  # Оптимальный размер для перекрытия QR-кода
+    except:
+        font_overlay = font_large
+
+    # Создаем временное изображение для повернутого текста
+    # Размеры для временного изображения (больше, чтобы текст поместился при повороте)
+    temp_img_size = max(img_width, img_height) * 3
+    temp_img = Image.new('RGBA', (temp_img_size, temp_img_size), (0, 0, 0, 0))
+    temp_draw = ImageDraw.Draw(temp_img)
+
+    # Получаем размеры обеих строк текста
+    bbox1 = temp_draw.textbbox((0, 0), text_line1, font=font_overlay)
+    bbox2 = temp_draw.textbbox((0, 0), text_line2, font=font_overlay)
+    text_width1 = bbox1[2] - bbox1[0]
+    text_height1 = bbox1[3] - bbox1[1]
+    text_width2 = bbox2[2] - bbox2[0]
+    text_height2 = bbox2[3] - bbox2[1]
+
+    # Общая ширина и высота блока из двух строк
+    block_width = max(text_width1, text_width2)
+    block_height = text_height1 + text_height2 + 20  # Увеличено расстояние между строками для большего шрифта
+
+    # Рисуем две строки текста одна под другой (красный, полупрозрачный)
+    # Используем полупрозрачный красный цвет (R, G, B, Alpha)
+    text_color = (220, 0, 0, 180)  # Красный с прозрачностью ~70% (более видимый)
+
+    # Центрируем блок текста на временном изображении
+    block_x = (temp_img_size - block_width) // 2
+    block_y = (temp_img_size - block_height) // 2
+
+    # Рисуем первую строку
+    text_x1 = block_x + (block_width - text_width1) // 2
+    text_y1 = block_y
+    temp_draw.text((text_x1, text_y1), text_line1, fill=text_color, font=font_overlay)
+
+    # Рисуем вторую строку под первой
+    text_x2 = block_x + (block_width - text_width2) // 2
+    text_y2 = block_y + text_height1 + 20  # Увеличено расстояние между строками
+    temp_draw.text((text_x2, text_y2), text_line2, fill=text_color, font=font_overlay)
+
+    # Поворачиваем текст по диагонали (около -40 градусов от нижнего левого к верхнему правому)
+    rotation_angle = -40
+    # Используем BICUBIC для лучшего качества поворота текста (LANCZOS не поддерживается в этой версии Pillow)
+    rotated_text = temp_img.rotate(rotation_angle, expand=False, fillcolor=(0, 0, 0, 0), resample=Image.Resampling.BICUBIC)
+
+    # Вычисляем позицию для центрирования текста по диагонали QR-кода
+    # Центр QR-кода
+    qr_center_x = qr_x + qr_size // 2
+    qr_center_y = qr_y + qr_size // 2
+
+    # Центр повернутого текста на временном изображении
+    center_x = temp_img_size // 2
+    center_y = temp_img_size // 2
+
+    # Вырезаем область вокруг центра повернутого текста
+    # Увеличиваем область crop для безопасности, чтобы текст не обрезался по краям
+    crop_padding = 250
+    crop_x1 = center_x - block_width // 2 - crop_padding
+    crop_y1 = center_y - block_height // 2 - crop_padding
+    crop_x2 = center_x + block_width // 2 + crop_padding
+    crop_y2 = center_y + block_height // 2 + crop_padding
+
+    text_crop = rotated_text.crop((crop_x1, crop_y1, crop_x2, crop_y2))
+
+    # Вычисляем позицию для наложения текста так, чтобы центр текста совпадал с центром QR-кода
+    crop_width = crop_x2 - crop_x1
+    crop_height = crop_y2 - crop_y1
+    paste_x = qr_center_x - crop_width // 2
+    paste_y = qr_center_y - crop_height // 2
+
+    # Накладываем текст поверх QR-кода с альфа-каналом
+    img.paste(text_crop, (paste_x, paste_y), text_crop)
+
+    # Текст "ОТСКАНИРУЙТЕ QR" под QR-кодом
+    text_below1 = "ОТСКАНИРУЙТЕ QR"
+    bbox2 = draw.textbbox((0, 0), text_below1, font=font_medium)
+    text_width2 = bbox2[2] - bbox2[0]
+    text_x2 = (img_width - text_width2) // 2
+    text_y2 = qr_y + qr_size + 30  # Под QR-кодом с отступом
+    draw.text((text_x2, text_y2), text_below1, fill='black', font=font_medium)
+
+    # Текст "В любом банке"
+    text_below2 = "В любом банке"
+    bbox3 = draw.textbbox((0, 0), text_below2, font=font_small)
+    text_width3 = bbox3[2] - bbox3[0]
+    text_x3 = (img_width - text_width3) // 2
+    text_y3 = text_y2 + 60  # Увеличено расстояние для большего шрифта
+    draw.text((text_x3, text_y3), text_below2, fill='blue', font=font_small)
+
+    # НЕ добавляем детальную информацию на изображение - она будет только в caption
+    # Оставляем только QR-код, текст под ним и красную линию внизу
+
+    # Красная линия внизу изображения (как на оригинале)
+    # Размещаем её после текста "В любом банке" с небольшим отступом
+    red_line_y = text_y3 + 50
+    red_line_height = 5
+    draw.rectangle([0, red_line_y, img_width, red_line_y + red_line_height], fill='red', outline='red', width=0)
+
+    # Обрезаем изображение после красной линии, чтобы убрать пустое пространство внизу
+    bottom_crop = red_line_y + red_line_height + 20  # Небольшой отступ после красной линии
+    img = img.crop((0, 0, img_width, bottom_crop))
+
+    # Конвертируем обратно в RGB для сохранения (PNG поддерживает RGBA, но RGB более совместим)
+    img = img.convert('RGB')
+
+    # Сохраняем в PNG
+    qr_image = BytesIO()
+    img.save(qr_image, format='PNG')
+
+    # Логируем для отладки
+    logger.info(f"✅ QR-код сгенерирован: размер {img_width}x{img_height}, шрифт: {font_path or 'default'}, текст добавлен")
+    return qr_image.getvalue()
+
+
+def render_online_qr_png(qr_png: bytes, amount: float, casino_name: str, deposit_title: str, player_id: str, timer_text: str) -> bytes:
+    """Дорисовывает текст на QR-код из онлайн API (CPU-задача, выполняется в cpu_executor)"""
+    qr_img_online = Image.open(BytesIO(qr_png))
+
+    # Создаем новое изображение с белым фоном
+    img_width = 900  # Оптимальная ширина для размещения QR-кода
+    img_height = 1100  # Оптимальная высота изображения
+    img = Image.new('RGB', (img_width, img_height), 'white')
+
+    # Вставляем QR-код
+    qr_size = 780  # Увеличенный размер QR-кода как на втором фото
+    qr_img_resized = qr_img_online.resize((qr_size, qr_size))
+    qr_x = (img_width - qr_size) // 2
+    qr_y = 50
+    img.paste(qr_img_resized, (qr_x, qr_y))
+
+    # Добавляем текст (используем стандартный шрифт, но хотя бы попробуем)
+    draw = ImageDraw.Draw(img)
+    try:
+        # Пробуем найти шрифт
+        font_paths = [
+            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+            "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+            "/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf",
+        ]
+        font_info = None
+        for path in font_paths:
+            if os.path.exists(path):
+                try:
+                    font_info = ImageFont.truetype(path, 16)
+                    break
+                except:
+                    continue
+
+        if not font_info:
+            font_info = ImageFont.load_default()
+
+        # Добавляем текст под QR-кодом
+        current_y = qr_y + qr_size + 30
+
+        def draw_text_line(text, y_pos, font_obj, color='black'):
+            try:
+                bbox = draw.textbbox((0, 0), text, font=font_obj)
+                text_width = bbox[2] - bbox[0]
+                if text_width > 0:
+                    text_x = (img_width - text_width) // 2
+                    draw.text((text_x, y_pos), text, fill=color, font=font_obj)
+                    return bbox[3] - bbox[1]
+            except:
+                pass
+            return 20
+
+        current_y += draw_text_line("QR-kod dlya oplaty", current_y, font_info, 'black') + 10
+        current_y += draw_text_line(deposit_title, current_y, font_info, 'black') + 10
+        current_y += draw_text_line(f"Summa: {amount:.2f} som", current_y, font_info, 'black') + 10
+        current_y += draw_text_line(f"Casino: {casino_name}", current_y, font_info, 'black') + 10
+        current_y += draw_text_line(f"ID igroka: {player_id}", current_y, font_info, 'black') + 10
+        current_y += draw_text_line(f"Timer: {timer_text}", current_y, font_info, 'red') + 10
+        current_y += draw_text_line("Posle oplaty otpravte foto cheka:", current_y, font_info, 'black') + 10
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка при добавлении текста на QR-код из онлайн API: {e}")
+
+    # Сохраняем в PNG
+    qr_image = BytesIO()
+    img.save(qr_image, format='PNG')
+    logger.info(f"✅ QR-код из онлайн API обработан, текст добавлен")
+    return qr_image.getvalue()
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик всех текстовых сообщений от пользователей (не команд)"""
     if not update.message or not update.message.from_user:
@@ -816,8 +1237,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logger.info(f"📨 Пользователь {user_id} нажал кнопку: {message_text}")
         
         # Загружаем настройки если они устарели
-        if asyncio.get_event_loop().time() - settings_cache.get('last_update', 0) > 300:
-            await load_settings()
+        await ensure_settings_fresh()
         
         # Проверяем паузу
         if settings_cache.get('pause', False):
@@ -1039,7 +1459,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 saved_id = data.get('saved_player_ids', {}).get(bookmaker, '')
                 if not saved_id:
                     try:
-                        async with httpx.AsyncClient(timeout=5.0) as client:
+                        async with api_client(timeout=5.0) as client:
                             response = await client.get(
                                 f"{API_URL}/api/public/casino-account",
                                 params={"user_id": str(user_id), "casino_id": bookmaker.lower()}
@@ -1144,7 +1564,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 saved_id = data.get('saved_player_ids', {}).get(bookmaker, '')
                 if not saved_id:
                     try:
-                        async with httpx.AsyncClient(timeout=5.0) as client:
+                        async with api_client(timeout=5.0) as client:
                             response = await client.get(
                                 f"{API_URL}/api/public/casino-account",
                                 params={"user_id": str(user_id), "casino_id": bookmaker.lower()}
@@ -1162,7 +1582,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 # Получаем сохраненный номер телефона
                 saved_phone = None
                 try:
-                    async with httpx.AsyncClient(timeout=10.0) as client:
+                    async with api_client(timeout=10.0) as client:
                         response = await client.get(
                             f"{API_URL}/api/public/casino-account",
                             params={"user_id": str(user_id), "casino_id": "phone"}
@@ -1222,7 +1642,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
             # Сохраняем ID через API в базу данных (нормализуем название казино)
             try:
-                async with httpx.AsyncClient(timeout=5.0) as client:
+                async with api_client(timeout=5.0) as client:
                     await client.post(
                         f"{API_URL}/api/public/casino-account",
                         json={
@@ -1316,7 +1736,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
             # Получаем только QR ссылки (заявку создадим после отправки фото)
             try:
-                async with httpx.AsyncClient(timeout=5.0) as client:
+                async with api_client(timeout=5.0) as client:
                     # Получаем QR ссылки для всех банков
                     qr_response = await client.post(
                         f"{API_URL}/api/public/generate-qr",
@@ -1353,8 +1773,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                             timer_text = f"{minutes}:{seconds:02d}"
                             
                             # Загружаем настройки если они устарели
-                            if asyncio.get_event_loop().time() - settings_cache.get('last_update', 0) > 300:
-                                await load_settings()
+                            await ensure_settings_fresh()
                             
                             # Получаем список доступных банков из настроек
                             enabled_banks = settings_cache.get('deposit_banks', [])
@@ -1425,236 +1844,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                                         logger.warning("⚠️ Библиотека qrcode не установлена! Установите: pip install qrcode[pil]")
                                     
                                     if QRCODE_AVAILABLE:
-                                        # Подготавливаем данные для текста на изображении
-                                        casino_name = get_casino_name(data.get('bookmaker', ''))
-                                        deposit_title = get_text('deposit_title')
-                                        
-                                        # Генерируем QR-код с текстом (увеличенный box_size для больших модулей)
-                                        qr = qrcode.QRCode(
-                                            version=1,
-                                            error_correction=qrcode.constants.ERROR_CORRECT_L,
-                                            box_size=28,  # Оптимальный размер модулей QR-кода
-                                            border=4,
-                                        )
-                                        qr.add_data(omoney_url)
-                                        qr.make(fit=True)
-                                        
-                                        # Создаем изображение QR-кода
-                                        qr_img = qr.make_image(fill_color="black", back_color="white")
-                                        
-                                        # Создаем новое изображение с белым фоном
-                                        img_width = 900  # Оптимальная ширина для QR-кода
-                                        img_height = 1200  # Временная высота, будет обрезана после красной линии
-                                        img = Image.new('RGBA', (img_width, img_height), (255, 255, 255, 255))  # RGBA для поддержки прозрачности водяных знаков
-                                        
-                                        # Водяной знак удален по запросу пользователя
-                                        
-                                        # Вставляем QR-код в центр (с отступом сверху, увеличенный размер)
-                                        qr_size = 780  # Увеличенный размер QR-кода как на втором фото
-                                        qr_img_resized = qr_img.resize((qr_size, qr_size))
-                                        qr_x = (img_width - qr_size) // 2
-                                        qr_y = 50
-                                        img.paste(qr_img_resized, (qr_x, qr_y))
-                                        
-                                        # Добавляем текст
-                                        draw = ImageDraw.Draw(img)
-                                        
-                                        # Загружаем шрифты (пробуем разные варианты)
-                                        font_large = None
-                                        font_medium = None
-                                        font_small = None
-                                        font_info = None
-                                        
-                                        # Пробуем загрузить шрифты из разных мест (Linux/Windows/Mac)
-                                        font_paths = [
-                                            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-                                            "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-                                            "/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf",
-                                            "/System/Library/Fonts/Helvetica.ttc",
-                                            "arial.ttf",
-                                            "Arial.ttf",
-                                            "/Windows/Fonts/arial.ttf",
-                                            "/Windows/Fonts/ARIAL.TTF",
-                                        ]
-                                        
-                                        font_path = None
-                                        for path in font_paths:
-                                            try:
-                                                if os.path.exists(path):
-                                                    # Пробуем загрузить шрифт
-                                                    test_font = ImageFont.truetype(path, 16)
-                                                    font_path = path
-                                                    break
-                                            except Exception as e:
-                                                continue
-                                        
-                                        if font_path:
-                                            try:
-                                                font_large = ImageFont.truetype(font_path, 32)
-                                                font_medium = ImageFont.truetype(font_path, 55)  # Значительно увеличен для текста "ОТСКАНИРУЙТЕ QR"
-                                                font_small = ImageFont.truetype(font_path, 42)  # Увеличен для текста "В любом банке"
-                                                font_info = ImageFont.truetype(font_path, 16)
-                                                logger.info(f"✅ Загружен шрифт: {font_path}")
-                                            except Exception as e:
-                                                logger.warning(f"⚠️ Не удалось загрузить шрифт {font_path}: {e}")
-                                                font_path = None
-                                        
-                                        # Fallback на стандартный шрифт (НЕ поддерживает кириллицу!)
-                                        if not font_path:
-                                            # Пробуем использовать встроенный шрифт PIL с большим размером
-                                            try:
-                                                # Пробуем загрузить любой доступный шрифт из системы
-                                                import subprocess
-                                                result = subprocess.run(['fc-list'], capture_output=True, text=True, timeout=2)
-                                                if result.returncode == 0 and result.stdout:
-                                                    # Парсим первый найденный шрифт
-                                                    for line in result.stdout.split('\n')[:5]:
-                                                        if '.ttf' in line or '.otf' in line:
-                                                            try:
-                                                                font_file = line.split(':')[0].strip()
-                                                                if os.path.exists(font_file):
-                                                                    font_large = ImageFont.truetype(font_file, 32)
-                                                                    font_medium = ImageFont.truetype(font_file, 55)  # Значительно увеличен для текста "ОТСКАНИРУЙТЕ QR"
-                                                                    font_small = ImageFont.truetype(font_file, 42)  # Увеличен для текста "В любом банке"
-                                                                    font_info = ImageFont.truetype(font_file, 16)
-                                                                    logger.info(f"✅ Найден шрифт через fc-list: {font_file}")
-                                                                    font_path = font_file
-                                                                    break
-                                                            except:
-                                                                continue
-                                            except:
-                                                pass
-                                            
-                                            if not font_path:
-                                                font_large = ImageFont.load_default()
-                                                font_medium = ImageFont.load_default()
-                                                font_small = ImageFont.load_default()
-                                                font_info = ImageFont.load_default()
-                                                logger.error("❌ Шрифт не найден! Текст может не отображаться (стандартный шрифт не поддерживает кириллицу)")
-                                                logger.error("💡 Установите шрифты: sudo apt-get install fonts-dejavu fonts-liberation")
-                                        
-                                        # Изображение уже в RGBA режиме, пересоздаем draw для работы с текстом
-                                        draw = ImageDraw.Draw(img)
-                                        
-                                        # Текст "ПОПОЛНЕНИЕ" поверх QR-кода по диагонали
-                                        text_line1 = "ПОПОЛНЕНИЕ"
-                                        text_line2 = ""
-                                        
-                                        # Увеличиваем размер шрифта для текста поверх QR-кода (более заметный, чтобы закрывал QR-код)
-                                        try:
-                                            font_overlay = ImageFont.truetype(font_path, 85) if font_path else font_large  # Оптимальный размер для перекрытия QR-кода
-                                        except:
-                                            font_overlay = font_large
-                                        
-                                        # Создаем временное изображение для повернутого текста
-                                        # Размеры для временного изображения (больше, чтобы текст поместился при повороте)
-                                        temp_img_size = max(img_width, img_height) * 3
-                                        temp_img = Image.new('RGBA', (temp_img_size, temp_img_size), (0, 0, 0, 0))
-                                        temp_draw = ImageDraw.Draw(temp_img)
-                                        
-                                        # Получаем размеры обеих строк текста
-                                        bbox1 = temp_draw.textbbox((0, 0), text_line1, font=font_overlay)
-                                        bbox2 = temp_draw.textbbox((0, 0), text_line2, font=font_overlay)
-                                        text_width1 = bbox1[2] - bbox1[0]
-                                        text_height1 = bbox1[3] - bbox1[1]
-                                        text_width2 = bbox2[2] - bbox2[0]
-                                        text_height2 = bbox2[3] - bbox2[1]
-                                        
-                                        # Общая ширина и высота блока из двух строк
-                                        block_width = max(text_width1, text_width2)
-                                        block_height = text_height1 + text_height2 + 20  # Увеличено расстояние между строками для большего шрифта
-                                        
-                                        # Рисуем две строки текста одна под другой (красный, полупрозрачный)
-                                        # Используем полупрозрачный красный цвет (R, G, B, Alpha)
-                                        text_color = (220, 0, 0, 180)  # Красный с прозрачностью ~70% (более видимый)
-                                        
-                                        # Центрируем блок текста на временном изображении
-                                        block_x = (temp_img_size - block_width) // 2
-                                        block_y = (temp_img_size - block_height) // 2
-                                        
-                                        # Рисуем первую строку
-                                        text_x1 = block_x + (block_width - text_width1) // 2
-                                        text_y1 = block_y
-                                        temp_draw.text((text_x1, text_y1), text_line1, fill=text_color, font=font_overlay)
-                                        
-                                        # Рисуем вторую строку под первой
-                                        text_x2 = block_x + (block_width - text_width2) // 2
-                                        text_y2 = block_y + text_height1 + 20  # Увеличено расстояние между строками
-                                        temp_draw.text((text_x2, text_y2), text_line2, fill=text_color, font=font_overlay)
-                                        
-                                        # Поворачиваем текст по диагонали (около -40 градусов от нижнего левого к верхнему правому)
-                                        rotation_angle = -40
-                                        # Используем BICUBIC для лучшего качества поворота текста (LANCZOS не поддерживается в этой версии Pillow)
-                                        rotated_text = temp_img.rotate(rotation_angle, expand=False, fillcolor=(0, 0, 0, 0), resample=Image.Resampling.BICUBIC)
-                                        
-                                        # Вычисляем позицию для центрирования текста по диагонали QR-кода
-                                        # Центр QR-кода
-                                        qr_center_x = qr_x + qr_size // 2
-                                        qr_center_y = qr_y + qr_size // 2
-                                        
-                                        # Центр повернутого текста на временном изображении
-                                        center_x = temp_img_size // 2
-                                        center_y = temp_img_size // 2
-                                        
-                                        # Вырезаем область вокруг центра повернутого текста
-                                        # Увеличиваем область crop для безопасности, чтобы текст не обрезался по краям
-                                        crop_padding = 250
-                                        crop_x1 = center_x - block_width // 2 - crop_padding
-                                        crop_y1 = center_y - block_height // 2 - crop_padding
-                                        crop_x2 = center_x + block_width // 2 + crop_padding
-                                        crop_y2 = center_y + block_height // 2 + crop_padding
-                                        
-                                        text_crop = rotated_text.crop((crop_x1, crop_y1, crop_x2, crop_y2))
-                                        
-                                        # Вычисляем позицию для наложения текста так, чтобы центр текста совпадал с центром QR-кода
-                                        crop_width = crop_x2 - crop_x1
-                                        crop_height = crop_y2 - crop_y1
-                                        paste_x = qr_center_x - crop_width // 2
-                                        paste_y = qr_center_y - crop_height // 2
-                                        
-                                        # Накладываем текст поверх QR-кода с альфа-каналом
-                                        img.paste(text_crop, (paste_x, paste_y), text_crop)
-                                        
-                                        # Текст "ОТСКАНИРУЙТЕ QR" под QR-кодом
-                                        text_below1 = "ОТСКАНИРУЙТЕ QR"
-                                        bbox2 = draw.textbbox((0, 0), text_below1, font=font_medium)
-                                        text_width2 = bbox2[2] - bbox2[0]
-                                        text_x2 = (img_width - text_width2) // 2
-                                        text_y2 = qr_y + qr_size + 30  # Под QR-кодом с отступом
-                                        draw.text((text_x2, text_y2), text_below1, fill='black', font=font_medium)
-                                        
-                                        # Текст "В любом банке"
-                                        text_below2 = "В любом банке"
-                                        bbox3 = draw.textbbox((0, 0), text_below2, font=font_small)
-                                        text_width3 = bbox3[2] - bbox3[0]
-                                        text_x3 = (img_width - text_width3) // 2
-                                        text_y3 = text_y2 + 60  # Увеличено расстояние для большего шрифта
-                                        draw.text((text_x3, text_y3), text_below2, fill='blue', font=font_small)
-                                        
-                                        # НЕ добавляем детальную информацию на изображение - она будет только в caption
-                                        # Оставляем только QR-код, текст под ним и красную линию внизу
-                                        
-                                        # Красная линия внизу изображения (как на оригинале)
-                                        # Размещаем её после текста "В любом банке" с небольшим отступом
-                                        red_line_y = text_y3 + 50
-                                        red_line_height = 5
-                                        draw.rectangle([0, red_line_y, img_width, red_line_y + red_line_height], fill='red', outline='red', width=0)
-                                        
-                                        # Обрезаем изображение после красной линии, чтобы убрать пустое пространство внизу
-                                        bottom_crop = red_line_y + red_line_height + 20  # Небольшой отступ после красной линии
-                                        img = img.crop((0, 0, img_width, bottom_crop))
-                                        
-                                        # Конвертируем обратно в RGB для сохранения (PNG поддерживает RGBA, но RGB более совместим)
-                                        img = img.convert('RGB')
-                                        
-                                        # Сохраняем в BytesIO
-                                        qr_image = BytesIO()
-                                        img.save(qr_image, format='PNG')
-                                        qr_image.seek(0)
+                                        # Рисование QR-кода - в пуле, чтобы не блокировать обработку обновлений
+                                        qr_image = BytesIO(await cpu_executor.submit(render_deposit_qr_png, omoney_url))
                                         qr_image.name = 'qr_code.png'
-                                        
-                                        # Логируем для отладки
-                                        logger.info(f"✅ QR-код сгенерирован: размер {img_width}x{img_height}, шрифт: {font_path or 'default'}, текст добавлен")
                                     else:
                                         # Fallback на онлайн API если библиотеки нет
                                         logger.warning("⚠️ Библиотека qrcode недоступна, используем онлайн API")
@@ -1662,78 +1854,17 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                                         async with httpx.AsyncClient(timeout=10.0) as qr_client:
                                             qr_response = await qr_client.get(qr_code_url)
                                             if qr_response.status_code == 200:
-                                                # Загружаем готовый QR-код и добавляем на него текст
-                                                qr_img_online = Image.open(BytesIO(qr_response.content))
-                                                
-                                                # Подготавливаем данные для текста
-                                                casino_name = get_casino_name(data.get('bookmaker', ''))
-                                                deposit_title = get_text('deposit_title')
-                                                
-                                                # Создаем новое изображение с белым фоном
-                                                img_width = 900  # Оптимальная ширина для размещения QR-кода
-                                                img_height = 1100  # Оптимальная высота изображения
-                                                img = Image.new('RGB', (img_width, img_height), 'white')
-                                                
-                                                # Вставляем QR-код
-                                                qr_size = 780  # Увеличенный размер QR-кода как на втором фото
-                                                qr_img_resized = qr_img_online.resize((qr_size, qr_size))
-                                                qr_x = (img_width - qr_size) // 2
-                                                qr_y = 50
-                                                img.paste(qr_img_resized, (qr_x, qr_y))
-                                                
-                                                # Добавляем текст (используем стандартный шрифт, но хотя бы попробуем)
-                                                draw = ImageDraw.Draw(img)
-                                                try:
-                                                    # Пробуем найти шрифт
-                                                    font_paths = [
-                                                        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-                                                        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-                                                        "/usr/share/fonts/truetype/noto/NotoSans-Regular.ttf",
-                                                    ]
-                                                    font_info = None
-                                                    for path in font_paths:
-                                                        if os.path.exists(path):
-                                                            try:
-                                                                font_info = ImageFont.truetype(path, 16)
-                                                                break
-                                                            except:
-                                                                continue
-                                                    
-                                                    if not font_info:
-                                                        font_info = ImageFont.load_default()
-                                                    
-                                                    # Добавляем текст под QR-кодом
-                                                    current_y = qr_y + qr_size + 30
-                                                    
-                                                    def draw_text_line(text, y_pos, font_obj, color='black'):
-                                                        try:
-                                                            bbox = draw.textbbox((0, 0), text, font=font_obj)
-                                                            text_width = bbox[2] - bbox[0]
-                                                            if text_width > 0:
-                                                                text_x = (img_width - text_width) // 2
-                                                                draw.text((text_x, y_pos), text, fill=color, font=font_obj)
-                                                                return bbox[3] - bbox[1]
-                                                        except:
-                                                            pass
-                                                        return 20
-                                                    
-                                                    current_y += draw_text_line("QR-kod dlya oplaty", current_y, font_info, 'black') + 10
-                                                    current_y += draw_text_line(deposit_title, current_y, font_info, 'black') + 10
-                                                    current_y += draw_text_line(f"Summa: {amount:.2f} som", current_y, font_info, 'black') + 10
-                                                    current_y += draw_text_line(f"Casino: {casino_name}", current_y, font_info, 'black') + 10
-                                                    current_y += draw_text_line(f"ID igroka: {data['player_id']}", current_y, font_info, 'black') + 10
-                                                    current_y += draw_text_line(f"Timer: {timer_text}", current_y, font_info, 'red') + 10
-                                                    current_y += draw_text_line("Posle oplaty otpravte foto cheka:", current_y, font_info, 'black') + 10
-                                                    
-                                                except Exception as e:
-                                                    logger.error(f"❌ Ошибка при добавлении текста на QR-код из онлайн API: {e}")
-                                                
-                                                # Сохраняем в BytesIO
-                                                qr_image = BytesIO()
-                                                img.save(qr_image, format='PNG')
-                                                qr_image.seek(0)
+                                                # Загружаем готовый QR-код и добавляем на него текст (в пуле)
+                                                qr_image = BytesIO(await cpu_executor.submit(
+                                                    render_online_qr_png,
+                                                    qr_response.content,
+                                                    amount,
+                                                    get_casino_name(data.get('bookmaker', '')),
+                                                    get_text('deposit_title'),
+                                                    data['player_id'],
+                                                    timer_text
+                                                ))
                                                 qr_image.name = 'qr_code.png'
-                                                logger.info(f"✅ QR-код из онлайн API обработан, текст добавлен")
                                             else:
                                                 qr_image = None
                                                 logger.error(f"❌ Не удалось загрузить QR-код из онлайн API: status={qr_response.status_code}")
@@ -1801,6 +1932,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                             # Сохраняем ссылки в состоянии для последующего использования
                             user_states[user_id]['data']['bank_links'] = bank_links
                             user_states[user_id]['data']['timer_seconds'] = timer_seconds
+                            # Срок оплаты (unix time) - по нему таймер перезапускается на другом воркере
+                            user_states[user_id]['data']['timer_deadline'] = time.time() + timer_seconds
                             
                             # Сохраняем ожидание фото чека (для восстановления после рестарта)
                             pending_data = {
@@ -1816,11 +1949,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                             except Exception as e:
                                 logger.warning(f"⚠️ Не удалось удалить сообщение 'Генерирую QR code...': {e}")
                             
-                            # Запускаем таймер как фоновую задачу
-                            timer_task = asyncio.create_task(
-                                update_timer(context.bot, user_id, timer_seconds, data, timer_message.message_id, timer_message.chat.id)
-                            )
-                            active_timers[user_id] = timer_task
+                            # Запускаем таймер в общем планировщике
+                            start_deposit_timer(context.bot, user_id, timer_seconds, data, timer_message.message_id, timer_message.chat.id)
                             
                             # Состояние остается deposit_bank - ждем выбора банка или фото
                             logger.info(f"✅ Сообщение с кнопками банков отправлено пользователю {user_id}, таймер запущен")
@@ -1878,14 +2008,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     await update.message.reply_text(get_text('please_send_receipt'))
                 return
             
-            # Получаем фото в base64 и создаем заявку
+            # Создаем заявку, фото чека передается файлом (multipart) потоком из Telegram
             processing_message = await update.message.reply_text("⏳ Обрабатываю фото чека и создаю заявку...")
             try:
-                receipt_photo_base64 = await asyncio.wait_for(
-                    get_photo_base64(context.bot, photo_file_id),
-                    timeout=20.0
-                )
-                logger.info(f"📤 Создаю заявку с фото чека, длина base64: {len(receipt_photo_base64)}")
+                receipt_file = await asyncio.wait_for(context.bot.get_file(photo_file_id), timeout=20.0)
+                logger.info(f"📷 Файл получен: file_path={receipt_file.file_path}, file_size={receipt_file.file_size}")
                 
                 # Проверяем, что все необходимые данные есть
                 if not data.get('amount'):
@@ -1924,23 +2051,25 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     "bank": bank,
                     "account_id": data['player_id'],
                     "playerId": data['player_id'],
-                    "receipt_photo": receipt_photo_base64,  # Фото чека
                     "telegram_username": user.username,
                     "telegram_first_name": user.first_name,
                     "telegram_last_name": user.last_name,
                     "source": "bot"
                 }
                 
-                async with httpx.AsyncClient(timeout=30.0) as client:
+                async with api_client(timeout=30.0) as client:
                     # Создаем заявку с фото
                     logger.info(f"📤 Отправляю заявку на создание: amount={data.get('amount')}, bookmaker={data.get('bookmaker')}, player_id={data.get('player_id')}")
-                    logger.info(f"📤 Размер фото в base64: {len(receipt_photo_base64)} символов")
                     
                     try:
-                        payment_response = await client.post(
+                        payment_response = await post_with_telegram_file(
+                            get_api_client(),
                             f"{API_URL}/api/payment",
-                            json=request_body,
-                            headers={"Content-Type": "application/json"}
+                            request_body,
+                            "receipt_photo",
+                            receipt_file.file_path,
+                            file_size=receipt_file.file_size,
+                            timeout=30.0
                         )
                     except httpx.TimeoutException:
                         logger.error(f"❌ Таймаут при создании заявки (превышено 30 секунд)")
@@ -2034,7 +2163,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # Сохраняем номер телефона через API (всегда, даже если была ошибка)
             saved_to_api = False
             try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
+                async with api_client(timeout=10.0) as client:
                     response = await client.post(
                         f"{API_URL}/api/public/casino-account",
                         json={
@@ -2109,7 +2238,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # Пытаемся получить сохраненный ID из API (нормализуем название букмекера)
             if not saved_id or saved_id == 'None' or saved_id == 'null' or not str(saved_id).strip():
                 try:
-                    async with httpx.AsyncClient(timeout=5.0) as client:
+                    async with api_client(timeout=5.0) as client:
                         response = await client.get(
                             f"{API_URL}/api/public/casino-account",
                             params={"user_id": str(user_id), "casino_id": data['bookmaker'].lower()}
@@ -2213,7 +2342,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
             # Сохраняем ID через API в базу данных (нормализуем название казино)
             try:
-                async with httpx.AsyncClient(timeout=5.0) as client:
+                async with api_client(timeout=5.0) as client:
                     await client.post(
                         f"{API_URL}/api/public/casino-account",
                         json={
@@ -2285,7 +2414,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             try:
                 checking_msg = await update.message.reply_text(get_text('checking_code'))
                 
-                async with httpx.AsyncClient(timeout=10.0) as client:
+                async with api_client(timeout=10.0) as client:
                     response = await client.post(
                         f"{API_URL}/api/withdraw-check",
                         json={
@@ -2431,43 +2560,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if message_text in system_messages:
         logger.debug(f"⏭️ Пропускаю сохранение системного сообщения: {message_text}")
     else:
-        # Сохраняем сообщение в админку через API (неблокирующе)
-        try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                payload = {
-                    "message_text": message_text,
-                    "message_type": message_type,
-                    "media_url": media_url,
-                    "telegram_message_id": telegram_message_id
-                }
-                logger.debug(f"Отправка в API: {API_URL}/api/users/{user_id}/chat/ingest")
-                logger.debug(f"Payload: {payload}")
-                
-                response = await client.post(
-                    f"{API_URL}/api/users/{user_id}/chat/ingest",
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                if response.status_code == 200:
-                    try:
-                        response_data = response.json()
-                        if response_data.get('success'):
-                            logger.info(f"✅ Сообщение от пользователя {user_id} сохранено в чат (ID: {response_data.get('messageId')})")
-                        else:
-                            logger.warning(f"⚠️ API вернул success=false: {response_data.get('error')}")
-                    except Exception as parse_error:
-                        logger.warning(f"⚠️ Не удалось распарсить ответ API: {parse_error}")
-                else:
-                    try:
-                        error_text = response.text
-                        logger.error(f"❌ Ошибка API при сохранении сообщения: {response.status_code} - {error_text[:200]}")
-                    except:
-                        logger.error(f"❌ Ошибка API при сохранении сообщения: {response.status_code}")
-        except httpx.TimeoutException:
-            logger.warning(f"⚠️ Таймаут при сохранении сообщения в чат (не критично)")
-        except Exception as e:
-            logger.warning(f"⚠️ Ошибка при сохранении сообщения в чат (не критично): {e}")
+        # Ставим сообщение в очередь на сохранение в админку (отправит фоновый воркер)
+        chat_ingest_queue.enqueue(
+            user_id,
+            message_text,
+            message_type=message_type,
+            media_url=media_url,
+            telegram_message_id=telegram_message_id
+        )
     
     # Если нет активного диалога, показываем меню
     # Кнопки уже в Reply клавиатуре, не нужно отправлять отдельное сообщение
@@ -2480,7 +2580,7 @@ async def referral_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     
     try:
         # Получаем данные реферальной программы через API
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with api_client(timeout=10.0) as client:
             response = await client.get(
                 f"{API_URL}/api/public/referral-data",
                 params={"user_id": str(user_id)}
@@ -2656,22 +2756,53 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await query.answer("❌ Вы еще не подписались на канал. Пожалуйста, подпишитесь и попробуйте снова.", show_alert=True)
             logger.info(f"⚠️ Пользователь {user_id} не подписан на канал")
 
-async def update_timer(bot, user_id: int, total_seconds: int, data: dict, message_id: int, chat_id: int) -> None:
-    """Обновляет таймер каждую секунду и отменяет заявку при истечении"""
-    try:
-        start_time = asyncio.get_event_loop().time()
-        remaining_seconds = total_seconds
-        
-        while remaining_seconds > 0:
-            await asyncio.sleep(1)
-            
+class DepositTimer:
+    """Состояние таймера депозита одного пользователя; tick() вызывается общим планировщиком"""
+    
+    def __init__(self, bot, user_id: int, total_seconds: int, data: dict, message_id: int, chat_id: int):
+        self.bot = bot
+        self.user_id = user_id
+        self.total_seconds = total_seconds
+        self.data = data
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.start_time = asyncio.get_event_loop().time()
+        self.last_update_time = 0
+    
+    def _remaining(self, now: float) -> int:
+        elapsed = int(now - self.start_time)
+        return max(0, self.total_seconds - elapsed)
+    
+    def _next_wakeup(self, now: float) -> float:
+        """
+        Следующий момент обновления сообщения: через TIMER_UPDATE_INTERVAL секунд,
+        при смене минуты или каждую секунду на последней минуте - но не позже истечения времени
+        """
+        elapsed = int(now - self.start_time)
+        remaining = self._remaining(now)
+        # Под нагрузкой лимитер растягивает интервал обновления
+        interval = rate_governor.timer_interval(TIMER_UPDATE_INTERVAL)
+        candidates = [
+            self.last_update_time + interval,
+            self.start_time + self.total_seconds - (remaining // 60) * 60 + 1,
+            self.start_time + self.total_seconds,
+        ]
+        if remaining - 1 < 60 and interval <= TIMER_UPDATE_INTERVAL:
+            candidates.append(self.start_time + elapsed + 1)
+        return max(now, min(candidates))
+    
+    async def tick(self):
+        """Один шаг таймера. Возвращает время следующего запуска или None, если таймер завершен"""
+        bot = self.bot
+        user_id = self.user_id
+        chat_id = self.chat_id
+        message_id = self.message_id
+        try:
             # Проверяем, не была ли заявка уже создана (если создана, останавливаем таймер)
             if user_id not in user_states:
                 logger.info(f"⏹️ Таймер остановлен для пользователя {user_id} - состояние очищено")
-                # Удаляем таймер из активных
-                if user_id in active_timers:
-                    del active_timers[user_id]
-                break  # Используем break вместо return для корректного завершения
+                active_timers.pop(user_id, None)
+                return None
             
             current_state = user_states.get(user_id, {})
             current_step = current_state.get('step', '')
@@ -2679,29 +2810,34 @@ async def update_timer(bot, user_id: int, total_seconds: int, data: dict, messag
             # Если заявка уже создана (отправлено фото), останавливаем таймер
             if current_step != 'deposit_bank' and current_step != 'deposit_receipt_photo':
                 logger.info(f"⏹️ Таймер остановлен для пользователя {user_id} - заявка создана")
-                # Удаляем таймер из активных
-                if user_id in active_timers:
-                    del active_timers[user_id]
-                break  # Используем break вместо return для корректного завершения
+                active_timers.pop(user_id, None)
+                return None
             
             # Вычисляем оставшееся время
-            elapsed = int(asyncio.get_event_loop().time() - start_time)
-            remaining_seconds = max(0, total_seconds - elapsed)
+            current_time = asyncio.get_event_loop().time()
+            remaining_seconds = self._remaining(current_time)
+            if remaining_seconds <= 0:
+                await self._expire()
+                return None
             
             # Форматируем таймер (без ведущих нулей)
             minutes = remaining_seconds // 60
             seconds = remaining_seconds % 60
             timer_text = f"{minutes}:{seconds:02d}"
             
+            # Косметическое обновление - только если лимитер дает токен без ожидания
+            if not rate_governor.try_acquire(chat_id):
+                self.last_update_time = current_time
+                return self._next_wakeup(current_time)
+            
             # Обновляем сообщение
             try:
                 # Получаем актуальные данные
-                current_data = user_states.get(user_id, {}).get('data', data)
+                current_data = user_states.get(user_id, {}).get('data', self.data)
                 bank_links = current_data.get('bank_links', {})
                 
                 # Загружаем настройки если они устарели
-                if asyncio.get_event_loop().time() - settings_cache.get('last_update', 0) > 300:
-                    await load_settings()
+                await ensure_settings_fresh()
                 
                 # Получаем список доступных банков из настроек
                 enabled_banks = settings_cache.get('deposit_banks', [])
@@ -2760,106 +2896,131 @@ async def update_timer(bot, user_id: int, total_seconds: int, data: dict, messag
                 
                 # Проверяем тип сообщения и используем соответствующий метод
                 is_photo_message = current_data.get('is_photo_message', False)
-                if is_photo_message:
-                    # Обновляем caption фото
-                    await bot.edit_message_caption(
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        caption=updated_text,
-                        reply_markup=reply_markup,
-                        parse_mode='HTML'
-                    )
-                else:
-                    # Обновляем текстовое сообщение
-                    await bot.edit_message_text(
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        text=updated_text,
-                        reply_markup=reply_markup,
-                        parse_mode='HTML'
-                    )
+                with rate_governor.prepaid():
+                    if is_photo_message:
+                        # Обновляем caption фото
+                        await bot.edit_message_caption(
+                            chat_id=chat_id,
+                            message_id=message_id,
+                            caption=updated_text,
+                            reply_markup=reply_markup,
+                            parse_mode='HTML'
+                        )
+                    else:
+                        # Обновляем текстовое сообщение
+                        await bot.edit_message_text(
+                            chat_id=chat_id,
+                            message_id=message_id,
+                            text=updated_text,
+                            reply_markup=reply_markup,
+                            parse_mode='HTML'
+                        )
             except Exception as e:
                 logger.warning(f"⚠️ Не удалось обновить таймер для пользователя {user_id}: {e}")
                 # Продолжаем работу таймера даже если не удалось обновить сообщение
-        
-        # Время истекло - отменяем заявку
-        if user_id in user_states:
-            logger.info(f"⏰ Таймер истек для пользователя {user_id}, отменяю заявку")
-            
-            # Получаем данные перед очисткой состояния
-            current_data = user_states.get(user_id, {}).get('data', data)
-            is_photo_message = current_data.get('is_photo_message', False)
             
-            # Очищаем состояние
-            del user_states[user_id]
-            clear_pending_deposit_state(user_id)
-            
-            # Удаляем таймер из активных
-            if user_id in active_timers:
-                del active_timers[user_id]
+            self.last_update_time = current_time
+            return self._next_wakeup(asyncio.get_event_loop().time())
+        except asyncio.CancelledError:
+            logger.info(f"⏹️ Таймер отменен для пользователя {user_id}")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка в таймере для пользователя {user_id}: {e}", exc_info=True)
+            # Не очищаем состояние, чтобы случайная ошибка не ломала ожидание чека
+            active_timers.pop(user_id, None)
+            return None
+    
+    async def _expire(self) -> None:
+        """Время истекло - отменяем заявку"""
+        bot = self.bot
+        user_id = self.user_id
+        chat_id = self.chat_id
+        if user_id not in user_states:
+            active_timers.pop(user_id, None)
+            return
+        logger.info(f"⏰ Таймер истек для пользователя {user_id}, отменяю заявку")
+        
+        # Очищаем состояние
+        del user_states[user_id]
+        clear_pending_deposit_state(user_id)
+        
+        # Удаляем таймер из активных
+        active_timers.pop(user_id, None)
+        
+        # Отправляем сообщение об отмене
+        try:
+            cancel_text = "⏰ <b>Пополнение отменено, время оплаты прошло</b>\n\n❌ <b>Не переводите по старым реквизитам</b>\n\nНачните заново, нажав на <b>Пополнить</b>"
             
-            # Отправляем сообщение об отмене
+            # Удаляем сообщение с QR-кодом полностью, чтобы пользователи случайно не перевели деньги по старым реквизитам
             try:
-                cancel_text = "⏰ <b>Пополнение отменено, время оплаты прошло</b>\n\n❌ <b>Не переводите по старым реквизитам</b>\n\nНачните заново, нажав на <b>Пополнить</b>"
-                
-                # Удаляем сообщение с QR-кодом полностью, чтобы пользователи случайно не перевели деньги по старым реквизитам
-                try:
-                    await bot.delete_message(
-                        chat_id=chat_id,
-                        message_id=message_id
-                    )
-                    logger.info(f"✅ Сообщение с QR-кодом удалено для пользователя {user_id} после истечения таймера")
-                except Exception as delete_error:
-                    logger.warning(f"⚠️ Не удалось удалить сообщение с QR-кодом для пользователя {user_id}: {delete_error}")
-                
-                # Отправляем новое сообщение об отмене
-                await bot.send_message(
+                await bot.delete_message(
                     chat_id=chat_id,
-                    text=cancel_text,
-                    parse_mode='HTML'
+                    message_id=self.message_id
                 )
-                await send_main_menu(bot, chat_id, "")
-            except Exception as e:
-                logger.error(f"❌ Ошибка при отправке сообщения об отмене для пользователя {user_id}: {e}")
-    except asyncio.CancelledError:
-        logger.info(f"⏹️ Таймер отменен для пользователя {user_id}")
-        # Удаляем таймер из активных
-        if user_id in active_timers:
-            del active_timers[user_id]
-    except Exception as e:
-        logger.error(f"❌ Ошибка в таймере для пользователя {user_id}: {e}", exc_info=True)
-        # Не очищаем состояние, чтобы случайная ошибка не ломала ожидание чека
-        if user_id in active_timers:
-            del active_timers[user_id]
-    finally:
-        # Гарантируем, что таймер удален из активных
-        if user_id in active_timers:
-            del active_timers[user_id]
+                logger.info(f"✅ Сообщение с QR-кодом удалено для пользователя {user_id} после истечения таймера")
+            except Exception as delete_error:
+                logger.warning(f"⚠️ Не удалось удалить сообщение с QR-кодом для пользователя {user_id}: {delete_error}")
+            
+            # Отправляем новое сообщение об отмене
+            await bot.send_message(
+                chat_id=chat_id,
+                text=cancel_text,
+                parse_mode='HTML'
+            )
+            await send_main_menu(bot, chat_id, "")
+        except Exception as e:
+            logger.error(f"❌ Ошибка при отправке сообщения об отмене для пользователя {user_id}: {e}")
 
-async def get_photo_base64(bot, file_id: str) -> str:
-    """Получает фото из Telegram и конвертирует в base64"""
-    try:
-        logger.info(f"📷 Начинаю загрузку фото: file_id={file_id}")
-        file = await bot.get_file(file_id)
-        logger.info(f"📷 Файл получен: file_path={file.file_path}, file_size={file.file_size}")
-        file_data = await file.download_as_bytearray()
-        logger.info(f"📷 Файл загружен: размер={len(file_data)} байт")
-        base64_data = base64.b64encode(file_data).decode('utf-8')
-        logger.info(f"📷 Base64 сгенерирован: длина={len(base64_data)} символов")
-        result = f"data:image/jpeg;base64,{base64_data}"
-        logger.info(f"✅ Фото успешно конвертировано в base64, итоговая длина: {len(result)} символов")
-        return result
-    except Exception as e:
-        logger.error(f"❌ Ошибка при получении фото: {e}", exc_info=True)
-        raise
+def start_deposit_timer(bot, user_id: int, total_seconds: int, data: dict, message_id: int, chat_id: int):
+    """Запускает таймер депозита в общем планировщике и регистрирует его в active_timers"""
+    timer = DepositTimer(bot, user_id, total_seconds, data, message_id, chat_id)
+    # Первое обновление - через секунду, как и раньше
+    handle = timer_scheduler.schedule(user_id, timer.start_time + 1, timer.tick)
+    active_timers[user_id] = handle
+    return handle
+
+def export_user_states(should_export) -> list:
+    """Забирает у этого воркера состояния пользователей, которые переходят другому (шардирование)"""
+    exported = []
+    for user_id in set(user_states) | set(pending_deposit_store.user_ids()):
+        if not should_export(user_id):
+            continue
+        handle = active_timers.pop(user_id, None)
+        if handle:
+            handle.cancel()
+        exported.append([user_id, {
+            'state': user_states.pop(user_id, None),
+            'pending': pending_deposit_store.pop(user_id)
+        }])
+    return exported
+
+def import_user_states(bot, users: list) -> None:
+    """Принимает состояния пользователей от другого воркера и перезапускает их таймеры депозита"""
+    now = time.time()
+    for user_id, snapshot in users:
+        user_id = int(user_id)
+        state = snapshot.get('state')
+        if state:
+            user_states[user_id] = state
+        pending = snapshot.get('pending')
+        if pending:
+            pending_deposit_store.set(user_id, pending['data'], pending['expires_at'])
+        
+        data = (state or {}).get('data') or {}
+        deadline = data.get('timer_deadline')
+        if deadline and deadline > now and 'timer_message_id' in data and 'timer_chat_id' in data:
+            old_handle = active_timers.pop(user_id, None)
+            if old_handle:
+                old_handle.cancel()
+            start_deposit_timer(bot, user_id, int(deadline - now), data, data['timer_message_id'], data['timer_chat_id'])
 
 async def submit_withdraw_request(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, data: dict, withdraw_amount: float) -> None:
     """Отправляет заявку на вывод"""
     try:
-        # Получаем фото QR кода в base64
-        qr_photo_base64 = None
+        # Фото QR кода передается файлом (multipart) потоком из Telegram
+        qr_file = None
         if 'qr_photo_id' in data:
-            qr_photo_base64 = await get_photo_base64(context.bot, data['qr_photo_id'])
+            qr_file = await context.bot.get_file(data['qr_photo_id'])
         
         bookmaker = data['bookmaker']
         normalized_bookmaker = bookmaker.lower()
@@ -2867,7 +3028,7 @@ async def submit_withdraw_request(update: Update, context: ContextTypes.DEFAULT_
         # Для 1xbet сначала выполняем вывод через withdraw-execute (как в клиентском сайте)
         if '1xbet' in normalized_bookmaker:
             try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
+                async with api_client(timeout=10.0) as client:
                     execute_response = await client.post(
                         f"{API_URL}/api/withdraw-execute",
                         json={
@@ -2929,17 +3090,28 @@ async def submit_withdraw_request(update: Update, context: ContextTypes.DEFAULT_
             "telegram_username": user.username,
             "telegram_first_name": user.first_name,
             "telegram_last_name": user.last_name,
-            "qr_photo": qr_photo_base64,  # Используем qr_photo как в клиентском сайте
             "site_code": data['code'],  # Используем site_code как в клиентском сайте (основное поле)
             "source": "bot"
         }
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            payment_response = await client.post(
-                f"{API_URL}/api/payment",
-                json=request_body,
-                headers={"Content-Type": "application/json"}
-            )
+        async with api_client(timeout=10.0) as client:
+            if qr_file:
+                # Поле qr_photo - как в клиентском сайте
+                payment_response = await post_with_telegram_file(
+                    get_api_client(),
+                    f"{API_URL}/api/payment",
+                    request_body,
+                    "qr_photo",
+                    qr_file.file_path,
+                    file_size=qr_file.file_size,
+                    timeout=30.0
+                )
+            else:
+                payment_response = await client.post(
+                    f"{API_URL}/api/payment",
+                    json=request_body,
+                    headers={"Content-Type": "application/json"}
+                )
             
             # Парсим JSON независимо от статуса, чтобы получить детальное сообщение об ошибке
             try:
@@ -2985,7 +3157,7 @@ async def submit_withdraw_request(update: Update, context: ContextTypes.DEFAULT_
                     # Сохраняем ID сообщения в заявке
                     if request_created_msg.message_id:
                         try:
-                            async with httpx.AsyncClient(timeout=5.0) as client2:
+                            async with api_client(timeout=5.0) as client2:
                                 await client2.patch(
                                     f"{API_URL}/api/requests/{request_id}",
                                     json={"telegram_message_id": request_created_msg.message_id}
@@ -3040,7 +3212,7 @@ async def submit_deposit_request(query, context: ContextTypes.DEFAULT_TYPE, user
             "source": "bot"  # Указываем, что заявка создана через бота
         }
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with api_client(timeout=10.0) as client:
             payment_response = await client.post(
                 f"{API_URL}/api/payment",
                 json=request_body,
@@ -3126,17 +3298,42 @@ def main() -> None:
     """Главная функция"""
     if not BOT_TOKEN or ":" not in BOT_TOKEN:
         raise ValueError("BOT_TOKEN не задан или имеет неверный формат")
+    if (WEBHOOK_URL or SHARD_ROUTER_ADDR) and not WEBHOOK_SECRET:
+        raise ValueError("LEGACY_WEBHOOK_SECRET не задан - без него любой может отправлять боту поддельные обновления")
+    if SHARD_ROUTER_ADDR and not re.fullmatch(r'[A-Za-z0-9_-]+', SHARD_WORKER_ID):
+        raise ValueError("Для воркера нужен SHARD_WORKER_ID (A-Z, a-z, 0-9, _ и -)")
     
     # Создаем приложение с post_init для загрузки настроек
     async def post_init(app: Application) -> None:
         """Загружает настройки после инициализации приложения"""
+        await init_api_client()
+        await chat_ingest_queue.start()
         logger.info("🔄 Загрузка настроек из админки...")
         try:
             await load_settings()
         except Exception as e:
             logger.warning(f"⚠️ Не удалось загрузить настройки при старте: {e}")
+        start_settings_refresher()
+    
+    async def post_shutdown(app: Application) -> None:
+        """Досылает очередь сообщений и закрывает общий HTTP-клиент при остановке приложения"""
+        await stop_settings_refresher()
+        logger.info(f"📊 Таймеры депозита при остановке: {timer_scheduler.metrics()}")
+        await timer_scheduler.stop()
+        logger.info(f"📊 Исполнитель CPU-задач при остановке: {cpu_executor.metrics()}")
+        cpu_executor.shutdown()
+        await asyncio.to_thread(pending_deposit_store.flush)
+        await chat_ingest_queue.stop()
+        await close_api_client()
     
-    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .rate_limiter(GovernorRateLimiter())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Добавляем обработчик команды /start
     application.add_handler(CommandHandler("start", start))
@@ -3159,7 +3356,29 @@ def main() -> None:
     # Запускаем бота
     print("🤖 Бот запущен!")
     logger.info("Bot started")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if SHARD_ROUTER_ADDR:
+        # Webhook держит роутер шардов, воркер получает от него только своих пользователей
+        from shard_router import run_shard_worker
+        logger.info(f"🧩 Воркер {SHARD_WORKER_ID}, роутер {SHARD_ROUTER_ADDR}")
+        run_shard_worker(
+            application, SHARD_WORKER_ID, SHARD_ROUTER_ADDR, WEBHOOK_SECRET,
+            export_user_states, import_user_states, rate_governor.set_share
+        )
+    elif WEBHOOK_URL:
+        # Запросы без правильного секрета webhook-сервер PTB отклоняет сам
+        webhook_url = WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH
+        logger.info(f"🌐 Webhook: {webhook_url} -> {WEBHOOK_HOST}:{WEBHOOK_PORT} (max_connections={WEBHOOK_MAX_CONNECTIONS})")
+        application.run_webhook(
+            listen=WEBHOOK_HOST,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH.lstrip('/'),
+            webhook_url=webhook_url,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=ALLOWED_UPDATES
+        )
+    else:
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
     main()
@@ -15,26 +15,70 @@ Pyrogram bridge for user-account chat delivery.
   API_HASH         — Telegram api_hash
   SESSION_STRING   — session_string личного аккаунта (export_session_string)
   API_BASE         — базовый URL админки, например https://pipiska.net
-  OUTBOX_POLL_SEC  — интервал опроса аутбокса (сек), по умолчанию 2
+  OUTBOX_WAIT_SEC  — long-poll: сколько сервер держит запрос к пустому аутбоксу (сек),
+                     по умолчанию 25, 0 — только опрос
+  OUTBOX_POLL_SEC  — начальный интервал опроса аутбокса без long-poll (сек), по умолчанию 2
+  OUTBOX_POLL_MIN_SEC / OUTBOX_POLL_MAX_SEC — границы адаптивного интервала (0.5 / 10)
+  OUTBOX_CONCURRENCY — сколько пользователей обслуживается параллельно, по умолчанию 8
+  OUTBOX_RETRY_SEC — пауза перед повтором неудачной отправки (сек), по умолчанию 10
+  INGEST_STREAM_MAX_MB — медиа до этого размера (МБ) стримятся в админку без диска,
+                     крупнее — через временный файл; по умолчанию 20
+  MEDIA_CACHE_DIR  — где хранить кеш file_id отправленных медиа (по умолчанию рядом со скриптом)
+  MEDIA_CACHE_MAX_MB — файлы до этого размера (МБ) скачиваются из админки и кешируются
+                     и по содержимому (sha256); по умолчанию 50
+  OUTBOX_BATCH     — сколько сообщений outbox забирать за запрос, по умолчанию 200
+  ACK_JOURNAL_FILE — журнал отправленных, но не подтвержденных сообщений (SQLite);
+                     по умолчанию bridge_outbox_acks_<BRIDGE_MODE>.db рядом со скриптом
   BRIDGE_MODE      — bot | operator (default bot)
 """
 import asyncio
+import hashlib
+import io
 import mimetypes
 import os
 import tempfile
-from typing import Optional, List
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, Optional, List, Dict, Set, Tuple
+from urllib.parse import urlparse
 
 import httpx
 from pyrogram import Client, filters
+from pyrogram.errors import FloodWait, FileReferenceExpired, MediaEmpty
 from pyrogram.types import Message
 
+from ack_journal import AckJournal
+from media_cache import MediaFileCache
+
 
 API_ID = int(os.environ.get("API_ID", "0"))
 API_HASH = os.environ.get("API_HASH", "")
 SESSION_STRING = os.environ.get("SESSION_STRING", "")
 API_BASE = os.environ.get("API_BASE", "https://pipiska.net").rstrip("/")
 OUTBOX_POLL_SEC = float(os.environ.get("OUTBOX_POLL_SEC", "2"))
+OUTBOX_POLL_MIN_SEC = float(os.environ.get("OUTBOX_POLL_MIN_SEC", "0.5"))
+OUTBOX_POLL_MAX_SEC = float(os.environ.get("OUTBOX_POLL_MAX_SEC", "10"))
+OUTBOX_WAIT_SEC = float(os.environ.get("OUTBOX_WAIT_SEC", "25"))
+OUTBOX_LONG_POLL_RETRY_SEC = 300
+# Размер пачки outbox (повторы отсекает журнал ack, сервер ограничивает 200)
+OUTBOX_BATCH = int(os.environ.get("OUTBOX_BATCH", "200"))
+ACK_BATCH = 500
+# Сколько сообщений (разным пользователям) отправляется одновременно
+OUTBOX_CONCURRENCY = int(os.environ.get("OUTBOX_CONCURRENCY", "8"))
+# Пауза перед повтором, если отправка пользователю не удалась
+OUTBOX_RETRY_SEC = float(os.environ.get("OUTBOX_RETRY_SEC", "10"))
 BRIDGE_MODE = os.environ.get("BRIDGE_MODE", "bot")  # bot | operator
+# Журнал отправленных, но не подтвержденных сообщений (id outbox свои у каждого режима)
+ACK_JOURNAL_FILE = Path(
+    os.environ.get("ACK_JOURNAL_FILE", str(Path(__file__).parent / f"bridge_outbox_acks_{BRIDGE_MODE}.db"))
+)
+# Медиа до этого размера передаются в админку потоком без временного файла
+INGEST_STREAM_MAX_BYTES = int(float(os.environ.get("INGEST_STREAM_MAX_MB", "20")) * 1024 * 1024)
+# Кеш file_id отправленных медиа и максимальный размер файла, который скачивается для хеширования
+MEDIA_CACHE_DIR = Path(os.environ.get("MEDIA_CACHE_DIR", str(Path(__file__).parent)))
+MEDIA_CACHE_MAX_BYTES = int(float(os.environ.get("MEDIA_CACHE_MAX_MB", "50")) * 1024 * 1024)
+MEDIA_DEFAULT_EXT = {"photo": ".jpg", "video": ".mp4", "voice": ".ogg", "audio": ".mp3"}
 
 if not (API_ID and API_HASH and SESSION_STRING and API_BASE):
     raise RuntimeError("Set API_ID, API_HASH, SESSION_STRING, API_BASE env vars")
@@ -47,6 +91,11 @@ app = Client(
     session_string=SESSION_STRING,
     in_memory=True,
 )
+media_cache: Optional[MediaFileCache] = None
+ack_journal: Optional[AckJournal] = None
+_ack_wakeup: Optional[asyncio.Event] = None
+# (kind, media_url) -> future, пока файл загружается в Telegram первый раз
+_media_uploads: Dict[Tuple[str, str], asyncio.Future] = {}
 
 
 async def send_ingest_text(user_id: int, text: str, telegram_message_id: int):
@@ -65,6 +114,14 @@ async def send_ingest_text(user_id: int, text: str, telegram_message_id: int):
         print(f"[ingest] failed {r.status_code}: {r.text[:200]}")
 
 
+def _ingest_upload_url(user_id: int) -> str:
+    return (
+        f"{API_BASE}/api/users/{user_id}/chat/ingest-upload"
+        if BRIDGE_MODE == "bot"
+        else f"{API_BASE}/api/operator-chat/ingest-upload/{user_id}"
+    )
+
+
 async def send_ingest_upload(
     user_id: int,
     file_path: str,
@@ -72,23 +129,62 @@ async def send_ingest_upload(
     mime: Optional[str],
     telegram_message_id: int,
 ):
-    url = (
-        f"{API_BASE}/api/users/{user_id}/chat/ingest-upload"
-        if BRIDGE_MODE == "bot"
-        else f"{API_BASE}/api/operator-chat/ingest-upload/{user_id}"
-    )
     filename = os.path.basename(file_path)
     mime_type = mime or (mimetypes.guess_type(filename)[0] or "application/octet-stream")
     files = {"file": (filename, open(file_path, "rb"), mime_type)}
     data = {"message": message or "", "telegram_message_id": str(telegram_message_id)}
     try:
-        r = await http.post(url, data=data, files=files)
+        r = await http.post(_ingest_upload_url(user_id), data=data, files=files)
         if r.status_code >= 400:
             print(f"[ingest-upload] failed {r.status_code}: {r.text[:200]}")
     finally:
         files["file"][1].close()
 
 
+async def _multipart_body(
+    boundary: str,
+    fields: Dict[str, str],
+    filename: str,
+    mime: str,
+    chunks: AsyncIterator[bytes],
+):
+    for name, value in fields.items():
+        yield (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+        ).encode() + value.encode("utf-8") + b"\r\n"
+    safe_name = filename.replace("\\", "\\\\").replace('"', "%22").replace("\r", "").replace("\n", "")
+    yield (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{safe_name}"\r\n'
+        f"Content-Type: {mime}\r\n\r\n"
+    ).encode("utf-8")
+    async for chunk in chunks:
+        yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+async def send_ingest_stream(
+    user_id: int,
+    chunks: AsyncIterator[bytes],
+    filename: str,
+    message: Optional[str],
+    mime: str,
+    telegram_message_id: int,
+):
+    """
+    Multipart-загрузка без временного файла: куски из stream_media сразу уходят
+    в тело запроса (chunked), в памяти одновременно держится один кусок.
+    """
+    boundary = uuid.uuid4().hex
+    fields = {"message": message or "", "telegram_message_id": str(telegram_message_id)}
+    r = await http.post(
+        _ingest_upload_url(user_id),
+        content=_multipart_body(boundary, fields, filename, mime, chunks),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    if r.status_code >= 400:
+        print(f"[ingest-upload] failed {r.status_code}: {r.text[:200]}")
+
+
 def detect_message_type(msg: Message) -> str:
     if msg.photo:
         return "photo"
@@ -117,94 +213,361 @@ async def handle_incoming(_: Client, msg: Message):
         return
 
     # Медиа
+    media = getattr(msg, mtype, None)
+    if media is None:
+        return
+    mime = getattr(media, "mime_type", None)
+    filename = getattr(media, "file_name", None)
+    if not filename:
+        ext = MEDIA_DEFAULT_EXT.get(mtype) or (mimetypes.guess_extension(mime) if mime else None) or ""
+        filename = f"{mtype}_{tg_id}{ext}"
+    mime = mime or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    size = getattr(media, "file_size", None) or 0
+
+    if 0 < size <= INGEST_STREAM_MAX_BYTES:
+        try:
+            await send_ingest_stream(user_id, app.stream_media(msg), filename, text, mime, tg_id)
+        except Exception as e:
+            print(f"[ingest-upload] stream failed for {user_id}: {e}")
+        return
+
+    # Большие файлы (или неизвестный размер) - через диск: загрузка из Telegram
+    # не зависит от скорости админки, а оборванная отправка не теряет скачанное
     with tempfile.TemporaryDirectory() as tmpdir:
-        file_path = await msg.download(file_name=tmpdir)
-        mime = None
-        if msg.document and msg.document.mime_type:
-            mime = msg.document.mime_type
-        elif msg.audio and msg.audio.mime_type:
-            mime = msg.audio.mime_type
-        elif msg.video and msg.video.mime_type:
-            mime = msg.video.mime_type
-        elif msg.voice and msg.voice.mime_type:
-            mime = msg.voice.mime_type
+        file_path = await msg.download(file_name=os.path.join(tmpdir, os.path.basename(filename)))
         await send_ingest_upload(user_id, file_path, text, mime, tg_id)
 
 
-async def poll_outbox():
-    while True:
+def _outbox_url(wait: float = 0) -> str:
+    url = (
+        f"{API_BASE}/api/chat/outbox?limit={OUTBOX_BATCH}&channel=bot"
+        if BRIDGE_MODE == "bot"
+        else f"{API_BASE}/api/operator-chat/outbox?limit={OUTBOX_BATCH}"
+    )
+    if wait > 0:
+        url += f"&wait={wait:g}"
+    return url
+
+
+async def fetch_outbox(wait: float = 0):
+    """
+    Забирает пачку из outbox. При wait > 0 сервер держит запрос, пока не появится
+    сообщение (long-poll). Возвращает (items, long_poll_supported).
+    """
+    timeout = wait + 10 if wait > 0 else http.timeout
+    r = await http.get(_outbox_url(wait), timeout=timeout)
+    if r.status_code != 200:
+        raise RuntimeError(f"http {r.status_code}: {r.text[:200]}")
+    data = r.json()
+    items: List[dict] = data.get("data", {}).get("messages", [])
+    return items, r.headers.get("X-Outbox-Long-Poll") == "1"
+
+
+async def _send_media(uid: int, kind: str, media, caption: Optional[str]):
+    if kind == "photo":
+        return await app.send_photo(uid, media, caption=caption)
+    if kind == "video":
+        return await app.send_video(uid, media, caption=caption)
+    if kind == "voice":
+        return await app.send_voice(uid, media, caption=caption)
+    if kind == "audio":
+        return await app.send_audio(uid, media, caption=caption)
+    return await app.send_document(uid, media, caption=caption)
+
+
+async def load_outbox_media(media_url: str):
+    """
+    Скачивает файл из админки в память и считает sha256 - одинаковый файл,
+    загруженный оператором под другим url, тоже найдется в кеше.
+    Возвращает (что передать в Pyrogram, ключ по содержимому или None).
+    """
+    url = f"{API_BASE}{media_url}" if media_url.startswith("/") else media_url
+    if not url.startswith(("http://", "https://")):
+        return media_url, None
+    async with http.stream("GET", url) as r:
+        if r.status_code != 200:
+            raise RuntimeError(f"media http {r.status_code}: {url}")
+        if int(r.headers.get("Content-Length") or 0) > MEDIA_CACHE_MAX_BYTES:
+            # Слишком большой для памяти - Telegram скачает сам по ссылке
+            return url, None
+        buf = io.BytesIO()
+        digest = hashlib.sha256()
+        async for chunk in r.aiter_bytes():
+            if buf.tell() + len(chunk) > MEDIA_CACHE_MAX_BYTES:
+                return url, None
+            buf.write(chunk)
+            digest.update(chunk)
+    buf.seek(0)
+    # Pyrogram берет имя файла из .name
+    buf.name = os.path.basename(urlparse(url).path) or "file"
+    return buf, f"sha256:{digest.hexdigest()}"
+
+
+async def send_cached_media(uid: int, kind: str, media_url: str, caption: Optional[str]):
+    """
+    Отправка медиа через кеш file_id: повторная отправка того же файла
+    (шаблонные картинки, видео-инструкции) - пересылка внутри Telegram.
+    """
+    upload_key = (kind, media_url)
+    pending = _media_uploads.get(upload_key)
+    if pending is not None:
+        # Этот файл уже загружается для другого пользователя - ждем его file_id
+        await pending
+
+    file_id = media_cache.get(kind, media_url) if media_cache is not None else None
+    if file_id:
         try:
-            outboxUrl = (
-                f"{API_BASE}/api/chat/outbox?limit=50&channel=bot"
-                if BRIDGE_MODE == "bot"
-                else f"{API_BASE}/api/operator-chat/outbox?limit=50"
-            )
-            r = await http.get(outboxUrl)
-            if r.status_code != 200:
-                print(f"[outbox] http {r.status_code}: {r.text[:200]}")
-                await asyncio.sleep(OUTBOX_POLL_SEC)
+            return await _send_media(uid, kind, file_id, caption)
+        except (FileReferenceExpired, MediaEmpty, ValueError) as e:
+            print(f"[media-cache] file_id устарел ({e}), загружаем заново")
+            media_cache.drop(file_id)
+
+    upload = asyncio.get_running_loop().create_future()
+    _media_uploads.setdefault(upload_key, upload)
+    try:
+        source, content_key = await load_outbox_media(media_url)
+        file_id = media_cache.get(kind, content_key) if media_cache is not None else None
+        if file_id:
+            try:
+                sent_msg = await _send_media(uid, kind, file_id, caption)
+                media_cache.put(kind, [media_url], file_id)
+                return sent_msg
+            except (FileReferenceExpired, MediaEmpty, ValueError) as e:
+                print(f"[media-cache] file_id устарел ({e}), загружаем заново")
+                media_cache.drop(file_id)
+                if hasattr(source, "seek"):
+                    source.seek(0)
+
+        sent_msg = await _send_media(uid, kind, source, caption)
+        file_id = getattr(getattr(sent_msg, kind, None), "file_id", None)
+        if file_id and media_cache is not None:
+            media_cache.put(kind, [media_url, content_key], file_id)
+        return sent_msg
+    finally:
+        if _media_uploads.get(upload_key) is upload:
+            del _media_uploads[upload_key]
+        upload.set_result(None)
+
+
+async def send_outbox_item(uid: int, item: dict):
+    mtype = item.get("messageType", "text")
+    text = item.get("messageText") or ""
+    media_url = item.get("mediaUrl")
+
+    if mtype == "text":
+        return await app.send_message(uid, text)
+    if media_url:
+        kind = mtype if mtype in ("photo", "video", "voice", "audio") else "document"
+        return await send_cached_media(uid, kind, media_url, text or None)
+    # fallback: send text if no media
+    return await app.send_message(uid, text or "[no content]")
+
+
+async def ack_outbox(ack_list: List[dict]):
+    ackUrl = (
+        f"{API_BASE}/api/chat/outbox/ack"
+        if BRIDGE_MODE == "bot"
+        else f"{API_BASE}/api/operator-chat/outbox/ack"
+    )
+    try:
+        ack_resp = await http.post(ackUrl, json={"messages": ack_list})
+        if ack_resp.status_code >= 400:
+            print(f"[ack] failed {ack_resp.status_code}: {ack_resp.text[:200]}")
+            return False
+        return True
+    except Exception as e:
+        print(f"[ack] error: {e}")
+        return False
+
+
+def request_ack():
+    if _ack_wakeup is not None:
+        _ack_wakeup.set()
+
+
+async def ack_loop():
+    """
+    Отправляет ack из журнала: сразу после отправки сообщений (одновременные
+    отправки подтверждаются одним запросом), после ошибки - повторяет с
+    растущей паузой, при старте - досылает то, что не дошло до падения.
+    """
+    retry_delay = OUTBOX_POLL_MIN_SEC
+    while True:
+        if not len(ack_journal):
+            retry_delay = OUTBOX_POLL_MIN_SEC
+            await _ack_wakeup.wait()
+        _ack_wakeup.clear()
+        batch = ack_journal.pending(ACK_BATCH)
+        if await ack_outbox(batch):
+            ack_journal.confirm(entry["id"] for entry in batch)
+            retry_delay = OUTBOX_POLL_MIN_SEC
+            continue
+        print(f"[ack] {len(ack_journal)} без подтверждения, повтор через {retry_delay:g}s")
+        # Новые записи попадут в следующую попытку - не будим цикл раньше паузы
+        await asyncio.sleep(retry_delay)
+        retry_delay = min(retry_delay * 2, OUTBOX_POLL_MAX_SEC * 6)
+
+
+class OutboxDispatcher:
+    """
+    Отправка outbox: сообщения разным пользователям уходят параллельно
+    (не больше OUTBOX_CONCURRENCY одновременно), одному пользователю - строго
+    по порядку. Каждое сообщение подтверждается сразу после отправки, поэтому
+    медленная загрузка медиа не задерживает ответы остальным.
+    """
+
+    def __init__(self, concurrency: int):
+        self.slots = asyncio.Semaphore(max(concurrency, 1))
+        self.queues: Dict[int, deque] = {}
+        # id сообщений, которые уже в очереди/отправляются (outbox вернет их снова до ack)
+        self.inflight: Set[str] = set()
+        # user_id после неудачной отправки -> время, раньше которого его сообщения не берем
+        self.retry_at: Dict[int, float] = {}
+        self.flood_until = 0.0
+        self.progress = asyncio.Event()
+
+    def submit(self, items: List[dict]) -> int:
+        """Ставит новые сообщения в очереди пользователей, возвращает сколько добавлено"""
+        now = asyncio.get_running_loop().time()
+        added = 0
+        for item in items:
+            msg_id = item["id"]
+            uid = int(item["userId"])
+            if ack_journal.seen(msg_id):
+                # Уже отправлено - outbox вернул его, потому что ack еще не дошел (повторит ack_loop)
                 continue
-            data = r.json()
-            items: List[dict] = data.get("data", {}).get("messages", [])
-            if not items:
-                await asyncio.sleep(OUTBOX_POLL_SEC)
+            if msg_id in self.inflight or self.retry_at.get(uid, 0) > now:
                 continue
+            self.retry_at.pop(uid, None)
+            self.inflight.add(msg_id)
+            queue = self.queues.get(uid)
+            if queue is None:
+                queue = self.queues[uid] = deque()
+                asyncio.create_task(self._run_user(uid, queue))
+            queue.append(item)
+            added += 1
+        return added
 
-            ack_list = []
-            for item in items:
-                uid = int(item["userId"])
-                mtype = item.get("messageType", "text")
-                text = item.get("messageText") or ""
-                media_url = item.get("mediaUrl")
+    async def wait_progress(self, timeout: float):
+        """Ждет, пока какое-нибудь сообщение отправится (или таймаут)"""
+        self.progress.clear()
+        try:
+            await asyncio.wait_for(self.progress.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
 
-                sent_msg = None
+    async def _run_user(self, uid: int, queue: deque):
+        try:
+            while queue:
+                item = queue[0]
+                ok = await self._send(uid, item)
+                queue.popleft()
+                self.inflight.discard(item["id"])
+                if not ok:
+                    # Сообщения пользователя вернутся из outbox целиком после паузы - порядок сохранится
+                    self.retry_at[uid] = asyncio.get_running_loop().time() + OUTBOX_RETRY_SEC
+                    for rest in queue:
+                        self.inflight.discard(rest["id"])
+                    queue.clear()
+                self.progress.set()
+        finally:
+            self.queues.pop(uid, None)
+
+    async def _send(self, uid: int, item: dict) -> bool:
+        loop = asyncio.get_running_loop()
+        async with self.slots:
+            for _ in range(3):
+                # FloodWait общий для аккаунта - ждут все отправители
+                delay = self.flood_until - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
                 try:
-                    if mtype == "text":
-                        sent_msg = await app.send_message(uid, text)
-                    elif mtype == "photo" and media_url:
-                        sent_msg = await app.send_photo(uid, media_url, caption=text or None)
-                    elif mtype == "video" and media_url:
-                        sent_msg = await app.send_video(uid, media_url, caption=text or None)
-                    elif mtype in ("audio", "voice") and media_url:
-                        if mtype == "voice":
-                            sent_msg = await app.send_voice(uid, media_url, caption=text or None)
-                        else:
-                            sent_msg = await app.send_audio(uid, media_url, caption=text or None)
-                    elif media_url:
-                        sent_msg = await app.send_document(uid, media_url, caption=text or None)
-                    else:
-                        # fallback: send text if no media
-                        sent_msg = await app.send_message(uid, text or "[no content]")
+                    sent_msg = await send_outbox_item(uid, item)
+                    break
+                except FloodWait as e:
+                    print(f"[outbox] flood wait {e.value}s (user {uid})")
+                    self.flood_until = max(self.flood_until, loop.time() + e.value)
                 except Exception as e:
                     print(f"[outbox] send failed for {uid}: {e}")
-                    continue
+                    return False
+            else:
+                return False
 
-                if sent_msg:
-                    ack_list.append(
-                        {
-                          "id": item["id"],
-                          "telegram_message_id": str(sent_msg.id),
-                          "media_url": media_url,
-                        }
-                    )
-
-            if ack_list:
-                ackUrl = (
-                    f"{API_BASE}/api/chat/outbox/ack"
-                    if BRIDGE_MODE == "bot"
-                    else f"{API_BASE}/api/operator-chat/outbox/ack"
-                )
-                ack_resp = await http.post(ackUrl, json={"messages": ack_list})
-                if ack_resp.status_code >= 400:
-                    print(f"[ack] failed {ack_resp.status_code}: {ack_resp.text[:200]}")
+        if sent_msg:
+            # Сначала журнал, потом ack: после падения сообщение не уйдет второй раз
+            ack_journal.record(
+                {
+                  "id": item["id"],
+                  "telegram_message_id": str(sent_msg.id),
+                  "media_url": item.get("mediaUrl"),
+                }
+            )
+            request_ack()
+        return True
+
+
+async def poll_outbox():
+    """
+    Long-poll, если админка его поддерживает (заголовок X-Outbox-Long-Poll):
+    ответ приходит сразу после появления сообщения, пустые опросы не нужны.
+    Иначе - адаптивный опрос: пока сообщения идут, интервал OUTBOX_POLL_MIN_SEC,
+    в простое он растет до OUTBOX_POLL_MAX_SEC. Long-poll перепроверяется
+    каждые OUTBOX_LONG_POLL_RETRY_SEC (например, после обновления админки).
+    """
+    loop = asyncio.get_running_loop()
+    dispatcher = OutboxDispatcher(OUTBOX_CONCURRENCY)
+    long_poll = OUTBOX_WAIT_SEC > 0
+    next_probe = 0.0
+    interval = OUTBOX_POLL_SEC
+    while True:
+        try:
+            if long_poll:
+                items, supported = await fetch_outbox(OUTBOX_WAIT_SEC)
+                if not supported:
+                    print("[outbox] long-poll не поддерживается сервером, переходим на опрос")
+                    long_poll = False
+                    next_probe = loop.time() + OUTBOX_LONG_POLL_RETRY_SEC
+                if items:
+                    if not dispatcher.submit(items):
+                        # Все уже отправляются (outbox отдает их до ack) - ждем, пока что-то уйдет
+                        await dispatcher.wait_progress(OUTBOX_POLL_SEC)
+                elif not supported:
+                    await asyncio.sleep(interval)
+                # Пустой ответ long-poll - просто ждем снова
+                continue
+
+            items, supported = await fetch_outbox()
+            if supported and OUTBOX_WAIT_SEC > 0 and loop.time() >= next_probe:
+                print("[outbox] сервер поддерживает long-poll, переключаемся")
+                long_poll = True
+            if items:
+                if dispatcher.submit(items) and len(items) >= OUTBOX_BATCH:
+                    # Outbox не разобран до конца - сразу следующая пачка
+                    continue
+                interval = OUTBOX_POLL_MIN_SEC
+            else:
+                interval = min(max(interval, OUTBOX_POLL_MIN_SEC) * 1.5, OUTBOX_POLL_MAX_SEC)
+            if long_poll:
+                continue
         except Exception as e:
             print(f"[outbox] loop error: {e}")
-        await asyncio.sleep(OUTBOX_POLL_SEC)
+            # Ошибка сети/сервера - не долбим админку, увеличиваем паузу
+            interval = min(max(interval, OUTBOX_POLL_SEC) * 2, OUTBOX_POLL_MAX_SEC)
+        await asyncio.sleep(interval)
 
 
 async def main():
+    global media_cache, ack_journal, _ack_wakeup
+    ack_journal = AckJournal(ACK_JOURNAL_FILE)
+    _ack_wakeup = asyncio.Event()
+    # Досылаем ack, не дошедшие до остановки
+    _ack_wakeup.set()
+    asyncio.create_task(ack_loop())
     # Запускаем клиента и обработчик входящих
     await app.start()
+    # file_id действительны только для своего аккаунта - кеш на аккаунт
+    me = await app.get_me()
+    media_cache = MediaFileCache(MEDIA_CACHE_DIR / f"bridge_media_cache_{me.id}.db")
     app.add_handler(filters.private & ~filters.bot, handle_incoming)
     asyncio.create_task(poll_outbox())
     print("✅ Bridge started. Listening for messages...")
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+📨 Асинхронная очередь сохранения сообщений пользователей в чат админки
+
+Обработчик только ставит сообщение в очередь и сразу возвращается, а фоновый
+воркер пачками отправляет их в /api/users/{user_id}/chat/ingest:
+- сообщения разных пользователей уходят параллельно по одному пулу соединений,
+  сообщения одного пользователя - последовательно;
+- временные ошибки (таймаут, сеть, 429, 5xx) повторяются с экспоненциальной задержкой,
+  пока сообщение ждет повтора, следующие сообщения того же пользователя ждут за ним;
+- при переполнении очереди и при остановке необработанное сохраняется в spill-файл;
+  воркер дочитывает его, когда в очереди освобождается место (и при следующем запуске),
+  пока у пользователя есть сообщения на диске, его новые сообщения встают за ними.
+
+Эндпоинт ingest идемпотентен по telegram_message_id, поэтому повтор безопасен.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from pathlib import Path
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Set
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "5000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "10"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "8"))
+INGEST_BACKOFF_BASE = float(os.getenv("INGEST_BACKOFF_BASE", "1"))
+INGEST_BACKOFF_MAX = float(os.getenv("INGEST_BACKOFF_MAX", "60"))
+INGEST_TIMEOUT = float(os.getenv("INGEST_TIMEOUT", "10"))
+
+
+class _RetryableIngestError(Exception):
+    """Временная ошибка ingest, которую имеет смысл повторить"""
+
+
+class ChatIngestQueue:
+    """Ограниченная очередь с фоновым воркером и spill-файлом на диске"""
+
+    def __init__(
+        self,
+        api_url: str,
+        spill_file: Path,
+        client_factory: Optional[Callable[[], httpx.AsyncClient]] = None,
+    ):
+        self.api_url = api_url
+        self.spill_file = Path(spill_file)
+        # Если фабрика не передана - очередь создает и закрывает свой клиент сама
+        self._client_factory = client_factory
+        self._own_client: Optional[httpx.AsyncClient] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # user_id -> сообщения, ждущие повтора (первое - упавшее, за ним - более новые)
+        self._held: Dict[int, deque] = OrderedDict()
+        # user_id -> еще не отправленные сообщения текущей пачки
+        self._inflight: Dict[int, List[dict]] = OrderedDict()
+        # Пользователи, у которых есть сообщения в spill-файле
+        self._spilled_users: Set[int] = set()
+        self.stats = {"enqueued": 0, "sent": 0, "retried": 0, "dropped": 0, "spilled": 0}
+
+    # ---------- жизненный цикл ----------
+
+    async def start(self) -> None:
+        """Запускает воркер и дочитывает сообщения, сохраненные на диск при прошлой остановке"""
+        if self._worker and not self._worker.done():
+            return
+        self._queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+        restored = self._restore_spill()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(f"✅ Очередь chat/ingest запущена (восстановлено из spill-файла: {restored})")
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Пытается дослать очередь за timeout секунд, остаток сохраняет на диск"""
+        if not self._worker:
+            return
+        # Отложенные повторы не ждем (при недоступной админке они не уйдут) - они сохранятся на диск
+        deadline = time.time() + timeout
+        while (self._inflight or not self._queue.empty()) and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        # Порядок пользователя сохраняется: сначала недосланное из пачки, затем отложенное, затем очередь
+        leftover = []
+        for items in self._inflight.values():
+            leftover.extend(items)
+        self._inflight.clear()
+        for items in self._held.values():
+            leftover.extend(items)
+        self._held.clear()
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if leftover:
+            self._spill(leftover)
+            logger.info(f"⏹️ Очередь chat/ingest остановлена, {len(leftover)} сообщений сохранено на диск")
+        if self._own_client is not None:
+            await self._own_client.aclose()
+            self._own_client = None
+
+    # ---------- публичный API ----------
+
+    def enqueue(
+        self,
+        user_id: int,
+        message_text: str,
+        message_type: str = "text",
+        media_url: Optional[str] = None,
+        telegram_message_id: Optional[int] = None,
+    ) -> None:
+        """Ставит сообщение в очередь без ожидания сети"""
+        item = {
+            "user_id": user_id,
+            "payload": {
+                "message_text": message_text,
+                "message_type": message_type,
+                "media_url": media_url,
+                "telegram_message_id": telegram_message_id,
+            },
+            "attempts": 0,
+            "not_before": 0.0,
+        }
+        self.stats["enqueued"] += 1
+        if self._queue is None:
+            # Воркер еще не запущен - не теряем сообщение
+            self._spill([item])
+            return
+        if user_id in self._spilled_users:
+            # Более ранние сообщения пользователя на диске - встаем за ними
+            self._spill([item])
+            return
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            logger.warning(f"⚠️ Очередь chat/ingest переполнена, сообщение пользователя {user_id} сохранено на диск")
+            self._spill([item])
+
+    # ---------- воркер ----------
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client_factory is not None:
+            return self._client_factory()
+        if self._own_client is None or self._own_client.is_closed:
+            self._own_client = httpx.AsyncClient(
+                timeout=INGEST_TIMEOUT,
+                limits=httpx.Limits(max_keepalive_connections=INGEST_CONCURRENCY),
+            )
+        return self._own_client
+
+    async def _run(self) -> None:
+        semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+        while True:
+            if self._spilled_users and self._queue.qsize() <= self._queue.maxsize // 2:
+                restored = self._restore_spill()
+                if restored:
+                    logger.info(f"📥 Очередь chat/ingest: из spill-файла дочитано {restored} сообщений")
+            batch = await self._next_batch()
+            try:
+                await self._send_batch(batch, semaphore)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка воркера chat/ingest: {e}", exc_info=True)
+
+    async def _next_batch(self) -> List[dict]:
+        """Ждет новые сообщения или наступление ближайшего повтора, забирает до INGEST_BATCH_SIZE из очереди"""
+        batch = []
+        while True:
+            timeout = None
+            if self._held:
+                timeout = min(items[0]["not_before"] for items in self._held.values()) - time.time()
+                if timeout <= 0:
+                    break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                self._queue.task_done()
+                break
+            except asyncio.TimeoutError:
+                continue
+        while len(batch) < INGEST_BATCH_SIZE and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+            self._queue.task_done()
+        return batch
+
+    def _hold(self, user_id: int, items) -> None:
+        """Откладывает сообщения пользователя на повтор (новые встают за уже отложенными)"""
+        self._held.setdefault(user_id, deque()).extend(items)
+
+    async def _send_batch(self, batch: List[dict], semaphore: asyncio.Semaphore) -> None:
+        """
+        Группирует пачку по пользователям: внутри пользователя - по порядку, между - параллельно.
+        Сообщения пользователя с отложенным повтором встают за ним и ждут его.
+        """
+        now = time.time()
+        for user_id in list(self._held):
+            items = self._held[user_id]
+            if items[0]["not_before"] <= now:
+                del self._held[user_id]
+                self._inflight[user_id] = list(items)
+        for item in batch:
+            user_id = item["user_id"]
+            if user_id in self._held:
+                self._held[user_id].append(item)
+            else:
+                self._inflight.setdefault(user_id, []).append(item)
+
+        async def send_user_items(user_id: int, items: List[dict]) -> None:
+            while items:
+                async with semaphore:
+                    ok = await self._send_one(items[0])
+                if not ok:
+                    # Упавшее сообщение и хвост этого пользователя ждут повтора вместе
+                    self._hold(user_id, items)
+                    break
+                items.pop(0)
+            self._inflight.pop(user_id, None)
+
+        if self._inflight:
+            results = await asyncio.gather(
+                *(send_user_items(user_id, items) for user_id, items in list(self._inflight.items())),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"❌ Ошибка воркера chat/ingest: {result}")
+            # Недосланное после ошибки не теряем - ждет повтора
+            for user_id, items in list(self._inflight.items()):
+                self._hold(user_id, items)
+            self._inflight.clear()
+
+    async def _send_one(self, item: dict) -> bool:
+        """Отправляет одно сообщение. False - сообщение отложено на повтор"""
+        user_id = item["user_id"]
+        try:
+            response = await self._get_client().post(
+                f"{self.api_url}/api/users/{user_id}/chat/ingest",
+                json=item["payload"],
+                headers={"Content-Type": "application/json"},
+                timeout=INGEST_TIMEOUT,
+            )
+            if response.status_code == 429 or response.status_code >= 500:
+                raise _RetryableIngestError(f"HTTP {response.status_code}")
+            if response.status_code == 200:
+                try:
+                    response_data = response.json()
+                    if response_data.get("success"):
+                        logger.info(f"✅ Сообщение от пользователя {user_id} сохранено в чат (ID: {response_data.get('messageId')})")
+                    else:
+                        logger.warning(f"⚠️ API вернул success=false: {response_data.get('error')}")
+                except Exception as parse_error:
+                    logger.warning(f"⚠️ Не удалось распарсить ответ API: {parse_error}")
+            else:
+                # 4xx - повтор не поможет
+                logger.error(f"❌ Ошибка API при сохранении сообщения: {response.status_code} - {response.text[:200]}")
+            self.stats["sent"] += 1
+            return True
+        except (httpx.TimeoutException, httpx.NetworkError, _RetryableIngestError) as e:
+            item["attempts"] += 1
+            if item["attempts"] >= INGEST_MAX_ATTEMPTS:
+                logger.error(f"❌ Сообщение пользователя {user_id} не сохранено после {item['attempts']} попыток: {e}")
+                self.stats["dropped"] += 1
+                return True
+            delay = min(INGEST_BACKOFF_MAX, INGEST_BACKOFF_BASE * (2 ** (item["attempts"] - 1)))
+            item["not_before"] = time.time() + delay
+            self.stats["retried"] += 1
+            logger.warning(f"⚠️ Сохранение сообщения пользователя {user_id} не удалось ({e}), повтор через {delay:.0f} сек")
+            return False
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка при сохранении сообщения в чат (не критично): {e}")
+            self.stats["dropped"] += 1
+            return True
+
+    # ---------- spill-файл ----------
+
+    def _spill(self, items: List[dict], count: bool = True) -> None:
+        """Дописывает сообщения в spill-файл (JSON Lines). count=False - возврат уже учтенного остатка"""
+        try:
+            self.spill_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.spill_file, "a", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            if count:
+                self.stats["spilled"] += len(items)
+            self._spilled_users.update(item["user_id"] for item in items)
+        except Exception as e:
+            logger.error(f"❌ Не удалось сохранить {len(items)} сообщений в spill-файл: {e}")
+            self.stats["dropped"] += len(items)
+
+    def _restore_spill(self) -> int:
+        """
+        Возвращает в очередь сообщения из spill-файла (сколько поместится) и удаляет файл.
+        Остаток записывается обратно в прежнем порядке
+        """
+        if not self.spill_file.exists():
+            self._spilled_users.clear()
+            return 0
+        restored = 0
+        overflow = []
+        try:
+            with open(self.spill_file, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            self.spill_file.unlink()
+            self._spilled_users.clear()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать spill-файл очереди chat/ingest: {e}")
+            return 0
+        for line in lines:
+            try:
+                item = json.loads(line)
+            except Exception:
+                continue
+            item["not_before"] = 0.0
+            if overflow:
+                # Очередь заполнена - остаток (и порядок пользователей в нем) остается на диске
+                overflow.append(item)
+                continue
+            try:
+                self._queue.put_nowait(item)
+                restored += 1
+            except asyncio.QueueFull:
+                overflow.append(item)
+        if overflow:
+            self._spill(overflow, count=False)
+        return restored
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+⚙️ Исполнитель CPU-задач (PIL, QR и т.п.) вне event loop
+
+- пул потоков (по умолчанию) или процессов (CPU_EXECUTOR_PROCESSES=1);
+- ограниченная очередь: одновременно в работе и в ожидании не больше
+  CPU_EXECUTOR_WORKERS + CPU_EXECUTOR_QUEUE задач, остальные ждут места
+  не дольше CPU_EXECUTOR_QUEUE_TIMEOUT и получают ExecutorBusy
+  (обработчик показывает упрощенный ответ вместо зависания);
+- метрики по каждому виду задач: ожидание в очереди, время выполнения, отказы.
+
+Функции для пула процессов должны быть определены на уровне модуля
+и принимать/возвращать picklable-значения (например, bytes).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(min(4, os.cpu_count() or 1))))
+CPU_EXECUTOR_QUEUE = int(os.getenv("CPU_EXECUTOR_QUEUE", "32"))
+CPU_EXECUTOR_QUEUE_TIMEOUT = float(os.getenv("CPU_EXECUTOR_QUEUE_TIMEOUT", "5"))
+CPU_EXECUTOR_PROCESSES = os.getenv("CPU_EXECUTOR_PROCESSES", "0").lower() in ("1", "true", "yes")
+
+# Как часто писать метрики в лог (секунд)
+METRICS_LOG_INTERVAL = 300
+
+
+class ExecutorBusy(Exception):
+    """Очередь исполнителя заполнена - задача не принята"""
+
+
+def _timed_call(fn: Callable, args: tuple):
+    """Выполняет задачу в воркере и возвращает (результат, время выполнения)"""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class CPUExecutor:
+    """Пул для CPU-задач с ограниченной очередью и метриками"""
+
+    def __init__(
+        self,
+        name: str = "cpu",
+        max_workers: int = CPU_EXECUTOR_WORKERS,
+        max_queue: int = CPU_EXECUTOR_QUEUE,
+        queue_timeout: float = CPU_EXECUTOR_QUEUE_TIMEOUT,
+        use_processes: bool = CPU_EXECUTOR_PROCESSES
+    ):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.use_processes = use_processes
+        self._pool: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._last_metrics_log = time.monotonic()
+
+    def _ensure_pool(self) -> Executor:
+        if self._pool is None:
+            if self.use_processes:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+            logger.info(f"✅ Исполнитель {self.name}: {'процессы' if self.use_processes else 'потоки'} x{self.max_workers}, очередь {self.max_queue}")
+        return self._pool
+
+    def _job_stats(self, job_name: str) -> Dict[str, float]:
+        stats = self._stats.get(job_name)
+        if stats is None:
+            stats = {'count': 0, 'errors': 0, 'rejected': 0, 'wait_total': 0.0, 'wait_max': 0.0, 'run_total': 0.0, 'run_max': 0.0}
+            self._stats[job_name] = stats
+        return stats
+
+    async def submit(self, fn: Callable, *args: Any, job_name: Optional[str] = None) -> Any:
+        """Выполняет fn(*args) в пуле. ExecutorBusy - если место в очереди не освободилось вовремя"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        job_name = job_name or getattr(fn, "__name__", "job")
+        stats = self._job_stats(job_name)
+        queued_at = time.perf_counter()
+
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            stats['rejected'] += 1
+            logger.warning(f"⚠️ Исполнитель {self.name} перегружен: задача {job_name} отклонена (в очереди {self._pending})")
+            raise ExecutorBusy(job_name)
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, run_time = await loop.run_in_executor(self._ensure_pool(), _timed_call, fn, args)
+        except Exception:
+            stats['errors'] += 1
+            raise
+        finally:
+            self._pending -= 1
+            self._slots.release()
+
+        # Ожидание = все время без выполнения (очередь семафора + очередь пула)
+        wait_time = max(0.0, time.perf_counter() - queued_at - run_time)
+        stats['count'] += 1
+        stats['wait_total'] += wait_time
+        stats['wait_max'] = max(stats['wait_max'], wait_time)
+        stats['run_total'] += run_time
+        stats['run_max'] = max(stats['run_max'], run_time)
+        self._maybe_log_metrics()
+        return result
+
+    def metrics(self) -> dict:
+        """Метрики по видам задач (миллисекунды)"""
+        result = {'pending': self._pending}
+        for job_name, stats in self._stats.items():
+            count = stats['count'] or 1
+            result[job_name] = {
+                'count': int(stats['count']),
+                'errors': int(stats['errors']),
+                'rejected': int(stats['rejected']),
+                'wait_avg_ms': round(stats['wait_total'] / count * 1000, 1),
+                'wait_max_ms': round(stats['wait_max'] * 1000, 1),
+                'run_avg_ms': round(stats['run_total'] / count * 1000, 1),
+                'run_max_ms': round(stats['run_max'] * 1000, 1),
+            }
+        return result
+
+    def _maybe_log_metrics(self) -> None:
+        now = time.monotonic()
+        if now - self._last_metrics_log < METRICS_LOG_INTERVAL:
+            return
+        self._last_metrics_log = now
+        logger.info(f"📊 Исполнитель {self.name}: {self.metrics()}")
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+🌐 Общий HTTP-клиент для запросов к API админки
+
+Один долгоживущий httpx.AsyncClient на процесс: keep-alive, HTTP/2 и пул
+соединений, чтобы каждый запрос не платил заново за TCP+TLS.
+"""
+
+import os
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Настройки пула соединений (можно переопределить через переменные окружения)
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "100"))
+API_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("API_MAX_KEEPALIVE_CONNECTIONS", "20"))
+API_KEEPALIVE_EXPIRY = float(os.getenv("API_KEEPALIVE_EXPIRY", "30"))
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_DEFAULT_TIMEOUT = float(os.getenv("API_DEFAULT_TIMEOUT", "10"))
+API_HTTP2 = os.getenv("API_HTTP2", "1").lower() not in ("0", "false", "no")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_timeout(timeout: Union[float, httpx.Timeout, None]) -> httpx.Timeout:
+    """Собирает таймаут запроса: connect ограничен отдельно, остальное - по эндпоинту"""
+    if isinstance(timeout, httpx.Timeout):
+        return timeout
+    total = API_DEFAULT_TIMEOUT if timeout is None else float(timeout)
+    return httpx.Timeout(total, connect=min(API_CONNECT_TIMEOUT, total))
+
+
+def _create_client() -> httpx.AsyncClient:
+    """Создает общий клиент с пулом соединений"""
+    use_http2 = API_HTTP2 and HTTP2_AVAILABLE
+    if API_HTTP2 and not HTTP2_AVAILABLE:
+        logger.warning("⚠️ Пакет h2 не установлен, HTTP/2 отключен (pip install 'httpx[http2]')")
+    limits = httpx.Limits(
+        max_connections=API_MAX_CONNECTIONS,
+        max_keepalive_connections=API_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=API_KEEPALIVE_EXPIRY,
+    )
+    logger.info(
+        f"✅ HTTP-клиент API создан: http2={use_http2}, "
+        f"max_connections={API_MAX_CONNECTIONS}, keepalive={API_MAX_KEEPALIVE_CONNECTIONS}"
+    )
+    return httpx.AsyncClient(
+        http2=use_http2,
+        limits=limits,
+        timeout=_build_timeout(None),
+    )
+
+
+async def init_api_client() -> httpx.AsyncClient:
+    """Создает общий клиент (вызывается из post_init приложения)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
+
+
+async def close_api_client() -> None:
+    """Закрывает общий клиент (вызывается из post_shutdown приложения)"""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("⏹️ HTTP-клиент API закрыт")
+    _client = None
+
+
+def get_api_client() -> httpx.AsyncClient:
+    """Возвращает общий клиент, создавая его лениво при необходимости"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _create_client()
+    return _client
+
+
+class _EndpointClient:
+    """Обертка над общим клиентом, подставляющая таймаут конкретного эндпоинта"""
+
+    def __init__(self, client: httpx.AsyncClient, timeout: httpx.Timeout):
+        self._client = client
+        self._timeout = timeout
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        kwargs.setdefault("timeout", self._timeout)
+        return await self._client.request(method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+
+@asynccontextmanager
+async def api_client(timeout: Union[float, httpx.Timeout, None] = None):
+    """
+    Контекст для запросов к API через общий пул соединений.
+
+    Используется вместо `async with httpx.AsyncClient(timeout=...) as client:` -
+    соединение не закрывается на выходе, а возвращается в пул.
+    """
+    yield _EndpointClient(get_api_client(), _build_timeout(timeout))
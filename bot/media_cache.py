@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Кеш file_id отправленных медиа для bridge.py (SQLite)
+
+- ключ - (тип медиа, media_url) или (тип медиа, sha256 содержимого);
+- после первой успешной отправки повторная отправка того же файла идет по
+  file_id: Telegram пересылает его у себя, без скачивания и загрузки;
+- file_id привязан к аккаунту, поэтому у каждого аккаунта свой файл БД;
+- чтение из памяти, запись (редкая - один раз на новый файл) сразу в БД.
+"""
+
+import time
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class MediaFileCache:
+    """(kind, key) -> file_id"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = str(db_path)
+        self._cache: Dict[Tuple[str, str], str] = {}
+        self._conn = sqlite3.connect(self.db_path, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS media_files ("
+            " kind TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " file_id TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (kind, key))"
+        )
+        self._conn.commit()
+        for kind, key, file_id in self._conn.execute("SELECT kind, key, file_id FROM media_files"):
+            self._cache[(kind, key)] = file_id
+        logger.info(f"📋 Загружено {len(self._cache)} file_id из кеша медиа")
+
+    def get(self, kind: str, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        return self._cache.get((kind, key))
+
+    def put(self, kind: str, keys: Iterable[Optional[str]], file_id: str) -> None:
+        rows = []
+        now_ts = time.time()
+        for key in keys:
+            if key and self._cache.get((kind, key)) != file_id:
+                self._cache[(kind, key)] = file_id
+                rows.append((kind, key, file_id, now_ts))
+        if not rows:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO media_files(kind, key, file_id, created_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(kind, key) DO UPDATE SET file_id = excluded.file_id, created_at = excluded.created_at",
+                    rows
+                )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить file_id в кеш медиа: {e}")
+
+    def drop(self, file_id: str) -> None:
+        """Удаляет устаревший file_id (все ключи, которые на него указывают)"""
+        for cache_key in [k for k, v in self._cache.items() if v == file_id]:
+            self._cache.pop(cache_key, None)
+        try:
+            with self._conn:
+                self._conn.execute("DELETE FROM media_files WHERE file_id = ?", (file_id,))
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось удалить file_id из кеша медиа: {e}")
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def close(self) -> None:
+        self._conn.close()
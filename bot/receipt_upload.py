@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Потоковая загрузка фото чека/QR из Telegram в API админки
+
+Файл не кодируется в base64 и не держится в памяти целиком: ответ Telegram
+читается кусками и сразу уходит в тело multipart/form-data запроса к /api/payment.
+Слишком большие изображения (если установлен Pillow) перед загрузкой
+уменьшаются и пережимаются в JPEG в отдельном потоке.
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from io import BytesIO
+from typing import AsyncIterator, Dict, Optional, Tuple
+import httpx
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Размер куска при пересылке файла
+CHUNK_SIZE = 64 * 1024
+# Изображения больше этого размера (байт) уменьшаются перед загрузкой
+DOWNSCALE_THRESHOLD_BYTES = int(os.getenv("RECEIPT_DOWNSCALE_THRESHOLD_BYTES", str(1536 * 1024)))
+# Максимальная сторона изображения после уменьшения
+DOWNSCALE_MAX_SIDE = int(os.getenv("RECEIPT_DOWNSCALE_MAX_SIDE", "2048"))
+DOWNSCALE_JPEG_QUALITY = int(os.getenv("RECEIPT_DOWNSCALE_JPEG_QUALITY", "85"))
+
+_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+    '.gif': 'image/gif',
+}
+
+
+def _guess_image_type(file_url: str) -> Tuple[str, str]:
+    """Имя файла и MIME-тип по расширению пути Telegram (по умолчанию JPEG)"""
+    ext = os.path.splitext(file_url.split('?', 1)[0])[1].lower()
+    if ext not in _MIME_TYPES:
+        ext = '.jpg'
+    return f"photo{ext}", _MIME_TYPES[ext]
+
+
+def _downscale(data: bytes) -> Optional[bytes]:
+    """Уменьшает и пережимает изображение в JPEG. None - если результат не меньше исходного"""
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.thumbnail((DOWNSCALE_MAX_SIDE, DOWNSCALE_MAX_SIDE))
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            output = BytesIO()
+            image.save(output, format='JPEG', quality=DOWNSCALE_JPEG_QUALITY, optimize=True)
+        result = output.getvalue()
+        return result if len(result) < len(data) else None
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось уменьшить изображение: {e}")
+        return None
+
+
+async def _multipart_body(
+    boundary: str,
+    fields: Dict[str, object],
+    file_field: str,
+    filename: str,
+    mime_type: str,
+    chunks: AsyncIterator[bytes]
+) -> AsyncIterator[bytes]:
+    """Тело multipart/form-data: сначала текстовые поля, затем файл кусками"""
+    for name, value in fields.items():
+        if value is None:
+            continue
+        yield (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'
+        ).encode('utf-8')
+    yield (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+        f'Content-Type: {mime_type}\r\n\r\n'
+    ).encode('utf-8')
+    async for chunk in chunks:
+        yield chunk
+    yield f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+
+async def _single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+async def post_with_telegram_file(
+    client: httpx.AsyncClient,
+    url: str,
+    fields: Dict[str, object],
+    file_field: str,
+    file_url: str,
+    file_size: Optional[int] = None,
+    timeout: float = 30.0
+) -> httpx.Response:
+    """
+    POST multipart/form-data на url: поля fields + файл из Telegram (file_url) в поле file_field.
+    Если размер файла больше порога и доступен Pillow - файл скачивается,
+    уменьшается и загружается одним куском; иначе пересылается потоком.
+    """
+    filename, mime_type = _guess_image_type(file_url)
+    boundary = uuid.uuid4().hex
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+    if PIL_AVAILABLE and file_size and file_size > DOWNSCALE_THRESHOLD_BYTES:
+        source = await client.get(file_url, timeout=timeout)
+        source.raise_for_status()
+        data = source.content
+        reduced = await asyncio.to_thread(_downscale, data)
+        if reduced is not None:
+            logger.info(f"📷 Изображение уменьшено перед загрузкой: {len(data)} -> {len(reduced)} байт")
+            data = reduced
+            filename, mime_type = "photo.jpg", "image/jpeg"
+        body = _multipart_body(boundary, fields, file_field, filename, mime_type, _single_chunk(data))
+        return await client.post(url, content=body, headers=headers, timeout=timeout)
+
+    async with client.stream("GET", file_url, timeout=timeout) as source:
+        source.raise_for_status()
+        body = _multipart_body(
+            boundary, fields, file_field, filename, mime_type, source.aiter_bytes(CHUNK_SIZE)
+        )
+        return await client.post(url, content=body, headers=headers, timeout=timeout)
@@ -3,28 +3,46 @@
 🛡️ Модуль защиты от DDoS и атак для Telegram ботов
 """
 
+import os
+import re
 import time
 import logging
-from collections import defaultdict
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from functools import wraps
 
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
-# Хранилище для rate limiting (в продакшене используйте Redis)
-_rate_limit_store: Dict[str, Dict] = defaultdict(dict)
-_blocked_users: Dict[int, float] = {}  # user_id -> unblock_time
+# Лимиты по действиям: (запросов, за секунд, блокировка при превышении - секунд, 0 = без блокировки)
+RATE_LIMITS: Dict[str, Tuple[int, int, int]] = {
+    'default': (30, 60, 900),
+    'message': (30, 60, 900),
+    # Нажатия кнопок меню - мягче
+    'callback': (60, 60, 900),
+    # Создание заявок - строже, без блокировки (пользователь ждет retry-after)
+    'deposit_create': (5, 600, 0),
+    'withdraw_create': (5, 600, 0),
+}
+
+# Общий бюджет для нескольких процессов бота: Redis (если задан и установлен пакет redis)
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("REDIS_URL", "")
 
-# Настройки rate limiting
-RATE_LIMIT_WINDOW = 60  # секунд
-MAX_REQUESTS_PER_WINDOW = 30  # запросов в окне
-BLOCK_DURATION = 900  # секунд (15 минут)
+# Совместимость: прежние настройки = лимит 'default'
+MAX_REQUESTS_PER_WINDOW, RATE_LIMIT_WINDOW, BLOCK_DURATION = RATE_LIMITS['default']
 
 
 def get_user_id(update) -> Optional[int]:
     """Извлекает user_id из update"""
     if hasattr(update, 'effective_user') and update.effective_user:
         return update.effective_user.id
+    # Message / CallbackQuery (события aiogram) - автор события
+    if hasattr(update, 'from_user') and update.from_user:
+        return update.from_user.id
     if hasattr(update, 'message') and update.message and update.message.from_user:
         return update.message.from_user.id
     if hasattr(update, 'callback_query') and update.callback_query and update.callback_query.from_user:
@@ -32,68 +50,232 @@ def get_user_id(update) -> Optional[int]:
     return None
 
 
+class TimingWheel:
+    """
+    Колесо таймеров с шагом в секунду: истекающие ключи забираются
+    по одной ячейке на прошедшую секунду, без обхода всех записей.
+    Ключ со сроком дальше одного оборота колеса возвращается раньше
+    срока - владелец проверяет срок и кладет его обратно.
+    """
+
+    def __init__(self, slots: int = 512):
+        self._slots: List[Set] = [set() for _ in range(slots)]
+        self._cursor = int(time.time())
+
+    def add(self, key, expire_at: float) -> None:
+        # Ячейка следующей секунды: к ее обработке срок точно наступил
+        self._slots[(int(expire_at) + 1) % len(self._slots)].add(key)
+
+    def advance(self, now: float) -> Iterator:
+        target = int(now)
+        # После долгого простоя достаточно одного полного оборота
+        self._cursor = max(self._cursor, target - len(self._slots))
+        while self._cursor < target:
+            self._cursor += 1
+            index = self._cursor % len(self._slots)
+            slot = self._slots[index]
+            if slot:
+                self._slots[index] = set()
+                yield from slot
+
+
+class MemoryRateLimitBackend:
+    """
+    GCRA в памяти процесса: на пару (действие, пользователь) хранится одно
+    число - теоретическое время следующего запроса (TAT). Работает только
+    в потоке event loop, без блокировок и фоновых потоков; истекшие записи
+    удаляются колесом таймеров по ходу проверок.
+    """
+
+    def __init__(self):
+        self.tat: Dict[str, float] = {}
+        self.blocked: Dict[int, float] = {}  # user_id -> unblock_time
+        self._wheel = TimingWheel()
+
+    def expire(self, now: float) -> None:
+        for kind, key in self._wheel.advance(now):
+            store = self.tat if kind == 'tat' else self.blocked
+            expire_at = store.get(key)
+            if expire_at is None:
+                continue
+            if expire_at <= now:
+                del store[key]
+            else:
+                self._wheel.add((kind, key), expire_at)
+
+    def acquire_nowait(self, key: str, interval: float, period: float, now: float) -> float:
+        """Учитывает запрос. 0 - разрешен, иначе через сколько секунд можно повторить"""
+        self.expire(now)
+        tat = self.tat.get(key)
+        new_tat = max(tat or now, now) + interval
+        if new_tat - now > period:
+            return new_tat - period - now
+        self.tat[key] = new_tat
+        if tat is None:
+            self._wheel.add(('tat', key), new_tat)
+        return 0.0
+
+    def block_nowait(self, user_id: int, duration: float, now: float) -> None:
+        if user_id not in self.blocked:
+            self._wheel.add(('block', user_id), now + duration)
+        self.blocked[user_id] = now + duration
+
+    def blocked_for_nowait(self, user_id: int, now: float) -> float:
+        self.expire(now)
+        unblock_time = self.blocked.get(user_id)
+        if unblock_time is None or unblock_time <= now:
+            return 0.0
+        return unblock_time - now
+
+    async def acquire(self, key: str, interval: float, period: float) -> float:
+        return self.acquire_nowait(key, interval, period, time.time())
+
+    async def block(self, user_id: int, duration: float) -> None:
+        self.block_nowait(user_id, duration, time.time())
+
+    async def blocked_for(self, user_id: int) -> float:
+        return self.blocked_for_nowait(user_id, time.time())
+
+
+# GCRA одним атомарным скриптом; время берется у Redis, чтобы часы процессов не расходились
+_GCRA_LUA = """
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local new_tat = tat + interval
+if new_tat - now > period then
+    return new_tat - period - now
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return 0
+"""
+
+
+class RedisRateLimitBackend:
+    """GCRA в Redis: один бюджет на все процессы бота, записи истекают по TTL"""
+
+    def __init__(self, url: str, prefix: str = "ratelimit"):
+        self.redis = aioredis.from_url(url)
+        self.prefix = prefix
+        self._gcra = self.redis.register_script(_GCRA_LUA)
+
+    async def acquire(self, key: str, interval: float, period: float) -> float:
+        retry_ms = await self._gcra(
+            keys=[f"{self.prefix}:{key}"],
+            args=[int(interval * 1000), int(period * 1000)]
+        )
+        return int(retry_ms) / 1000
+
+    async def block(self, user_id: int, duration: float) -> None:
+        await self.redis.set(f"{self.prefix}:block:{user_id}", 1, px=int(duration * 1000))
+
+    async def blocked_for(self, user_id: int) -> float:
+        ttl_ms = await self.redis.pttl(f"{self.prefix}:block:{user_id}")
+        return ttl_ms / 1000 if ttl_ms and ttl_ms > 0 else 0.0
+
+
+_memory_backend = MemoryRateLimitBackend()
+_blocked_users = _memory_backend.blocked
+_rate_limit_backend = None
+
+
+def get_rate_limit_backend():
+    """Redis-бэкенд (общий для процессов), если настроен, иначе память процесса"""
+    global _rate_limit_backend
+    if _rate_limit_backend is None:
+        _rate_limit_backend = _memory_backend
+        if RATE_LIMIT_REDIS_URL:
+            if REDIS_AVAILABLE:
+                _rate_limit_backend = RedisRateLimitBackend(RATE_LIMIT_REDIS_URL)
+                logger.info("✅ Rate limit: общий бюджет в Redis")
+            else:
+                logger.warning("⚠️ Задан Redis для rate limit, но пакет redis не установлен - лимиты в памяти процесса")
+    return _rate_limit_backend
+
+
+def set_rate_limit_backend(backend) -> None:
+    """Подключает свой бэкенд (acquire/block/blocked_for)"""
+    global _rate_limit_backend
+    _rate_limit_backend = backend
+
+
+def _limit_for(action: str) -> Tuple[int, int, int]:
+    return RATE_LIMITS.get(action, RATE_LIMITS['default'])
+
+
 def is_user_blocked(user_id: int) -> bool:
     """Проверяет, заблокирован ли пользователь"""
-    if user_id in _blocked_users:
-        unblock_time = _blocked_users[user_id]
-        if time.time() < unblock_time:
-            return True
-        else:
-            # Удаляем истекшую блокировку
-            del _blocked_users[user_id]
-    return False
+    return _memory_backend.blocked_for_nowait(user_id, time.time()) > 0
 
 
 def block_user(user_id: int, duration: int = BLOCK_DURATION) -> None:
     """Блокирует пользователя на указанное время"""
-    unblock_time = time.time() + duration
-    _blocked_users[user_id] = unblock_time
+    _memory_backend.block_nowait(user_id, duration, time.time())
     logger.warning(f"🚫 User {user_id} blocked for {duration} seconds")
 
 
-def check_rate_limit(user_id: int):
+def _exceeded_message(user_id: int, action: str, retry_after: float, block_duration: int) -> str:
+    if block_duration:
+        logger.warning(f"🚫 Rate limit exceeded for user {user_id} ({action}). Blocked for {block_duration} seconds.")
+        return "Rate limit exceeded. You have been temporarily blocked."
+    logger.warning(f"🚫 Rate limit exceeded for user {user_id} ({action}). Retry in {retry_after:.0f} seconds.")
+    return f"Too many requests. Try again in {int(retry_after) + 1} seconds."
+
+
+def check_rate_limit(user_id: int, action: str = 'default'):
     """
-    Проверяет rate limit для пользователя
+    Проверяет rate limit для пользователя (в памяти процесса)
     Возвращает (is_allowed, error_message)
     """
-    # Проверяем блокировку
-    if is_user_blocked(user_id):
-        remaining_time = int(_blocked_users[user_id] - time.time())
-        return False, f"User temporarily blocked. Try again in {remaining_time} seconds."
-    
-    # Получаем текущее время
     now = time.time()
+    blocked_for = _memory_backend.blocked_for_nowait(user_id, now)
+    if blocked_for:
+        return False, f"User temporarily blocked. Try again in {int(blocked_for)} seconds."
     
-    # Получаем или создаем запись для пользователя
-    user_data = _rate_limit_store.get(user_id, {})
-    
-    # Проверяем, нужно ли сбросить счетчик
-    reset_time = user_data.get('reset_time', 0)
-    if reset_time < now:
-        # Сбрасываем счетчик
-        user_data = {
-            'count': 0,
-            'reset_time': now + RATE_LIMIT_WINDOW
-        }
-    
-    # Увеличиваем счетчик
-    user_data['count'] = user_data.get('count', 0) + 1
-    
-    # Проверяем превышение лимита
-    if user_data['count'] > MAX_REQUESTS_PER_WINDOW:
-        # Блокируем пользователя
-        block_user(user_id, BLOCK_DURATION)
-        logger.warning(f"🚫 Rate limit exceeded for user {user_id}. Blocked for {BLOCK_DURATION} seconds.")
-        return False, "Rate limit exceeded. You have been temporarily blocked."
-    
-    # Сохраняем обновленные данные
-    _rate_limit_store[user_id] = user_data
+    requests, period, block_duration = _limit_for(action)
+    retry_after = _memory_backend.acquire_nowait(f"{action}:{user_id}", period / requests, period, now)
+    if not retry_after:
+        return True, None
     
-    return True, None
+    if block_duration:
+        _memory_backend.block_nowait(user_id, block_duration, now)
+    return False, _exceeded_message(user_id, action, retry_after, block_duration)
 
 
-def rate_limit_decorator(func):
-    """Декоратор для rate limiting обработчиков"""
+async def check_rate_limit_async(user_id: int, action: str = 'default'):
+    """
+    Проверяет rate limit через настроенный бэкенд (Redis - общий бюджет процессов)
+    Возвращает (is_allowed, error_message)
+    """
+    backend = get_rate_limit_backend()
+    if backend is _memory_backend:
+        return check_rate_limit(user_id, action)
+    try:
+        blocked_for = await backend.blocked_for(user_id)
+        if blocked_for:
+            return False, f"User temporarily blocked. Try again in {int(blocked_for)} seconds."
+        
+        requests, period, block_duration = _limit_for(action)
+        retry_after = await backend.acquire(f"{action}:{user_id}", period / requests, period)
+        if not retry_after:
+            return True, None
+        
+        if block_duration:
+            await backend.block(user_id, block_duration)
+        return False, _exceeded_message(user_id, action, retry_after, block_duration)
+    except Exception as e:
+        logger.warning(f"⚠️ Бэкенд rate limit недоступен, проверка в памяти процесса: {e}")
+        return check_rate_limit(user_id, action)
+
+
+def rate_limit_decorator(func=None, action: str = 'default'):
+    """Декоратор для rate limiting обработчиков (@rate_limit_decorator или @rate_limit_decorator(action='...'))"""
+    if func is None:
+        return lambda f: rate_limit_decorator(f, action)
+    
     @wraps(func)
     async def wrapper(update, context):
         user_id = get_user_id(update)
@@ -103,7 +285,7 @@ def rate_limit_decorator(func):
             return
         
         # Проверяем rate limit
-        is_allowed, error_message = check_rate_limit(user_id)
+        is_allowed, error_message = await check_rate_limit_async(user_id, action)
         
         if not is_allowed:
             logger.warning(f"🚫 Rate limit check failed for user {user_id}: {error_message}")
@@ -128,6 +310,67 @@ def rate_limit_decorator(func):
     return wrapper
 
 
+_SQL_COMMANDS = r'SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION'
+_SQL_COMMANDS_RE = re.compile(_SQL_COMMANDS, re.IGNORECASE)
+
+# Правила вида "A .* B .* C" в пределах одной строки: (A, B, C или None).
+# Проверяются последовательным поиском без возвратов - время линейно от длины текста
+_SQL_SEQUENCE_RULES = [
+    # SQL команды в контексте (только если это не часть обычного текста)
+    (
+        re.compile(r'\b(?:SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION|SCRIPT)\s+', re.IGNORECASE),
+        re.compile(r'FROM|INTO|TABLE|DATABASE|WHERE', re.IGNORECASE),
+        None,
+    ),
+    # Многострочные комментарии SQL
+    (re.compile(r'/\*'), _SQL_COMMANDS_RE, re.compile(r'\*/')),
+    # SQL инъекции через OR/AND с двойными равенствами
+    (re.compile(r'\bOR\b', re.IGNORECASE), re.compile('='), re.compile('=')),
+    (re.compile(r'\bAND\b', re.IGNORECASE), re.compile('='), re.compile('=')),
+    # SQL инъекции через кавычки с OR/AND
+    (re.compile(r"['`\"]"), re.compile(r'\bOR\b|\bAND\b', re.IGNORECASE), re.compile(r"['`\"]")),
+    # Попытки завершить SQL запрос точкой с запятой перед SQL командами
+    (re.compile(';'), _SQL_COMMANDS_RE, None),
+]
+
+# Локальные шаблоны: комментарии SQL перед командой и XSS
+_LOCAL_PATTERNS_RE = re.compile(
+    r'(?:--|#)\s*(?:' + _SQL_COMMANDS + r')'
+    r'|<script|javascript:|onerror=|onload=|<iframe',
+    re.IGNORECASE
+)
+
+# Все "якоря" правил одним выражением: обычный текст без них проверяется за один проход.
+# Опережающая проверка первого символа отсеивает остальные позиции без перебора альтернатив
+_TRIGGER_RE = re.compile(
+    r'(?=[sidcaeuo/;\'"`#<j\-])(?:'
+    r'\b(?:SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION|SCRIPT)\s'
+    r'|/\*|\bOR\b|\bAND\b|[\'`";]'
+    r'|--|#|<script|javascript:|onerror=|onload=|<iframe)',
+    re.IGNORECASE
+)
+
+
+def _match_sequence(text: str, first, second, third) -> bool:
+    """Есть ли в одной строке текста first, затем second, затем third"""
+    checked_line_end = -1
+    for match in first.finditer(text):
+        start = match.end()
+        line_end = text.find('\n', start)
+        if line_end == -1:
+            line_end = len(text)
+        # Более раннее вхождение first в той же строке уже проверено (его область шире)
+        if line_end == checked_line_end:
+            continue
+        checked_line_end = line_end
+        second_match = second.search(text, start, line_end)
+        if second_match is None:
+            continue
+        if third is None or third.search(text, second_match.end(), line_end):
+            return True
+    return False
+
+
 def validate_input(text: Optional[str], max_length: int = 4096):
     """
     Валидирует входной текст
@@ -140,39 +383,17 @@ def validate_input(text: Optional[str], max_length: int = 4096):
     if len(text) > max_length:
         return False, f"Text too long. Maximum length is {max_length} characters."
     
-    # Проверка на SQL инъекции (более точная - только реальные паттерны атак)
-    import re
-    sql_patterns = [
-        # SQL команды в контексте (только если это не часть обычного текста)
-        r'\b(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION|SCRIPT)\s+.*(FROM|INTO|TABLE|DATABASE|WHERE)',
-        # Комментарии SQL в контексте (-- или # за которыми следует SQL-подобный текст)
-        r'(--|#)\s*(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION)',
-        # Многострочные комментарии SQL
-        r'/\*.*(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION).*\*/',
-        # SQL инъекции через OR/AND с двойными равенствами
-        r'\bOR\b.*=.*=',
-        r'\bAND\b.*=.*=',
-        # SQL инъекции через кавычки с OR/AND
-        r"('|`|\").*(\bOR\b|\bAND\b).*('|`|\")",
-        # Попытки завершить SQL запрос точкой с запятой перед SQL командами
-        r';.*(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|EXECUTE|UNION)',
-    ]
-    
-    for pattern in sql_patterns:
-        if re.search(pattern, text, re.IGNORECASE):
-            return False, "Invalid input detected."
+    # Быстрый путь: в тексте нет ни одного подозрительного фрагмента
+    if not _TRIGGER_RE.search(text):
+        return True, None
     
-    # Проверка на XSS
-    xss_patterns = [
-        r'<script',
-        r'javascript:',
-        r'onerror=',
-        r'onload=',
-        r'<iframe',
-    ]
+    # Проверка на XSS и комментарии SQL
+    if _LOCAL_PATTERNS_RE.search(text):
+        return False, "Invalid input detected."
     
-    for pattern in xss_patterns:
-        if re.search(pattern, text, re.IGNORECASE):
+    # Проверка на SQL инъекции (более точная - только реальные паттерны атак)
+    for first, second, third in _SQL_SEQUENCE_RULES:
+        if _match_sequence(text, first, second, third):
             return False, "Invalid input detected."
     
     return True, None
@@ -189,41 +410,5 @@ def sanitize_input(text: str) -> str:
 
 
 def cleanup_old_entries():
-    """Очищает старые записи из хранилища (вызывать периодически)"""
-    now = time.time()
-    
-    # Очищаем rate limit store
-    users_to_remove = []
-    for user_id, user_data in _rate_limit_store.items():
-        if user_data.get('reset_time', 0) < now:
-            users_to_remove.append(user_id)
-    
-    for user_id in users_to_remove:
-        del _rate_limit_store[user_id]
-    
-    # Очищаем блокировки
-    users_to_unblock = []
-    for user_id, unblock_time in _blocked_users.items():
-        if unblock_time < now:
-            users_to_unblock.append(user_id)
-    
-    for user_id in users_to_unblock:
-        del _blocked_users[user_id]
-    
-    if users_to_remove or users_to_unblock:
-        logger.info(f"🧹 Cleaned up {len(users_to_remove)} rate limit entries and {len(users_to_unblock)} block entries")
-
-
-# Запускаем очистку каждые 5 минут
-import threading
-
-def periodic_cleanup():
-    """Периодическая очистка старых записей"""
-    while True:
-        time.sleep(5 * 60)  # 5 минут
-        cleanup_old_entries()
-
-# Запускаем в фоновом потоке
-cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True)
-cleanup_thread.start()
-
+    """Удаляет истекшие записи (обычно не нужно: колесо таймеров чистит их по ходу проверок)"""
+    _memory_backend.expire(time.time())
@@ -0,0 +1,618 @@
+#!/usr/bin/env python3
+"""
+Шардирование клиентского бота по нескольким процессам
+
+user_states, active_timers и ожидания чеков живут в памяти процесса, поэтому
+один процесс бота - это одно ядро. В режиме шардирования:
+- роутер (python shard_router.py) принимает webhook от Telegram и раскладывает
+  обновления по воркерам по хешу user_id (консистентное хеширование с
+  виртуальными узлами) - сценарий пользователя всегда идет на одном воркере;
+- воркер - обычный bot.py с SHARD_ROUTER_ADDR и SHARD_WORKER_ID: он сам
+  подключается к роутеру и получает обновления по TCP (4 байта длины + JSON);
+- воркер подтверждает обновление после постановки в очередь PTB, при обрыве
+  связи неподтвержденные обновления уходят новому владельцу (at-least-once);
+- ребалансировка при подключении воркера и при его плановой остановке: прием
+  ставится на паузу (обновления копятся у роутера), воркеры дорабатывают свою
+  очередь и отдают состояния пользователей, сменивших владельца, новые
+  владельцы их принимают (вместе с таймером депозита), затем пауза снимается.
+  Если обработчики воркера не успели закончить работу (SHARD_DRAIN_TIMEOUT),
+  он состояния не отдает: ребалансировка отменяется и повторяется позже;
+  При аварийном падении воркера его состояния в памяти теряются - как и при
+  рестарте единственного процесса; его пользователи переходят к соседям по кольцу,
+  а после возвращения воркера забираются обратно;
+- лимит Telegram (~30 сообщений/сек) общий на бота, а не на процесс: роутер
+  передает число воркеров в кадрах export/import и отдельным кадром workers
+  после каждой смены кольца, воркер отдает его в set_workers
+  (rate_governor.set_share - каждый процесс берет GLOBAL_RATE/N). При входе
+  нового воркера доля уменьшается уже на export, до передачи пользователей,
+  так что суммарный лимит не превышается и во время ребалансировки.
+
+Запуск: роутер слушает LEGACY_WEBHOOK_PORT (за nginx) и SHARD_ROUTER_PORT (для воркеров),
+воркеры запускаются с SHARD_ROUTER_ADDR=127.0.0.1:8090 и уникальным SHARD_WORKER_ID.
+"""
+
+import os
+import json
+import time
+import bisect
+import signal
+import asyncio
+import hashlib
+import logging
+import secrets
+import itertools
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Точек на кольце на один воркер: чем больше, тем ровнее распределение
+VIRTUAL_NODES = 128
+# Максимальный размер кадра между роутером и воркером
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+# Сколько обновлений роутер держит, пока нет воркеров или идет ребалансировка
+MAX_BACKLOG = int(os.getenv("SHARD_MAX_BACKLOG", "20000"))
+# Сколько роутер ждет ответа воркера при ребалансировке
+REBALANCE_TIMEOUT = float(os.getenv("SHARD_REBALANCE_TIMEOUT", "30"))
+# Сколько воркер ждет завершения уже принятых обновлений перед отдачей состояний
+DRAIN_TIMEOUT = float(os.getenv("SHARD_DRAIN_TIMEOUT", "20"))
+# Пауза перед повтором отмененной ребалансировки
+REBALANCE_RETRY_DELAY = float(os.getenv("SHARD_REBALANCE_RETRY_DELAY", "5"))
+HELLO_TIMEOUT = 10
+
+# Обновления, которые нужны обработчикам bot.py (как ALLOWED_UPDATES в bot.py)
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Кольцо консистентного хеширования: при добавлении/удалении воркера переезжают только его пользователи"""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, user_id) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(str(user_id))) % len(self._points)
+        return self._owners[index]
+
+    def __contains__(self, node: str) -> bool:
+        return node in self.nodes
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+def extract_user_id(update: dict) -> int:
+    """user_id (или id чата) из сырого обновления Telegram - ключ шардирования"""
+    for payload in update.values():
+        if not isinstance(payload, dict):
+            continue
+        user = payload.get('from') or payload.get('user')
+        if isinstance(user, dict) and 'id' in user:
+            return user['id']
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if isinstance(chat, dict) and 'id' in chat:
+            return chat['id']
+    return 0
+
+
+def encode_frame(message: dict) -> bytes:
+    body = json.dumps(message, ensure_ascii=False, default=str).encode('utf-8')
+    return len(body).to_bytes(4, 'big') + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[dict]:
+    """Следующий кадр или None, если соединение закрыто"""
+    try:
+        header = await reader.readexactly(4)
+        size = int.from_bytes(header, 'big')
+        if size > MAX_FRAME_SIZE:
+            raise ValueError(f"слишком большой кадр: {size} байт")
+        return json.loads(await reader.readexactly(size))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def _secret_ok(received: str, expected: str) -> bool:
+    return secrets.compare_digest(str(received).encode('utf-8'), expected.encode('utf-8'))
+
+
+# ---------- роутер ----------
+
+class _WorkerLink:
+    """Соединение роутера с одним воркером"""
+
+    def __init__(self, name: str, writer: asyncio.StreamWriter):
+        self.name = name
+        self.writer = writer
+        # (seq, update) - отправлены, но еще не подтверждены
+        self.unacked: Deque[Tuple[int, dict]] = deque()
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.replies: Dict[int, asyncio.Future] = {}
+        self.sender: Optional[asyncio.Task] = None
+
+
+class ShardRouter:
+    """Раскладывает обновления по воркерам и переносит состояния пользователей при смене состава"""
+
+    def __init__(self, secret: str, vnodes: int = VIRTUAL_NODES, max_backlog: int = MAX_BACKLOG):
+        self.secret = secret
+        self.vnodes = vnodes
+        self.max_backlog = max_backlog
+        self.ring = HashRing(vnodes=vnodes)
+        self.links: Dict[str, _WorkerLink] = {}
+        self._backlog: Deque[dict] = deque()
+        self._paused = 0
+        self._lock = asyncio.Lock()
+        self._seq = itertools.count(1)
+        self._req = itertools.count(1)
+
+    # ---------- прием обновлений ----------
+
+    def dispatch(self, update: dict) -> bool:
+        """Отправляет обновление владельцу. False - очередь переполнена (Telegram повторит позже)"""
+        if self._paused or not len(self.ring):
+            if len(self._backlog) >= self.max_backlog:
+                return False
+            self._backlog.append(update)
+            return True
+        link = self.links.get(self.ring.node_for(extract_user_id(update)))
+        if link is None:
+            self._backlog.append(update)
+            return True
+        seq = next(self._seq)
+        link.unacked.append((seq, update))
+        link.outbox.put_nowait({'type': 'update', 'seq': seq, 'update': update})
+        return True
+
+    async def handle_webhook(self, request) -> "web.Response":
+        from aiohttp import web
+        if not _secret_ok(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), self.secret):
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(update, dict):
+            return web.Response(status=400)
+        if not self.dispatch(update):
+            logger.warning(f"⚠️ Очередь роутера переполнена ({len(self._backlog)}), Telegram повторит обновление")
+            return web.Response(status=503)
+        return web.Response()
+
+    # ---------- соединения воркеров ----------
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            hello = await asyncio.wait_for(read_frame(reader), HELLO_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"⚠️ Воркер не представился: {e}")
+            hello = None
+        if not hello or hello.get('type') != 'hello' or not _secret_ok(hello.get('secret', ''), self.secret):
+            logger.warning(f"⚠️ Отклонено подключение воркера с {writer.get_extra_info('peername')}")
+            writer.close()
+            return
+        name = str(hello.get('worker'))
+        if name in self.links:
+            logger.error(f"❌ Воркер {name} уже подключен, второе подключение отклонено")
+            writer.close()
+            return
+
+        link = _WorkerLink(name, writer)
+        self.links[name] = link
+        link.sender = asyncio.create_task(self._send_loop(link))
+        logger.info(f"🔌 Воркер {name} подключен, начинаю ребалансировку")
+        asyncio.create_task(self._join(name))
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    break
+                kind = message.get('type')
+                if kind == 'ack':
+                    while link.unacked and link.unacked[0][0] <= message['seq']:
+                        link.unacked.popleft()
+                elif kind == 'leaving':
+                    asyncio.create_task(self._release(link))
+                elif 'req' in message:
+                    future = link.replies.get(message['req'])
+                    if future and not future.done():
+                        future.set_result(message)
+                    elif message.get('type') == 'state' and message.get('users'):
+                        # Состояния пришли после таймаута ребалансировки - возвращаем их владельцу
+                        logger.warning(f"⚠️ Воркер {name} отдал состояния после таймаута, возвращаю их обратно")
+                        link.outbox.put_nowait({'type': 'import', 'users': message['users'], 'workers': len(self.ring), 'req': next(self._req)})
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"❌ Ошибка связи с воркером {name}: {e}")
+        finally:
+            await self._drop(link)
+
+    async def _send_loop(self, link: _WorkerLink) -> None:
+        try:
+            while True:
+                message = await link.outbox.get()
+                link.writer.write(encode_frame(message))
+                if link.outbox.empty():
+                    await link.writer.drain()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Не удалось отправить данные воркеру {link.name}: {e}")
+            link.writer.close()
+
+    async def _request(self, link: _WorkerLink, message: dict) -> dict:
+        req = next(self._req)
+        future = asyncio.get_running_loop().create_future()
+        link.replies[req] = future
+        link.outbox.put_nowait({**message, 'req': req})
+        try:
+            return await asyncio.wait_for(future, REBALANCE_TIMEOUT)
+        finally:
+            link.replies.pop(req, None)
+
+    async def _drop(self, link: _WorkerLink) -> None:
+        """Воркер отключился: его неподтвержденные обновления уходят новым владельцам"""
+        if self.links.get(link.name) is not link:
+            return
+        del self.links[link.name]
+        link.sender.cancel()
+        link.writer.close()
+        for future in link.replies.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"воркер {link.name} отключился"))
+        orphaned = [update for _, update in link.unacked]
+        link.unacked.clear()
+
+        # Пауза ставится сразу: до смены кольца обновления не должны уходить выбывшему воркеру
+        self._paused += 1
+        async with self._lock:
+            if link.name in self.ring:
+                self.ring = HashRing([node for node in self.ring.nodes if node != link.name], self.vnodes)
+                logger.warning(f"⚠️ Воркер {link.name} выбыл, осталось воркеров: {len(self.ring)}, переотправляю {len(orphaned)} обновлений")
+            self._backlog.extendleft(reversed(orphaned))
+            self._broadcast_workers()
+            self._resume()
+
+    async def _join(self, name: str) -> None:
+        """Новый воркер получает свою часть пользователей (повтор, пока ребалансировка не пройдет)"""
+        while name in self.links and not await self._rebalance(self.ring.nodes + [name]):
+            await asyncio.sleep(REBALANCE_RETRY_DELAY)
+
+    async def _release(self, link: _WorkerLink) -> None:
+        """Плановая остановка воркера: его пользователи переезжают к соседям"""
+        remaining = [node for node in self.links if node != link.name]
+        if remaining:
+            while not await self._rebalance(remaining):
+                if self.links.get(link.name) is not link:
+                    return
+                await asyncio.sleep(REBALANCE_RETRY_DELAY)
+                remaining = [node for node in self.links if node != link.name]
+        else:
+            # Последний воркер: передавать некому, обновления подождут в очереди роутера
+            self._paused += 1
+            async with self._lock:
+                self.ring = HashRing(vnodes=self.vnodes)
+            self._resume()
+        link.outbox.put_nowait({'type': 'released'})
+
+    async def _rebalance(self, nodes: List[str]) -> bool:
+        """
+        Переносит состояния по новому кольцу. Если живой воркер не смог отдать
+        состояния (обработчики не закончили работу), ребалансировка отменяется:
+        уже отданные состояния возвращаются владельцам, кольцо не меняется. False - нужен повтор
+        """
+        async with self._lock:
+            self._paused += 1
+            started = time.monotonic()
+            try:
+                nodes = sorted(node for node in set(nodes) if node in self.links)
+                new_ring = HashRing(nodes, self.vnodes)
+                export = {'type': 'export', 'nodes': nodes, 'vnodes': self.vnodes, 'workers': len(nodes)}
+                # Каждый воркер дорабатывает принятые обновления и отдает чужих по новому кольцу пользователей
+                links = list(self.links.values())
+                replies = await asyncio.gather(*(self._request(link, export) for link in links), return_exceptions=True)
+
+                failed = [
+                    link.name for link, reply in zip(links, replies)
+                    if self.links.get(link.name) is link
+                    and (isinstance(reply, BaseException) or reply.get('busy'))
+                ]
+                if failed:
+                    for link, reply in zip(links, replies):
+                        if isinstance(reply, BaseException) or not reply.get('users'):
+                            continue
+                        try:
+                            await self._request(link, {'type': 'import', 'users': reply['users'], 'workers': len(self.ring)})
+                        except Exception as e:
+                            logger.error(f"❌ Состояния {len(reply['users'])} пользователей не возвращены воркеру {link.name}: {e}")
+                    logger.warning(f"⚠️ Воркеры {failed} не отдали состояния, ребалансировка отменена, повтор через {REBALANCE_RETRY_DELAY:g} сек")
+                    return False
+
+                moved: Dict[str, list] = {}
+                for link, reply in zip(links, replies):
+                    if isinstance(reply, BaseException):
+                        # Воркер отключился - его состояния потеряны, как при падении
+                        logger.error(f"❌ Воркер {link.name} не отдал состояния: {reply}")
+                        continue
+                    for user_id, snapshot in reply.get('users', []):
+                        moved.setdefault(new_ring.node_for(user_id), []).append([user_id, snapshot])
+
+                for name, users in moved.items():
+                    link = self.links.get(name)
+                    try:
+                        if link is None:
+                            raise ConnectionError("воркер отключился")
+                        await self._request(link, {'type': 'import', 'users': users, 'workers': len(nodes)})
+                    except Exception as e:
+                        logger.error(f"❌ Состояния {len(users)} пользователей не переданы воркеру {name}: {e}")
+
+                self.ring = HashRing([node for node in nodes if node in self.links], self.vnodes)
+                logger.info(
+                    f"✅ Ребалансировка за {time.monotonic() - started:.2f} сек: воркеры {self.ring.nodes}, "
+                    f"перенесено пользователей: {sum(len(users) for users in moved.values())}, в очереди: {len(self._backlog)}"
+                )
+                return True
+            finally:
+                # Успех - новое число воркеров, отмена - возврат к прежнему (export его уже уменьшил)
+                self._broadcast_workers()
+                self._resume()
+
+    def _broadcast_workers(self) -> None:
+        """Сообщает воркерам, на сколько процессов делится лимит Bot API (до возобновления отправки обновлений)"""
+        message = {'type': 'workers', 'workers': len(self.ring)}
+        for link in self.links.values():
+            link.outbox.put_nowait(message)
+
+    def _resume(self) -> None:
+        self._paused -= 1
+        if self._paused or not len(self.ring):
+            return
+        backlog, self._backlog = self._backlog, deque()
+        for update in backlog:
+            self.dispatch(update)
+
+
+# ---------- воркер ----------
+
+class ShardWorker:
+    """Сторона воркера: получает обновления от роутера и отдает/принимает состояния пользователей"""
+
+    def __init__(
+        self,
+        application,
+        worker_id: str,
+        router_addr: str,
+        secret: str,
+        export_states: Callable[[Callable[[int], bool]], list],
+        import_states: Callable[[object, list], None],
+        set_workers: Optional[Callable[[int], None]] = None
+    ):
+        self.application = application
+        self.worker_id = worker_id
+        host, _, port = router_addr.rpartition(':')
+        self.router_host = host or '127.0.0.1'
+        self.router_port = int(port)
+        self.secret = secret
+        self.export_states = export_states
+        self.import_states = import_states
+        self.set_workers = set_workers
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._write_lock = asyncio.Lock()
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """Держит соединение с роутером (с переподключением) до плановой остановки"""
+        delay = 1
+        while not stop_event.is_set():
+            try:
+                reader, writer = await asyncio.open_connection(self.router_host, self.router_port)
+            except OSError as e:
+                logger.warning(f"⚠️ Роутер {self.router_host}:{self.router_port} недоступен ({e}), повтор через {delay} сек")
+                try:
+                    await asyncio.wait_for(stop_event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, 30)
+                continue
+            delay = 1
+            try:
+                if await self._session(reader, writer, stop_event):
+                    return
+            finally:
+                writer.close()
+
+    async def _send(self, message: dict) -> None:
+        async with self._write_lock:
+            self._writer.write(encode_frame(message))
+            await self._writer.drain()
+
+    async def _session(self, reader, writer, stop_event: asyncio.Event) -> bool:
+        """Одно соединение с роутером. True - воркер отпущен и может завершаться"""
+        self._writer = writer
+        await self._send({'type': 'hello', 'worker': self.worker_id, 'secret': self.secret})
+        logger.info(f"🔌 Воркер {self.worker_id} подключен к роутеру {self.router_host}:{self.router_port}")
+
+        reader_task = asyncio.create_task(self._read_loop(reader))
+        stop_task = asyncio.create_task(stop_event.wait())
+        await asyncio.wait({reader_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+        if not stop_task.done():
+            stop_task.cancel()
+            logger.warning(f"⚠️ Соединение с роутером потеряно, переподключаюсь")
+            return False
+
+        if not reader_task.done():
+            # Отдаем пользователей соседям и ждем, пока роутер нас отпустит
+            try:
+                await self._send({'type': 'leaving'})
+                await asyncio.wait_for(asyncio.shield(reader_task), REBALANCE_TIMEOUT + DRAIN_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"⚠️ Роутер не подтвердил остановку воркера: {e}")
+                reader_task.cancel()
+        return True
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        from telegram import Update
+        application = self.application
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    return
+                kind = message.get('type')
+                if 'workers' in message and self.set_workers:
+                    self.set_workers(message['workers'])
+                if kind == 'update':
+                    await application.update_queue.put(Update.de_json(message['update'], application.bot))
+                    await self._send({'type': 'ack', 'seq': message['seq']})
+                elif kind == 'export':
+                    ring = HashRing(message['nodes'], message.get('vnodes', VIRTUAL_NODES))
+                    try:
+                        await asyncio.wait_for(application.update_queue.join(), DRAIN_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        # Обработчики еще работают с user_states - отдавать их сейчас нельзя,
+                        # роутер отменит ребалансировку и повторит ее позже
+                        logger.warning(f"⚠️ Очередь обновлений не опустела за {DRAIN_TIMEOUT} сек, состояния не отданы")
+                        await self._send({'type': 'state', 'req': message['req'], 'busy': True, 'users': []})
+                        continue
+                    users = self.export_states(lambda user_id: ring.node_for(user_id) != self.worker_id)
+                    await self._send({'type': 'state', 'req': message['req'], 'users': users})
+                    logger.info(f"📤 Отдано состояний пользователей: {len(users)}, воркеры: {message['nodes']}")
+                elif kind == 'import':
+                    self.import_states(application.bot, message['users'])
+                    await self._send({'type': 'imported', 'req': message['req']})
+                    logger.info(f"📥 Принято состояний пользователей: {len(message['users'])}")
+                elif kind == 'released':
+                    logger.info(f"✅ Роутер отпустил воркер {self.worker_id}")
+                    return
+        except Exception as e:
+            logger.error(f"❌ Ошибка связи с роутером: {e}")
+
+
+def run_shard_worker(application, worker_id: str, router_addr: str, secret: str, export_states, import_states, set_workers=None) -> None:
+    """Запускает PTB-приложение без собственного webhook/polling: обновления приходят от роутера"""
+
+    async def _main() -> None:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            worker = ShardWorker(application, worker_id, router_addr, secret, export_states, import_states, set_workers)
+            await worker.run(stop_event)
+        finally:
+            if application.running:
+                await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+    asyncio.run(_main())
+
+
+# ---------- запуск роутера ----------
+
+def _load_env_file(env_path: Path) -> None:
+    if not env_path.exists():
+        return
+    try:
+        for raw_line in env_path.read_text(encoding="utf-8").splitlines():
+            line = raw_line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            key = key.strip()
+            value = value.strip().strip('"').strip("'")
+            if key and key not in os.environ:
+                os.environ[key] = value
+    except Exception:
+        return
+
+
+async def run_router() -> None:
+    import httpx
+    from aiohttp import web
+
+    bot_token = os.getenv("BOT_TOKEN", "")
+    webhook_url = os.getenv("LEGACY_WEBHOOK_URL", "")
+    webhook_path = os.getenv("LEGACY_WEBHOOK_PATH", "/telegram/bot/webhook")
+    webhook_secret = os.getenv("LEGACY_WEBHOOK_SECRET", "")
+    if not bot_token or ":" not in bot_token:
+        raise ValueError("BOT_TOKEN не задан или имеет неверный формат")
+    if not webhook_url or not webhook_secret:
+        raise ValueError("Для роутера нужны LEGACY_WEBHOOK_URL и LEGACY_WEBHOOK_SECRET")
+
+    router = ShardRouter(webhook_secret)
+    worker_server = await asyncio.start_server(
+        router.handle_worker,
+        os.getenv("SHARD_ROUTER_HOST", "127.0.0.1"),
+        int(os.getenv("SHARD_ROUTER_PORT", "8090"))
+    )
+
+    app = web.Application()
+    app.router.add_post(webhook_path, router.handle_webhook)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, os.getenv("LEGACY_WEBHOOK_HOST", "127.0.0.1"), int(os.getenv("LEGACY_WEBHOOK_PORT", "8082")))
+    await site.start()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    try:
+        full_url = webhook_url.rstrip('/') + webhook_path
+        async with httpx.AsyncClient(timeout=30) as client:
+            response = await client.post(
+                f"https://api.telegram.org/bot{bot_token}/setWebhook",
+                json={
+                    'url': full_url,
+                    'secret_token': webhook_secret,
+                    'max_connections': int(os.getenv("LEGACY_WEBHOOK_MAX_CONNECTIONS", "40")),
+                    'allowed_updates': ALLOWED_UPDATES
+                }
+            )
+            response.raise_for_status()
+        logger.info(f"🌐 Роутер шардов запущен: webhook {full_url}, воркеры подключаются к {worker_server.sockets[0].getsockname()}")
+        await stop_event.wait()
+    finally:
+        if router._backlog:
+            logger.warning(f"⚠️ Роутер остановлен, не доставлено обновлений: {len(router._backlog)}")
+        worker_server.close()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    _root_dir = Path(__file__).resolve().parents[1]
+    _load_env_file(_root_dir / "admin" / ".env")
+    _load_env_file(_root_dir / "admin_nextjs" / ".env")
+    asyncio.run(run_router())
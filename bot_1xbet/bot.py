@@ -8,9 +8,11 @@ import logging
 import re
 import httpx
 import asyncio
+from pathlib import Path
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 from telegram.ext import Application, CommandHandler, ContextTypes
 from telegram.constants import ParseMode
+from chat_ingest import ChatIngestQueue
 
 # Настройка логирования
 logging.basicConfig(
@@ -26,6 +28,9 @@ BOT_TOKEN = "8237362899:AAECnIbU7QQaFUonr85eiosXU79f9SbBc5s"
 WEBSITE_URL = "https://lux-on.org"
 API_URL = "https://pipiska.net"
 
+# Очередь сохранения сообщений пользователей в чат админки (запускается в post_init)
+chat_ingest_queue = ChatIngestQueue(API_URL, Path(__file__).resolve().parent / 'chat_ingest_spill.jsonl')
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /start"""
     user = update.effective_user
@@ -237,43 +242,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         media_url = update.message.sticker.file_id
     # Обрабатываем стикеры, если они есть (через общий обработчик)
     
-    # Сохраняем сообщение в админку через API
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            payload = {
-                "message_text": message_text,
-                "message_type": message_type,
-                "media_url": media_url,
-                "telegram_message_id": telegram_message_id
-            }
-            logger.debug(f"Отправка в API: {API_URL}/api/users/{user_id}/chat/ingest")
-            logger.debug(f"Payload: {payload}")
-            
-            response = await client.post(
-                f"{API_URL}/api/users/{user_id}/chat/ingest",
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                try:
-                    response_data = response.json()
-                    if response_data.get('success'):
-                        logger.info(f"✅ Сообщение от пользователя {user_id} сохранено в чат (ID: {response_data.get('messageId')})")
-                    else:
-                        logger.warning(f"⚠️ API вернул success=false: {response_data.get('error')}")
-                except Exception as parse_error:
-                    logger.warning(f"⚠️ Не удалось распарсить ответ API: {parse_error}")
-            else:
-                try:
-                    error_text = response.text
-                    logger.error(f"❌ Ошибка API при сохранении сообщения: {response.status_code} - {error_text[:200]}")
-                except:
-                    logger.error(f"❌ Ошибка API при сохранении сообщения: {response.status_code}")
-    except httpx.TimeoutException:
-        logger.error(f"❌ Таймаут при сохранении сообщения в чат")
-    except Exception as e:
-        logger.error(f"❌ Ошибка при сохранении сообщения в чат: {e}", exc_info=True)
+    # Ставим сообщение в очередь на сохранение в админку (отправит фоновый воркер)
+    chat_ingest_queue.enqueue(
+        user_id,
+        message_text,
+        message_type=message_type,
+        media_url=media_url,
+        telegram_message_id=telegram_message_id
+    )
 
 async def referral_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /referral для просмотра реферальной статистики"""
@@ -353,8 +329,16 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 def main() -> None:
     """Главная функция"""
+    async def post_init(app: Application) -> None:
+        """Запускает фоновую очередь сохранения сообщений"""
+        await chat_ingest_queue.start()
+    
+    async def post_shutdown(app: Application) -> None:
+        """Досылает очередь сообщений при остановке"""
+        await chat_ingest_queue.stop()
+    
     # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
     
     # Добавляем обработчик команды /start
     application.add_handler(CommandHandler("start", start))
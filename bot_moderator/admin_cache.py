@@ -0,0 +1,81 @@
+"""
+Кеш администраторов групп
+
+Вместо get_chat_member на каждое сообщение список администраторов чата
+загружается одним запросом getChatAdministrators и хранится в памяти:
+- обновляется по истечении TTL (параллельные запросы ждут одну загрузку);
+- точечно правится по обновлениям chat_member (назначение/снятие админа).
+Проверка "это админ?" - поиск в множестве.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Dict, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.types import ChatMemberUpdated
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ('administrator', 'creator')
+# Если загрузить список не удалось - повторить не раньше чем через столько секунд
+RETRY_AFTER_ERROR_SECONDS = 30
+
+
+class AdminRosterCache:
+    """chat_id -> множество user_id администраторов"""
+
+    def __init__(self, bot: Bot, ttl: float):
+        self.bot = bot
+        self.ttl = ttl
+        # chat_id -> (администраторы, monotonic время истечения)
+        self._rosters: Dict[int, Tuple[Set[int], float]] = {}
+        self._loading: Dict[int, asyncio.Task] = {}
+
+    async def is_admin(self, chat_id: int, user_id: int) -> bool:
+        roster = await self.get_admins(chat_id)
+        return user_id in roster
+
+    async def get_admins(self, chat_id: int) -> Set[int]:
+        cached = self._rosters.get(chat_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        task = self._loading.get(chat_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._load(chat_id))
+            self._loading[chat_id] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, chat_id: int) -> Set[int]:
+        try:
+            admins = await self.bot.get_chat_administrators(chat_id)
+            roster = {member.user.id for member in admins}
+            self._rosters[chat_id] = (roster, time.monotonic() + self.ttl)
+            logger.info(f"👮 Загружено {len(roster)} администраторов чата {chat_id}")
+            return roster
+        except Exception as e:
+            # Оставляем прежний список (если был) и не долбим API на каждом сообщении
+            previous = self._rosters.get(chat_id, (set(), 0.0))[0]
+            self._rosters[chat_id] = (previous, time.monotonic() + RETRY_AFTER_ERROR_SECONDS)
+            logger.warning(f"⚠️ Не удалось загрузить администраторов чата {chat_id}: {e}")
+            return previous
+        finally:
+            self._loading.pop(chat_id, None)
+
+    def apply_member_update(self, event: ChatMemberUpdated) -> None:
+        """Обновляет кеш по событию chat_member (без запроса к API)"""
+        cached = self._rosters.get(event.chat.id)
+        if cached is None:
+            return
+        user_id = event.new_chat_member.user.id
+        if event.new_chat_member.status in ADMIN_STATUSES:
+            cached[0].add(user_id)
+        else:
+            cached[0].discard(user_id)
+
+    def invalidate(self, chat_id: Optional[int] = None) -> None:
+        if chat_id is None:
+            self._rosters.clear()
+        else:
+            self._rosters.pop(chat_id, None)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Повтор спам-атаки против SpamWaveGuard с подсчетом запросов к Bot API
+
+Бот подменяется счетчиком вызовов, отложенные действия пишутся во временный
+файл. Каждое нарушение проходит тем же путем, что handle_violation в bot.py:
+до порога - обычная обработка (удаление, мут, предупреждение и его удаление -
+4 запроса), после - пакет волны. Для сравнения печатается число запросов
+без пакетного режима (4 на каждое нарушение).
+
+    python bench/replay_raid.py [--violations 500] [--users 50] [--lockdown 1]
+"""
+
+import sys
+import random
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from aiogram.types import ChatPermissions
+
+from delayed_actions import DelayedActionScheduler
+from spam_wave import SpamWaveGuard
+
+CHAT_ID = -100
+# Запросы на одно нарушение без пакетного режима
+CALLS_PER_VIOLATION = 4
+
+
+class CountingBot:
+    """Вместо Bot: считает вызовы методов Bot API"""
+
+    def __init__(self):
+        self.calls = Counter()
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.calls["deleteMessages"] += 1
+
+    async def send_message(self, chat_id, text):
+        self.calls["sendMessage"] += 1
+        return SimpleNamespace(message_id=1)
+
+    async def get_chat(self, chat_id):
+        self.calls["getChat"] += 1
+        return SimpleNamespace(permissions=ChatPermissions(can_send_messages=True))
+
+    async def set_chat_permissions(self, chat_id, permissions):
+        self.calls["setChatPermissions"] += 1
+
+
+async def replay(args) -> None:
+    bot = CountingBot()
+    muted = set()
+
+    async def mute_member(chat_id: int, user_id: int, duration: int) -> bool:
+        # Как mute_member в bot.py: повторный мут активного мута не шлет запрос
+        if (chat_id, user_id) not in muted:
+            muted.add((chat_id, user_id))
+            bot.calls["restrictChatMember"] += 1
+        return True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        delayed_actions = DelayedActionScheduler(Path(tmp) / "delayed_actions.json")
+        delayed_actions.register("delete_message", lambda payload: bot.delete_messages(payload['chat_id'], [payload['message_id']]))
+        await delayed_actions.start()
+        guard = SpamWaveGuard(
+            bot,
+            mute_member,
+            delayed_actions,
+            threshold=args.threshold,
+            window_seconds=10,
+            flush_seconds=args.flush,
+            quiet_seconds=args.quiet,
+            mute_seconds=300,
+            lockdown_seconds=args.lockdown
+        )
+
+        rng = random.Random(args.seed)
+        individual = 0
+        for message_id in range(args.violations):
+            user_id = rng.randrange(args.users)
+            message = SimpleNamespace(
+                chat=SimpleNamespace(id=CHAT_ID),
+                message_id=message_id,
+                from_user=SimpleNamespace(id=user_id, first_name=f"user{user_id}")
+            )
+            if guard.register_violation(CHAT_ID):
+                guard.enqueue(message)
+            else:
+                individual += 1
+                await bot.delete_messages(CHAT_ID, [message_id])
+                await mute_member(CHAT_ID, user_id, 300)
+                await bot.send_message(CHAT_ID, "warning")
+                bot.calls["deleteMessages"] += 1  # удаление предупреждения
+            await asyncio.sleep(args.interval)
+
+        # Волна закончится после quiet_seconds, права вернутся через lockdown
+        await asyncio.sleep(args.quiet + args.flush * 2 + args.lockdown + 0.5)
+        await guard.stop()
+        pending = len(delayed_actions)
+        await delayed_actions.stop()
+
+    total = sum(bot.calls.values())
+    print(f"нарушений: {args.violations} от {args.users} пользователей, до порога обработано по одному: {individual}")
+    print(f"без пакетного режима: {args.violations * CALLS_PER_VIOLATION} запросов")
+    print(f"с пакетным режимом:   {total} запросов {dict(sorted(bot.calls.items()))}")
+    print(f"невыполненных отложенных действий: {pending}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--violations", type=int, default=500)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.002, help="пауза между нарушениями, сек")
+    parser.add_argument("--threshold", type=int, default=5)
+    parser.add_argument("--flush", type=float, default=0.2, help="SPAM_WAVE_FLUSH_SECONDS")
+    parser.add_argument("--quiet", type=float, default=0.5, help="SPAM_WAVE_QUIET_SECONDS")
+    parser.add_argument("--lockdown", type=float, default=1, help="SPAM_WAVE_LOCKDOWN_SECONDS (0 - без режима чтения)")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(replay(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Проверка и бенчмарк поиска запрещенных слов (word_matcher.py)
+
+- корректность: автомат Ахо-Корасик против перебора (нормализованное слово
+  как подстрока нормализованного текста) на случайных списках слов и текстах
+  с обфускацией (латинские двойники, цифры, повторы букв, невидимые символы);
+- скорость: одна проверка сообщения автоматом против линейного перебора
+  списка, как было раньше (без учета чтения forbidden_words.json на каждое
+  сообщение, которое тоже убрано).
+
+    python bench/word_matcher_bench.py [--cases 3000] [--words 5000]
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from word_matcher import ForbiddenWordsMatcher, normalize_text
+
+CYRILLIC = "абвгдежзийклмнопрстуфхцчшщъыьэюя"
+# Обфускация, которую автомат должен распознать
+OBFUSCATION = {"а": "a", "о": "0", "е": "e", "р": "p", "с": "c", "х": "x", "у": "y", "з": "3", "ч": "4"}
+INVISIBLE = ["​", "­", "⁠"]
+
+MESSAGE = (
+    "Здравствуйте! Подскажите, пожалуйста, как пополнить счет через мбанк? "
+    "Вчера переводил 1500 сом, деньги списались, а на балансе ничего нет. "
+    "Номер заявки 48213, ID игрока 392817465. Жду ответа, спасибо большое за помощь!!"
+)
+
+
+def random_word(rng: random.Random) -> str:
+    return "".join(rng.choice(CYRILLIC) for _ in range(rng.randint(3, 8)))
+
+
+def obfuscate(word: str, rng: random.Random) -> str:
+    out = []
+    for ch in word:
+        if rng.random() < 0.3:
+            ch = OBFUSCATION.get(ch, ch)
+        if rng.random() < 0.2:
+            ch = ch.upper()
+        out.append(ch * (2 if rng.random() < 0.15 else 1))
+        if rng.random() < 0.05:
+            out.append(rng.choice(INVISIBLE))
+    return "".join(out)
+
+
+def brute_force(words: list, text: str) -> bool:
+    """Эталон: нормализованное слово - подстрока нормализованного текста"""
+    normalized = normalize_text(text)
+    for word in words:
+        base = word[1:] if word.startswith("@") else word
+        pattern = normalize_text(base)
+        if pattern and pattern in normalized:
+            return True
+    return False
+
+
+def linear_scan(words: list, text: str) -> bool:
+    """Проверка до автомата: перебор списка подстрокой в тексте в нижнем регистре"""
+    text_lower = text.lower()
+    for word in words:
+        word_lower = word.lower()
+        if word_lower.startswith("@"):
+            username = word_lower.lstrip("@")
+            if f"@{username}" in text_lower or username in text_lower:
+                return True
+        elif word_lower in text_lower:
+            return True
+    return False
+
+
+def check_correctness(cases: int, seed: int) -> int:
+    rng = random.Random(seed)
+    mismatches = 0
+    for case in range(cases):
+        words = [random_word(rng) for _ in range(rng.randint(1, 30))]
+        if rng.random() < 0.2:
+            words.append("@" + random_word(rng))
+        parts = [random_word(rng) for _ in range(rng.randint(0, 12))]
+        if rng.random() < 0.5:
+            parts.insert(rng.randint(0, len(parts)), obfuscate(rng.choice(words).lstrip("@"), rng))
+        text = " ".join(parts)
+        matcher = ForbiddenWordsMatcher(lambda words=words: words)
+        if (matcher.find(text) is not None) != brute_force(words, text):
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"❌ расхождение: слова={words!r} текст={text!r}")
+    return mismatches
+
+
+def bench(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=3000, help="случайных проверок против перебора")
+    parser.add_argument("--words", type=int, default=5000, help="размер списка для бенчмарка")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    mismatches = check_correctness(args.cases, args.seed)
+    print(f"корректность: {args.cases} случаев, расхождений с перебором: {mismatches}")
+
+    rng = random.Random(args.seed)
+    words = [random_word(rng) + random_word(rng) for _ in range(args.words)]
+    matcher = ForbiddenWordsMatcher(lambda: words)
+    started = time.perf_counter()
+    matcher.find("x")
+    print(f"сборка автомата на {len(words)} слов: {(time.perf_counter() - started) * 1000:.0f} мс (один раз)")
+    assert matcher.find(MESSAGE) is None and not linear_scan(words, MESSAGE)
+    print(f"сообщение {len(MESSAGE)} символов, {len(words)} слов:")
+    print(f"  линейный перебор: {bench(lambda: linear_scan(words, MESSAGE), 200):8.1f} мкс")
+    print(f"  автомат:          {bench(lambda: matcher.find(MESSAGE), 2000):8.1f} мкс")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,9 +15,13 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode, ChatType
+from aiogram.enums import ParseMode, ChatType, ChatMemberStatus
 from config import Config
 from words_manager import add_word, remove_word, get_words, get_words_count
+from word_matcher import ForbiddenWordsMatcher
+from admin_cache import AdminRosterCache
+from delayed_actions import DelayedActionScheduler
+from spam_wave import SpamWaveGuard
 
 # Настройка логирования
 logging.basicConfig(
@@ -35,6 +39,12 @@ storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 router = Router()
 
+# Администраторы групп (getChatAdministrators + TTL + обновления chat_member)
+admin_cache = AdminRosterCache(bot, ttl=Config.ADMIN_CACHE_TTL_SECONDS)
+
+# Отложенные действия (удаление предупреждений, окончание мутов), сохраняются между рестартами
+delayed_actions = DelayedActionScheduler(Config.DELAYED_ACTIONS_FILE)
+
 
 # FSM состояния для управления словами
 class WordManagement(StatesGroup):
@@ -51,6 +61,10 @@ def get_forbidden_words() -> list:
         return Config.FORBIDDEN_WORDS
 
 
+# Автомат по запрещенным словам (пересобирается только при изменении списка)
+forbidden_words_matcher = ForbiddenWordsMatcher(get_forbidden_words)
+
+
 def contains_forbidden_words(text: str) -> bool:
     """
     Проверяет, содержит ли текст запрещенные слова
@@ -64,30 +78,13 @@ def contains_forbidden_words(text: str) -> bool:
     if not text:
         return False
     
-    text_lower = text.lower()
-    logger.debug(f"🔍 Проверяю текст на запрещенные слова: '{text_lower[:100]}'")
-    
-    # Получаем актуальный список слов
-    forbidden_words = get_forbidden_words()
+    logger.debug(f"🔍 Проверяю текст на запрещенные слова: '{text[:100]}'")
     
-    # Проверяем каждое запрещенное слово
-    for word in forbidden_words:
-        word_lower = word.lower()
-        
-        # Если слово начинается с @, ищем его как упоминание
-        if word_lower.startswith("@"):
-            # Ищем @username в тексте
-            username = word_lower.lstrip("@")
-            # Проверяем упоминание с @ или без
-            if f"@{username}" in text_lower or username in text_lower:
-                logger.info(f"🚫 Найдено запрещенное упоминание: '{word}' в тексте: '{text[:50]}...'")
-                return True
-        else:
-            # Для обычных слов проверяем вхождение (без границ слова для кириллицы)
-            # Используем простой поиск подстроки, так как \b не всегда работает с кириллицей
-            if word_lower in text_lower:
-                logger.info(f"🚫 Найдено запрещенное слово: '{word}' в тексте: '{text[:50]}...'")
-                return True
+    # Один проход автомата по нормализованному тексту (регистр, похожие буквы, повторы)
+    word = forbidden_words_matcher.find(text)
+    if word:
+        logger.info(f"🚫 Найдено запрещенное слово: '{word}' в тексте: '{text[:50]}...'")
+        return True
     
     logger.debug(f"✅ Запрещенных слов не найдено")
     return False
@@ -116,6 +113,23 @@ async def delete_message(message: Message):
             logger.error(f"❌ Ошибка при удалении сообщения {message.message_id}: {e}")
 
 
+def _mute_key(chat_id: int, user_id: int) -> str:
+    return f"mute:{chat_id}:{user_id}"
+
+
+async def delete_message_later(payload: dict):
+    """Отложенное действие: удалить сообщение (предупреждение)"""
+    try:
+        await bot.delete_message(chat_id=payload['chat_id'], message_id=payload['message_id'])
+    except Exception as e:
+        logger.debug(f"⚠️ Не удалось удалить сообщение {payload.get('message_id')}: {e}")
+
+
+async def mute_expired(payload: dict):
+    """Отложенное действие: мут закончился (Telegram снимает его сам по until_date)"""
+    logger.debug(f"🔊 Мут пользователя {payload.get('user_id')} в чате {payload.get('chat_id')} истек")
+
+
 async def mute_user(message: Message, duration_seconds: int = 300):
     """
     Мутит пользователя на указанное время
@@ -124,6 +138,24 @@ async def mute_user(message: Message, duration_seconds: int = 300):
         message: Сообщение от пользователя
         duration_seconds: Длительность мута в секундах (по умолчанию 5 минут)
     """
+    return await mute_member(message.chat.id, message.from_user.id, duration_seconds)
+
+
+async def mute_member(chat_id: int, user_id: int, duration_seconds: int = 300) -> bool:
+    """
+    Мутит участника чата на указанное время
+    
+    Args:
+        chat_id: ID чата
+        user_id: ID пользователя
+        duration_seconds: Длительность мута в секундах
+    """
+    mute_key = _mute_key(chat_id, user_id)
+    if mute_key in delayed_actions:
+        # Пользователь уже замьючен ботом (сообщения, отправленные до мута) - повторный запрос не нужен.
+        # Если мут сняли в интерфейсе Telegram, ключ отменяет chat_member_updated
+        logger.debug(f"🔇 Пользователь {user_id} уже замьючен в чате {chat_id}")
+        return True
     try:
         # Создаем ограничения (мут)
         permissions = ChatPermissions(
@@ -142,20 +174,26 @@ async def mute_user(message: Message, duration_seconds: int = 300):
         
         # Применяем мут
         await bot.restrict_chat_member(
-            chat_id=message.chat.id,
-            user_id=message.from_user.id,
+            chat_id=chat_id,
+            user_id=user_id,
             permissions=permissions,
             until_date=until_date
         )
+        delayed_actions.schedule(
+            "mute_expired",
+            duration_seconds,
+            {'chat_id': chat_id, 'user_id': user_id},
+            key=mute_key
+        )
         
-        logger.info(f"🔇 Пользователь {message.from_user.id} замьючен на {duration_seconds} секунд в чате {message.chat.id}")
+        logger.info(f"🔇 Пользователь {user_id} замьючен на {duration_seconds} секунд в чате {chat_id}")
         return True
     except Exception as e:
         error_str = str(e).lower()
         if "not enough rights" in error_str or "can't restrict" in error_str:
-            logger.warning(f"⚠️ У бота нет прав на ограничение пользователей в чате {message.chat.id}")
+            logger.warning(f"⚠️ У бота нет прав на ограничение пользователей в чате {chat_id}")
         else:
-            logger.error(f"❌ Ошибка при муте пользователя {message.from_user.id}: {e}")
+            logger.error(f"❌ Ошибка при муте пользователя {user_id}: {e}")
         return False
 
 
@@ -190,6 +228,7 @@ async def unmute_user(chat_id: int, user_id: int) -> tuple[bool, str]:
             permissions=permissions,
             until_date=None
         )
+        delayed_actions.cancel(_mute_key(chat_id, user_id))
         
         logger.info(f"🔊 Пользователь {user_id} размьючен в чате {chat_id}")
         return True, f"✅ Пользователь размьючен"
@@ -205,6 +244,70 @@ async def unmute_user(chat_id: int, user_id: int) -> tuple[bool, str]:
             return False, f"❌ Ошибка: {str(e)}"
 
 
+# Пакетный режим при спам-атаке (всплеск нарушений в одном чате)
+spam_wave = SpamWaveGuard(
+    bot,
+    mute_member,
+    delayed_actions,
+    threshold=Config.SPAM_WAVE_THRESHOLD,
+    window_seconds=Config.SPAM_WAVE_WINDOW_SECONDS,
+    flush_seconds=Config.SPAM_WAVE_FLUSH_SECONDS,
+    quiet_seconds=Config.SPAM_WAVE_QUIET_SECONDS,
+    mute_seconds=Config.MUTE_DURATION_SECONDS,
+    lockdown_seconds=Config.SPAM_WAVE_LOCKDOWN_SECONDS,
+    summary_delete_seconds=Config.SPAM_WAVE_SUMMARY_DELETE_SECONDS
+)
+
+
+async def handle_violation(message: Message):
+    """
+    Наказывает за нарушение: удаление, мут, предупреждение.
+    Во время спам-атаки сообщение уходит в пакет (удаление и мут - пачкой, одна сводка)
+    
+    Args:
+        message: Сообщение нарушителя
+    """
+    if spam_wave.register_violation(message.chat.id):
+        spam_wave.enqueue(message)
+        return
+    
+    await delete_message(message)
+    
+    # Мутим пользователя на 5 минут
+    mute_success = await mute_user(message, Config.MUTE_DURATION_SECONDS)
+    
+    # Отправляем предупреждение (если включено в конфиге)
+    if Config.SEND_WARNING:
+        await send_warning(message, mute_success)
+
+
+async def send_warning(message: Message, mute_success: bool):
+    """
+    Отправляет предупреждение и планирует его удаление (обработчик не ждет)
+    
+    Args:
+        message: Удаленное сообщение нарушителя
+        mute_success: Удалось ли замьютить пользователя
+    """
+    try:
+        mute_text = " и замьючен на 5 минут" if mute_success else ""
+        warning_text = f"⚠️ {message.from_user.first_name or 'Пользователь'}, ваше сообщение было удалено{mute_text} из-за нарушения правил группы."
+        warning_msg = await bot.send_message(
+            chat_id=message.chat.id,
+            text=warning_text
+        )
+        
+        # Удаляем предупреждение через указанное время
+        if Config.WARNING_DELETE_SECONDS > 0:
+            delayed_actions.schedule(
+                "delete_message",
+                Config.WARNING_DELETE_SECONDS,
+                {'chat_id': message.chat.id, 'message_id': warning_msg.message_id}
+            )
+    except Exception as e:
+        logger.error(f"❌ Ошибка при отправке предупреждения: {e}")
+
+
 @router.message(Command("test"), F.chat.type.in_([ChatType.GROUP, ChatType.SUPERGROUP]))
 async def test_command(message: Message):
     """Команда /test для проверки работы бота в группе"""
@@ -331,10 +434,13 @@ async def moderate_message(message: Message):
     
     # Пропускаем сообщения от администраторов (если включено в конфиге)
     if Config.SKIP_ADMINS:
+        # Анонимный администратор пишет от имени самой группы
+        if message.sender_chat and message.sender_chat.id == message.chat.id:
+            logger.info(f"⏭️ Пропущено сообщение анонимного администратора в чате {message.chat.id}")
+            return
         try:
-            member = await bot.get_chat_member(message.chat.id, message.from_user.id)
-            if member.status in ['administrator', 'creator']:
-                logger.info(f"⏭️ Пропущено сообщение от администратора {message.from_user.id} (статус: {member.status})")
+            if await admin_cache.is_admin(message.chat.id, message.from_user.id):
+                logger.info(f"⏭️ Пропущено сообщение от администратора {message.from_user.id}")
                 return
         except Exception as e:
             logger.warning(f"⚠️ Ошибка при проверке статуса пользователя: {e}")
@@ -351,72 +457,17 @@ async def moderate_message(message: Message):
             if entity.type == "mention":
                 # Извлекаем username из упоминания
                 mention_text = text[entity.offset:entity.offset + entity.length]
-                # Убираем @ для проверки
-                username = mention_text.lstrip("@").lower()
-                # Получаем актуальный список слов
-                forbidden_words = get_forbidden_words()
                 # Проверяем, есть ли этот username в запрещенных словах
-                for forbidden_word in forbidden_words:
-                    forbidden_username = forbidden_word.lstrip("@").lower()
-                    if username == forbidden_username:
-                        logger.info(f"🚫 Найдено запрещенное упоминание: '{mention_text}'")
-                        await delete_message(message)
-                        # Мутим пользователя на 5 минут
-                        mute_success = await mute_user(message, Config.MUTE_DURATION_SECONDS)
-                        
-                        if Config.SEND_WARNING:
-                            try:
-                                mute_text = " и замьючен на 5 минут" if mute_success else ""
-                                warning_text = f"⚠️ {message.from_user.first_name or 'Пользователь'}, ваше сообщение было удалено{mute_text} из-за нарушения правил группы."
-                                warning_msg = await bot.send_message(
-                                    chat_id=message.chat.id,
-                                    text=warning_text
-                                )
-                                if Config.WARNING_DELETE_SECONDS > 0:
-                                    await asyncio.sleep(Config.WARNING_DELETE_SECONDS)
-                                    try:
-                                        await bot.delete_message(
-                                            chat_id=message.chat.id,
-                                            message_id=warning_msg.message_id
-                                        )
-                                    except:
-                                        pass
-                            except Exception as e:
-                                logger.error(f"❌ Ошибка при отправке предупреждения: {e}")
-                        return
+                if forbidden_words_matcher.is_forbidden_username(mention_text):
+                    logger.info(f"🚫 Найдено запрещенное упоминание: '{mention_text}'")
+                    await handle_violation(message)
+                    return
     
     # Проверяем на наличие запрещенных слов в тексте
     logger.debug(f"🔍 Начинаю проверку текста на запрещенные слова...")
     if contains_forbidden_words(text):
         logger.info(f"🚫 Обнаружено запрещенное слово! Удаляю сообщение {message.message_id}")
-        # Удаляем сообщение
-        await delete_message(message)
-        
-        # Мутим пользователя на 5 минут
-        mute_success = await mute_user(message, Config.MUTE_DURATION_SECONDS)
-        
-        # Отправляем предупреждение (если включено в конфиге)
-        if Config.SEND_WARNING:
-            try:
-                mute_text = " и замьючен на 5 минут" if mute_success else ""
-                warning_text = f"⚠️ {message.from_user.first_name or 'Пользователь'}, ваше сообщение было удалено{mute_text} из-за нарушения правил группы."
-                warning_msg = await bot.send_message(
-                    chat_id=message.chat.id,
-                    text=warning_text
-                )
-                
-                # Удаляем предупреждение через указанное время
-                if Config.WARNING_DELETE_SECONDS > 0:
-                    await asyncio.sleep(Config.WARNING_DELETE_SECONDS)
-                    try:
-                        await bot.delete_message(
-                            chat_id=message.chat.id,
-                            message_id=warning_msg.message_id
-                        )
-                    except:
-                        pass
-            except Exception as e:
-                logger.error(f"❌ Ошибка при отправке предупреждения: {e}")
+        await handle_violation(message)
 
 
 @router.my_chat_member(ChatMemberUpdatedFilter(IS_NOT_MEMBER >> IS_MEMBER))
@@ -443,6 +494,20 @@ async def bot_added_to_group(event: ChatMemberUpdated):
         logger.error(f"❌ Ошибка при проверке прав бота: {e}")
 
 
+@router.chat_member()
+async def chat_member_updated(event: ChatMemberUpdated):
+    """
+    Назначение/снятие администраторов - обновляем кеш без запроса к API.
+    Снятие ограничений (админом в интерфейсе Telegram, а не через /unmute) -
+    отменяем ключ мута, иначе mute_member считал бы пользователя замьюченным
+    """
+    admin_cache.apply_member_update(event)
+    member = event.new_chat_member
+    still_muted = member.status == ChatMemberStatus.RESTRICTED and member.can_send_messages is False
+    if not still_muted and delayed_actions.cancel(_mute_key(event.chat.id, member.user.id)):
+        logger.info(f"🔊 Мут пользователя {member.user.id} в чате {event.chat.id} снят вне бота")
+
+
 def is_admin(user_id: int) -> bool:
     """Проверяет, является ли пользователь администратором"""
     return user_id == Config.ADMIN_ID
@@ -636,9 +701,18 @@ async def main():
     except Exception as e:
         logger.error(f"❌ Ошибка при получении информации о боте: {e}")
     
+    # Планировщик отложенных действий (просроченные за время простоя выполнятся сразу)
+    delayed_actions.register("delete_message", delete_message_later)
+    delayed_actions.register("mute_expired", mute_expired)
+    await delayed_actions.start()
+    
     # Запускаем бота
     logger.info("🔄 Начинаю polling...")
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    try:
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        await spam_wave.stop()
+        await delayed_actions.stop()
 
 
 if __name__ == '__main__':
@@ -75,6 +75,10 @@ class Config:
     # Пропускать сообщения от администраторов группы
     SKIP_ADMINS = True
     
+    # Сколько секунд хранить список администраторов группы до перезагрузки
+    # (назначения/снятия между перезагрузками приходят обновлениями chat_member)
+    ADMIN_CACHE_TTL_SECONDS = int(os.getenv("ADMIN_CACHE_TTL_SECONDS", "600"))
+    
     # Отправлять предупреждение при удалении сообщения
     SEND_WARNING = True
     
@@ -83,4 +87,18 @@ class Config:
     
     # Время в секундах, через которое удалять предупреждение (0 = не удалять)
     WARNING_DELETE_SECONDS = 10
-
+    
+    # Файл с отложенными действиями (удаление предупреждений, окончание мутов)
+    DELAYED_ACTIONS_FILE = Path(os.getenv("DELAYED_ACTIONS_FILE", str(Path(__file__).resolve().parent / "delayed_actions.json")))
+    
+    # Спам-атака: столько нарушений в одном чате за окно (секунд) включают пакетный режим
+    SPAM_WAVE_THRESHOLD = int(os.getenv("SPAM_WAVE_THRESHOLD", "5"))
+    SPAM_WAVE_WINDOW_SECONDS = float(os.getenv("SPAM_WAVE_WINDOW_SECONDS", "10"))
+    # Как часто в пакетном режиме удалять накопленные сообщения и мутить нарушителей
+    SPAM_WAVE_FLUSH_SECONDS = float(os.getenv("SPAM_WAVE_FLUSH_SECONDS", "1"))
+    # Волна закончилась, если столько секунд нет нарушений (после этого - одна сводка)
+    SPAM_WAVE_QUIET_SECONDS = float(os.getenv("SPAM_WAVE_QUIET_SECONDS", "30"))
+    # Режим "только чтение" для всего чата на время атаки, секунд (0 = не включать)
+    SPAM_WAVE_LOCKDOWN_SECONDS = int(os.getenv("SPAM_WAVE_LOCKDOWN_SECONDS", "0"))
+    # Через сколько секунд удалять сводку по атаке (0 = не удалять)
+    SPAM_WAVE_SUMMARY_DELETE_SECONDS = int(os.getenv("SPAM_WAVE_SUMMARY_DELETE_SECONDS", "60"))
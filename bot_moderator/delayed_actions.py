@@ -0,0 +1,162 @@
+"""
+Планировщик отложенных действий модератора (удаление предупреждений, окончание мутов)
+
+- все действия лежат в одной куче (heapq), одна фоновая задача спит до
+  ближайшего срока - обработчики сообщений не ждут asyncio.sleep;
+- действия сохраняются в JSON-файл (с задержкой, атомарной заменой файла),
+  после рестарта просроченные действия выполняются сразу;
+- у действия может быть ключ: повторное планирование с тем же ключом заменяет
+  прежнее, по ключу можно отменить или проверить наличие действия.
+"""
+
+import json
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Обработчик действия: async-функция, получает payload
+ActionHandler = Callable[[dict], Awaitable[None]]
+
+# Как часто сохранять изменения в файл (секунд)
+PERSIST_INTERVAL = 5
+
+
+class DelayedActionScheduler:
+    """Отложенные действия: kind + payload в момент run_at (unix time)"""
+
+    def __init__(self, state_file: Path, max_concurrency: int = 10):
+        self.state_file = Path(state_file)
+        self._handlers: Dict[str, ActionHandler] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        # key -> (seq актуальной записи в куче, run_at, kind, payload)
+        self._actions: Dict[str, Tuple[int, float, str, dict]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._dirty = False
+        self._last_persist = 0.0
+
+    def register(self, kind: str, handler: ActionHandler) -> None:
+        self._handlers[kind] = handler
+
+    # ---------- публичный API ----------
+
+    def schedule(self, kind: str, delay: float, payload: dict, key: Optional[str] = None) -> str:
+        """Планирует действие через delay секунд. Возвращает ключ действия"""
+        if key is None:
+            key = f"{kind}:{next(self._seq)}:{time.time()}"
+        self._push(key, time.time() + delay, kind, payload)
+        self._dirty = True
+        return key
+
+    def cancel(self, key: str) -> bool:
+        """Отменяет действие (запись в куче удаляется лениво)"""
+        if self._actions.pop(key, None) is None:
+            return False
+        self._dirty = True
+        return True
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._actions
+
+    def __len__(self) -> int:
+        return len(self._actions)
+
+    async def start(self) -> None:
+        """Загружает сохраненные действия и запускает планировщик"""
+        self._wakeup = asyncio.Event()
+        self._load()
+        self._runner = asyncio.create_task(self._run())
+        logger.info(f"⏰ Планировщик отложенных действий запущен, в очереди: {len(self._actions)}")
+
+    async def stop(self) -> None:
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        self._persist()
+
+    # ---------- внутреннее ----------
+
+    def _push(self, key: str, run_at: float, kind: str, payload: dict) -> None:
+        seq = next(self._seq)
+        self._actions[key] = (seq, run_at, kind, payload)
+        heapq.heappush(self._heap, (run_at, seq, key))
+        if self._wakeup is not None and self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def _load(self) -> None:
+        if not self.state_file.exists():
+            return
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for key, item in data.items():
+                self._push(key, float(item['run_at']), item['kind'], item.get('payload', {}))
+        except Exception as e:
+            logger.error(f"❌ Ошибка при загрузке отложенных действий: {e}")
+
+    def _persist(self) -> None:
+        self._dirty = False
+        self._last_persist = time.monotonic()
+        data = {
+            key: {'run_at': run_at, 'kind': kind, 'payload': payload}
+            for key, (_, run_at, kind, payload) in self._actions.items()
+        }
+        try:
+            tmp_file = self.state_file.with_name(self.state_file.name + '.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            tmp_file.replace(self.state_file)
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"❌ Ошибка при сохранении отложенных действий: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            if self._dirty and time.monotonic() - self._last_persist >= PERSIST_INTERVAL:
+                self._persist()
+
+            # Пропускаем отмененные и переставленные записи
+            while self._heap and self._actions.get(self._heap[0][2], (None,))[0] != self._heap[0][1]:
+                heapq.heappop(self._heap)
+
+            self._wakeup.clear()
+            delay = self._heap[0][0] - time.time() if self._heap else PERSIST_INTERVAL
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, PERSIST_INTERVAL))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, key = heapq.heappop(self._heap)
+            _, _, kind, payload = self._actions.pop(key)
+            self._dirty = True
+            task = asyncio.create_task(self._execute(key, kind, payload))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, key: str, kind: str, payload: dict) -> None:
+        handler = self._handlers.get(kind)
+        if handler is None:
+            logger.warning(f"⚠️ Нет обработчика для отложенного действия {kind} ({key})")
+            return
+        async with self._semaphore:
+            try:
+                await handler(payload)
+            except Exception as e:
+                logger.error(f"❌ Ошибка отложенного действия {kind} ({key}): {e}")
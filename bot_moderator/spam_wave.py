@@ -0,0 +1,211 @@
+"""
+Режим отражения спам-атаки (рейда)
+
+Пока нарушений в чате немного, каждое обрабатывается как обычно
+(удаление, мут, предупреждение). Если за SPAM_WAVE_WINDOW_SECONDS набирается
+SPAM_WAVE_THRESHOLD нарушений, чат переходит в пакетный режим:
+- сообщения копятся и раз в SPAM_WAVE_FLUSH_SECONDS удаляются одним
+  deleteMessages (до 100 id за запрос);
+- муты собираются по пользователям: один запрос на нарушителя за волну;
+- вместо предупреждения каждому - одна сводка по окончании волны;
+- (опционально) чат на время переводится в режим "только чтение" -
+  в Bot API нет метода для медленного режима, поэтому используются
+  права участников по умолчанию, прежние права возвращаются отложенным действием.
+Волна заканчивается, когда нарушений нет SPAM_WAVE_QUIET_SECONDS.
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.types import ChatPermissions, Message
+
+from delayed_actions import DelayedActionScheduler
+
+logger = logging.getLogger(__name__)
+
+# Максимум id в одном запросе deleteMessages
+DELETE_MESSAGES_LIMIT = 100
+
+# Мут пользователя: (chat_id, user_id, длительность) -> успех
+MuteFunc = Callable[[int, int, int], Awaitable[bool]]
+
+
+class _ChatWave:
+    """Состояние волны в одном чате"""
+
+    def __init__(self):
+        self.message_ids: List[int] = []
+        # user_id -> имя (для сводки), ожидающие мута
+        self.pending_users: Dict[int, str] = {}
+        self.muted_users: Dict[int, str] = {}
+        self.deleted = 0
+        self.started_at = time.monotonic()
+        self.last_violation = self.started_at
+        self.task: Optional[asyncio.Task] = None
+
+
+class SpamWaveGuard:
+    """Детектор всплесков нарушений и пакетная обработка во время волны"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        mute_member: MuteFunc,
+        delayed_actions: DelayedActionScheduler,
+        threshold: int,
+        window_seconds: float,
+        flush_seconds: float,
+        quiet_seconds: float,
+        mute_seconds: int,
+        lockdown_seconds: int = 0,
+        summary_delete_seconds: int = 0
+    ):
+        self.bot = bot
+        self.mute_member = mute_member
+        self.delayed_actions = delayed_actions
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.flush_seconds = flush_seconds
+        self.quiet_seconds = quiet_seconds
+        self.mute_seconds = mute_seconds
+        self.lockdown_seconds = lockdown_seconds
+        self.summary_delete_seconds = summary_delete_seconds
+        # chat_id -> время последних нарушений (скользящее окно)
+        self._recent: Dict[int, Deque[float]] = {}
+        self._waves: Dict[int, _ChatWave] = {}
+        delayed_actions.register("restore_chat_permissions", self._restore_permissions)
+
+    def register_violation(self, chat_id: int) -> bool:
+        """Учитывает нарушение в чате. True - чат в режиме волны (обрабатывать через enqueue)"""
+        now = time.monotonic()
+        wave = self._waves.get(chat_id)
+        if wave is not None:
+            wave.last_violation = now
+            return True
+
+        recent = self._recent.setdefault(chat_id, deque())
+        recent.append(now)
+        while recent and now - recent[0] > self.window_seconds:
+            recent.popleft()
+        if len(recent) < self.threshold:
+            return False
+
+        del self._recent[chat_id]
+        wave = _ChatWave()
+        self._waves[chat_id] = wave
+        wave.task = asyncio.create_task(self._run_wave(chat_id, wave))
+        logger.warning(f"🚨 Спам-атака в чате {chat_id}: {self.threshold}+ нарушений за {self.window_seconds} сек, включен пакетный режим")
+        return True
+
+    def enqueue(self, message: Message) -> None:
+        """Добавляет сообщение нарушителя в пакет текущей волны"""
+        wave = self._waves.get(message.chat.id)
+        if wave is None:
+            return
+        wave.message_ids.append(message.message_id)
+        user = message.from_user
+        if user and user.id not in wave.muted_users:
+            wave.pending_users[user.id] = user.first_name or str(user.id)
+
+    def is_active(self, chat_id: int) -> bool:
+        return chat_id in self._waves
+
+    async def stop(self) -> None:
+        """Досылает накопленные пакеты (при остановке бота)"""
+        for chat_id, wave in list(self._waves.items()):
+            if wave.task:
+                wave.task.cancel()
+            await self._flush(chat_id, wave)
+        self._waves.clear()
+
+    # ---------- внутреннее ----------
+
+    async def _run_wave(self, chat_id: int, wave: _ChatWave) -> None:
+        try:
+            if self.lockdown_seconds > 0:
+                await self._lockdown(chat_id)
+            while True:
+                await asyncio.sleep(self.flush_seconds)
+                await self._flush(chat_id, wave)
+                if time.monotonic() - wave.last_violation >= self.quiet_seconds:
+                    break
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            logger.error(f"❌ Ошибка в пакетном режиме чата {chat_id}: {e}")
+        self._waves.pop(chat_id, None)
+        await self._flush(chat_id, wave)
+        await self._send_summary(chat_id, wave)
+
+    async def _flush(self, chat_id: int, wave: _ChatWave) -> None:
+        message_ids, wave.message_ids = wave.message_ids, []
+        pending_users, wave.pending_users = wave.pending_users, {}
+
+        for start in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+            chunk = message_ids[start:start + DELETE_MESSAGES_LIMIT]
+            try:
+                await self.bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+                wave.deleted += len(chunk)
+            except Exception as e:
+                logger.error(f"❌ Ошибка пакетного удаления {len(chunk)} сообщений в чате {chat_id}: {e}")
+
+        for user_id, name in pending_users.items():
+            if user_id in wave.muted_users:
+                continue
+            if await self.mute_member(chat_id, user_id, self.mute_seconds):
+                wave.muted_users[user_id] = name
+
+        if message_ids or pending_users:
+            logger.info(f"🧹 Чат {chat_id}: пакетно удалено {len(message_ids)} сообщений, новых нарушителей {len(pending_users)}")
+
+    async def _send_summary(self, chat_id: int, wave: _ChatWave) -> None:
+        duration = int(time.monotonic() - wave.started_at)
+        logger.warning(f"✅ Спам-атака в чате {chat_id} отражена за {duration} сек: удалено {wave.deleted}, замьючено {len(wave.muted_users)}")
+        try:
+            summary_msg = await self.bot.send_message(
+                chat_id=chat_id,
+                text=(
+                    f"🛡 Отражена спам-атака: удалено сообщений - {wave.deleted}, "
+                    f"замьючено пользователей - {len(wave.muted_users)}."
+                )
+            )
+            if self.summary_delete_seconds > 0:
+                self.delayed_actions.schedule(
+                    "delete_message",
+                    self.summary_delete_seconds,
+                    {'chat_id': chat_id, 'message_id': summary_msg.message_id}
+                )
+        except Exception as e:
+            logger.error(f"❌ Ошибка при отправке сводки по атаке в чат {chat_id}: {e}")
+
+    async def _lockdown(self, chat_id: int) -> None:
+        """Временно запрещает участникам писать; прежние права вернет отложенное действие"""
+        lockdown_key = f"lockdown:{chat_id}"
+        if lockdown_key in self.delayed_actions:
+            # Чат уже закрыт прошлой волной - не сохраняем "закрытые" права как исходные
+            return
+        try:
+            chat = await self.bot.get_chat(chat_id)
+            if chat.permissions is None:
+                return
+            await self.bot.set_chat_permissions(chat_id=chat_id, permissions=ChatPermissions(can_send_messages=False))
+            self.delayed_actions.schedule(
+                "restore_chat_permissions",
+                self.lockdown_seconds,
+                {'chat_id': chat_id, 'permissions': chat.permissions.model_dump(exclude_none=True)},
+                key=lockdown_key
+            )
+            logger.warning(f"🔒 Чат {chat_id} переведен в режим только чтения на {self.lockdown_seconds} сек")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось ограничить чат {chat_id}: {e}")
+
+    async def _restore_permissions(self, payload: dict) -> None:
+        await self.bot.set_chat_permissions(
+            chat_id=payload['chat_id'],
+            permissions=ChatPermissions(**payload['permissions'])
+        )
+        logger.info(f"🔓 Права участников чата {payload['chat_id']} восстановлены")
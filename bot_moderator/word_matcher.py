@@ -0,0 +1,130 @@
+"""
+Поиск запрещенных слов автоматом Ахо-Корасик
+
+- автомат строится один раз и пересобирается только когда меняется список
+  слов (add_word/remove_word или правка forbidden_words.json);
+- проверка сообщения - один проход по тексту, O(длины текста) независимо
+  от количества слов;
+- текст и слова приводятся к одному виду: регистр, латинские двойники
+  кириллических букв (a/а, o/о, p/р ...), цифры-заменители, диакритика,
+  невидимые символы и повторы букв ("пууул" -> "пул").
+"""
+
+import re
+import logging
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Латиница и цифры, похожие на кириллицу -> кириллица
+_HOMOGLYPHS = str.maketrans({
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к', 'm': 'м',
+    'o': 'о', 'p': 'р', 't': 'т', 'x': 'х', 'y': 'у',
+    '0': 'о', '3': 'з', '4': 'ч', '6': 'б',
+})
+_INVISIBLE_RE = re.compile('[\u00ad\u200b-\u200f\u2060\ufeff]')
+_REPEATS_RE = re.compile(r'(.)\1+')
+
+
+def normalize_text(text: str) -> str:
+    """Приводит текст к каноническому виду для поиска запрещенных слов"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    # Убираем диакритику (ё -> е, й -> и) и невидимые символы
+    text = ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+    text = _INVISIBLE_RE.sub('', text)
+    text = text.translate(_HOMOGLYPHS)
+    return _REPEATS_RE.sub(r'\1', text)
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик: поиск любого из шаблонов за один проход по тексту"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        """patterns: пары (нормализованный шаблон, исходное слово)"""
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Для каждого состояния - слово, которое заканчивается в нем или в его суффиксе
+        self._out: List[Optional[str]] = [None]
+        self.size = 0
+
+        for pattern, word in patterns:
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                node = nxt
+            if self._out[node] is None:
+                self._out[node] = word
+            self.size += 1
+
+        # Суффиксные ссылки (обход в ширину)
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for ch, nxt in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                if self._out[nxt] is None:
+                    self._out[nxt] = self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def search(self, text: str) -> Optional[str]:
+        """Первое найденное слово или None"""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node] is not None:
+                return out[node]
+        return None
+
+
+class ForbiddenWordsMatcher:
+    """Автомат по актуальному списку запрещенных слов"""
+
+    def __init__(self, words_provider: Callable[[], list]):
+        self._words_provider = words_provider
+        self._words: Optional[list] = None
+        self._automaton = AhoCorasick([])
+        self._usernames: frozenset = frozenset()
+
+    def _refresh(self) -> None:
+        words = self._words_provider()
+        # words_manager возвращает тот же объект списка, пока слова не менялись
+        if words is self._words:
+            return
+        self._words = words
+        patterns = []
+        usernames = set()
+        for word in words:
+            # "@username" ищется и с @, и без - достаточно искать без
+            base = word[1:] if word.startswith('@') else word
+            patterns.append((normalize_text(base), word))
+            usernames.add(word.lstrip('@').lower())
+        self._automaton = AhoCorasick(patterns)
+        self._usernames = frozenset(usernames)
+        logger.info(f"🔄 Автомат запрещенных слов пересобран: {self._automaton.size} слов")
+
+    def find(self, text: str) -> Optional[str]:
+        """Возвращает запрещенное слово, найденное в тексте, или None"""
+        if not text:
+            return None
+        self._refresh()
+        return self._automaton.search(normalize_text(text))
+
+    def is_forbidden_username(self, username: str) -> bool:
+        """Упоминание @username совпадает с запрещенным"""
+        self._refresh()
+        return username.lstrip('@').lower() in self._usernames
@@ -5,11 +5,24 @@
 import json
 import logging
 from pathlib import Path
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
 WORDS_FILE = Path(__file__).parent / 'forbidden_words.json'
 
+# Кеш списка слов: файл перечитывается только если изменилось время его модификации
+_words_cache: list = []
+_words_mtime: Optional[int] = None
+_words_loaded = False
+
+
+def _file_mtime() -> Optional[int]:
+    try:
+        return WORDS_FILE.stat().st_mtime_ns
+    except OSError:
+        return None
+
 
 def load_words() -> list:
     """Загружает список запрещенных слов из файла"""
@@ -34,6 +47,7 @@ def save_words(words: list) -> bool:
         data = {'words': words}
         with open(WORDS_FILE, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        _update_cache(list(words))
         logger.info(f"✅ Сохранено {len(words)} запрещенных слов в файл")
         return True
     except Exception as e:
@@ -77,12 +91,25 @@ def remove_word(word: str) -> tuple[bool, str]:
         return False, "❌ Ошибка при сохранении изменений"
 
 
+def _update_cache(words: list) -> None:
+    global _words_cache, _words_mtime, _words_loaded
+    _words_cache = words
+    _words_mtime = _file_mtime()
+    _words_loaded = True
+
+
 def get_words() -> list:
-    """Возвращает список всех запрещенных слов"""
-    return load_words()
+    """
+    Возвращает список всех запрещенных слов.
+    Пока файл не менялся, возвращается один и тот же закешированный список
+    (по нему word_matcher понимает, что автомат пересобирать не нужно).
+    """
+    if not _words_loaded or _file_mtime() != _words_mtime:
+        _update_cache(load_words())
+    return _words_cache
 
 
 def get_words_count() -> int:
     """Возвращает количество запрещенных слов"""
-    return len(load_words())
+    return len(get_words())
 
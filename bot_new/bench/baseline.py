@@ -0,0 +1,34 @@
+"""
+Загрузка модуля бота в версии из истории git (для сравнения "до/после" в бенчмарках)
+"""
+
+import types
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+BOT_DIR = Path(__file__).resolve().parents[1]
+
+
+def load_module_at(rev: str, rel_path: str, name: str) -> Optional[types.ModuleType]:
+    """
+    Исполняет rel_path (путь от bot_new/) в ревизии rev как отдельный модуль.
+    __file__ указывает на текущий файл, чтобы относительные пути к ресурсам работали.
+    None - git или ревизия недоступны (например, копия без .git)
+    """
+    try:
+        git_path = subprocess.run(
+            ["git", "ls-files", "--full-name", rel_path],
+            cwd=BOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip() or f"bot_new/{rel_path}"
+        source = subprocess.run(
+            ["git", "show", f"{rev}:{git_path}"],
+            cwd=BOT_DIR, capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"⚠️ Не удалось загрузить {rel_path} из ревизии {rev}: {e}")
+        return None
+    module = types.ModuleType(name)
+    module.__file__ = str(BOT_DIR / rel_path)
+    exec(compile(source, f"{rev}:{git_path}", "exec"), module.__dict__)
+    return module
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк памяти хранилища FSM под нагрузкой 100k пользователей
+
+Каждый пользователь проходит начало депозита: set_state + set_data в хранилище
+FSM и запись в user_states. Пользователи приходят волнами в течение суток
+(FSM_TTL_SECONDS), после каждой волны выполняется flush(), затем часы
+переводятся за TTL и выполняются flush() и очистка SQLite. Несколько раундов
+подряд показывают, растет ли память.
+
+Часы в utils.fsm_storage подменяются, поэтому TTL проверяется без ожидания.
+
+    python bench/fsm_memory.py                  # SQLiteStorage + PersistentUserStates
+    python bench/fsm_memory.py --mode memory    # MemoryStorage + dict (как было раньше)
+"""
+
+import os
+import sys
+import gc
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+# Отдельная БД, чтобы не трогать fsm_states.db бота (до импорта config)
+os.environ["FSM_DB_FILE"] = os.path.join(tempfile.mkdtemp(prefix="fsm_bench_"), "fsm.db")
+os.environ["REDIS_URL"] = ""
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from config import Config
+import utils.fsm_storage as fsm_module
+
+BOT_ID = 1
+
+
+class FakeClock:
+    """Управляемые часы вместо модуля time в utils.fsm_storage"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self) -> float:
+        return self.now
+
+
+def rss_mib() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def run(mode: str, users: int, rounds: int, waves: int) -> None:
+    clock = FakeClock()
+    fsm_module.time = clock
+    if mode == "sqlite":
+        storage = fsm_module.fsm_storage
+        states = fsm_module.user_states
+        await states.start(storage, BOT_ID)
+        # flush вызывается по часам бенчмарка, фоновая запись не нужна
+        states._flush_task.cancel()
+    else:
+        storage = MemoryStorage()
+        states = {}
+
+    print(f"mode={mode} ttl={Config.FSM_TTL_SECONDS:.0f}s users/round={users}")
+    print(f"before: rss={rss_mib():.1f} MiB")
+    uid = 0
+    for rnd in range(rounds):
+        started = time.perf_counter()
+        peak = 0.0
+        for _ in range(waves):
+            for _ in range(users // waves):
+                uid += 1
+                key = StorageKey(bot_id=BOT_ID, chat_id=uid, user_id=uid)
+                data = {"bookmaker": "1xbet", "player_id": str(10_000_000 + uid), "amount": 1500.0}
+                await storage.set_state(key, "DepositStates:amount")
+                await storage.set_data(key, data)
+                states[uid] = {"step": "deposit_amount", "data": dict(data, qr_message_id=uid)}
+            # Все пользователи раунда приходят за одни сутки
+            clock.now += Config.FSM_TTL_SECONDS / waves
+            if mode == "sqlite":
+                await states.flush()
+            peak = max(peak, rss_mib())
+        load_seconds = time.perf_counter() - started
+
+        # Сутки без активности: все сценарии брошены
+        clock.now += Config.FSM_TTL_SECONDS + 1
+        if mode == "sqlite":
+            await states.flush()
+            storage._last_sweep = 0
+            await storage._run(storage._sweep, clock.now)
+            rows = await storage._run(lambda: storage._conn.execute("SELECT COUNT(*) FROM fsm").fetchone()[0])
+            db_info = f" db={os.path.getsize(os.environ['FSM_DB_FILE']) / 1048576:.1f} MiB"
+        else:
+            rows = len(storage.storage)
+            db_info = ""
+        gc.collect()
+        print(
+            f"round {rnd + 1}: users={uid} peak={peak:.1f} MiB after-eviction={rss_mib():.1f} MiB "
+            f"in-memory={len(states)} fsm-rows={rows} load={load_seconds:.1f}s{db_info}"
+        )
+
+    if mode == "sqlite":
+        await storage.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--users", type=int, default=100_000, help="пользователей за раунд")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--waves", type=int, default=10, help="волн за сутки (flush после каждой)")
+    args = parser.parse_args()
+    asyncio.run(run(args.mode, args.users, args.rounds, args.waves))
+
+
+if __name__ == "__main__":
+    main()
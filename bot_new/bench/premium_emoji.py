@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк расстановки премиум-эмодзи (utils/premium_emoji.py)
+
+- эквивалентность с версией из git (по умолчанию - до однопроходного
+  поиска): все тексты TRANSLATIONS и случайные строки из ключей карты;
+- время add_premium_emoji_to_text на main_menu_text: без кеша, с кешем
+  и на тексте в 20 раз длиннее.
+
+    python bench/premium_emoji.py [--baseline REV | --no-baseline] [--cases 50000]
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from baseline import load_module_at
+from config import Config
+from utils.texts import TRANSLATIONS, get_text
+import utils.premium_emoji as premium_emoji
+
+# Версия до однопроходного поиска эмодзи
+DEFAULT_BASELINE = "757edd3^"
+
+EXTRA_KEYS = ['a', '😀', '👨‍💻', '\n', '<b>', '</b>', 'ℹ', '️', 'Ж']
+
+
+def normalized(result) -> tuple:
+    text, entities = result
+    return text, sorted((e.offset, e.length, e.custom_emoji_id) for e in entities)
+
+
+def bench(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def check_equivalence(old, emoji_map: dict, cases: int, seed: int) -> int:
+    mismatches = 0
+    samples = [text for texts in TRANSLATIONS.values() for text in texts.values() if isinstance(text, str)]
+    rng = random.Random(seed)
+    keys = list(emoji_map) + EXTRA_KEYS
+    samples += [''.join(rng.choice(keys) for _ in range(rng.randint(0, 20))) for _ in range(cases)]
+    for text in samples:
+        if normalized(old.add_premium_emoji_to_text(text, emoji_map)) != normalized(premium_emoji.add_premium_emoji_to_text(text, emoji_map)):
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"❌ расхождение: {text!r}")
+    print(f"эквивалентность: {len(samples)} текстов, расхождений: {mismatches}")
+    return mismatches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=50000, help="случайных строк для проверки эквивалентности")
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="ревизия git для сравнения")
+    parser.add_argument("--no-baseline", dest="baseline", action="store_const", const="")
+    args = parser.parse_args()
+
+    emoji_map = Config.PREMIUM_EMOJI_MAP
+    implementations = [("сейчас", premium_emoji.add_premium_emoji_to_text)]
+    mismatches = 0
+    if args.baseline:
+        old = load_module_at(args.baseline, "utils/premium_emoji.py", "premium_emoji_baseline")
+        if old is not None:
+            mismatches = check_equivalence(old, emoji_map, args.cases, args.seed)
+            implementations.insert(0, (f"до ({args.baseline})", old.add_premium_emoji_to_text))
+
+    text = get_text('main_menu_text', user_name='Айгерим').replace('{logo_emoji}', '🔷')
+    big_text = text * 20
+    print(f"main_menu_text: {len(text)} символов")
+    for label, add_emoji in implementations:
+        print(f"  {label}: {bench(lambda: add_emoji(text, emoji_map), 20000):7.1f} мкс, x20: {bench(lambda: add_emoji(big_text, emoji_map), 500):8.1f} мкс")
+    cached = bench(lambda: premium_emoji.add_premium_emoji_to_text(text, emoji_map, cache=True), 20000)
+    print(f"  сейчас с кешем: {cached:7.1f} мкс")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк генерации QR-кода депозита (utils/qr_generator.py)
+
+- время одного QR (последовательно);
+- 20 QR одновременно: общее время и максимальная задержка event loop
+  (рендер в потоке не должен останавливать обработку других пользователей);
+- с --baseline REV то же для версии из git (по умолчанию - до кеширования
+  шаблона) и проверка, что изображения совпадают попиксельно.
+
+    python bench/qr_render.py [--baseline REV | --no-baseline]
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from PIL import Image, ImageChops
+from baseline import load_module_at
+import utils.qr_generator as qr_generator
+
+# Версия до кеширования шаблона QR
+DEFAULT_BASELINE = "c5ab539^"
+
+QR_URL = "https://app.mbank.kg/qr/#00020101021132500012c2c.mbank.kg01020210129965000000001302120412" \
+         "0053034175405150.3759040003XXXX6304ABCD"
+
+
+async def sequential(generate, count: int) -> float:
+    """Среднее время одного QR (мс)"""
+    timings = []
+    for i in range(count):
+        started = time.perf_counter()
+        image = await generate(f"{QR_URL}{i}", "1xbet")
+        timings.append((time.perf_counter() - started) * 1000)
+        assert image is not None, "QR не сгенерирован"
+    return statistics.median(timings)
+
+
+async def concurrent(generate, count: int):
+    """Общее время count одновременных QR и максимальная задержка event loop (мс)"""
+    max_lag = 0.0
+    stop = asyncio.Event()
+
+    async def probe():
+        nonlocal max_lag
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            max_lag = max(max_lag, (time.perf_counter() - started - 0.005) * 1000)
+
+    probe_task = asyncio.create_task(probe())
+    await asyncio.sleep(0.02)
+    started = time.perf_counter()
+    await asyncio.gather(*(generate(f"{QR_URL}{i}", "1xbet") for i in range(count)))
+    total = (time.perf_counter() - started) * 1000
+    stop.set()
+    await probe_task
+    return total, max_lag
+
+
+def same_pixels(first: BytesIO, second: BytesIO) -> bool:
+    a = Image.open(first).convert("RGB")
+    b = Image.open(second).convert("RGB")
+    return a.size == b.size and ImageChops.difference(a, b).getbbox() is None
+
+
+async def run(args) -> None:
+    started = time.perf_counter()
+    await qr_generator.prepare_qr_template()
+    print(f"шаблон QR подготовлен за {(time.perf_counter() - started) * 1000:.0f} мс (один раз при старте)")
+
+    implementations = [("текущая", qr_generator.generate_qr_image)]
+    if args.baseline:
+        old = load_module_at(args.baseline, "utils/qr_generator.py", "qr_generator_baseline")
+        if old is not None:
+            implementations.insert(0, (f"до ({args.baseline})", old.generate_qr_image))
+            same = same_pixels(
+                await old.generate_qr_image(QR_URL, "1xbet"),
+                await qr_generator.generate_qr_image(QR_URL, "1xbet")
+            )
+            print(f"изображения совпадают попиксельно: {same}")
+
+    for label, generate in implementations:
+        per_qr = await sequential(generate, args.count)
+        total, lag = await concurrent(generate, args.concurrent)
+        print(
+            f"{label:>14}: {per_qr:7.1f} мс на QR (медиана {args.count}), "
+            f"{args.concurrent} одновременно - {total:7.0f} мс, макс. задержка event loop {lag:6.0f} мс"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10, help="QR для замера времени одного")
+    parser.add_argument("--concurrent", type=int, default=20, help="одновременных QR")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="ревизия git для сравнения")
+    parser.add_argument("--no-baseline", dest="baseline", action="store_const", const="")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
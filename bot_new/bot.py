@@ -8,11 +8,12 @@ import asyncio
 import os
 from pathlib import Path
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from config import Config
-from security import check_rate_limit, get_user_id
+from security import check_rate_limit_async, get_user_id
+from utils.rate_governor import GovernorRequestMiddleware
+from utils.fsm_storage import fsm_storage, user_states
 
 # Настройка логирования
 logging.basicConfig(
@@ -29,7 +30,10 @@ bot = Bot(
     token=Config.BOT_TOKEN,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-storage = MemoryStorage()
+# Все отправки/редактирования сообщений проходят через общий лимитер Bot API
+bot.session.middleware(GovernorRequestMiddleware())
+# FSM и user_states хранятся в одном постоянном хранилище (SQLite или Redis)
+storage = fsm_storage
 dp = Dispatcher(storage=storage)
 
 # Импортируем обработчики (после создания dp)
@@ -51,9 +55,14 @@ async def setup_handlers():
     
     # Middleware для rate limiting
     from aiogram import BaseMiddleware
+    from aiogram.types import CallbackQuery
     from typing import Callable, Dict, Any, Awaitable
     
     class RateLimitMiddleware(BaseMiddleware):
+        def __init__(self, action: str):
+            # Лимит действия из security.RATE_LIMITS ('message', 'callback')
+            self.action = action
+        
         async def __call__(
             self,
             handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
@@ -62,21 +71,21 @@ async def setup_handlers():
         ) -> Any:
             user_id = get_user_id(event)
             if user_id:
-                is_allowed, error_message = check_rate_limit(user_id)
+                is_allowed, error_message = await check_rate_limit_async(user_id, self.action)
                 if not is_allowed:
                     logger.warning(f"🚫 Rate limit для пользователя {user_id}: {error_message}")
                     try:
-                        if hasattr(event, 'message') and event.message:
-                            await event.message.answer(f"⚠️ {error_message}\n\nПожалуйста, подождите перед повторной попыткой.")
-                        elif hasattr(event, 'callback_query') and event.callback_query:
-                            await event.callback_query.answer(error_message, show_alert=True)
+                        if isinstance(event, CallbackQuery):
+                            await event.answer(error_message, show_alert=True)
+                        else:
+                            await event.answer(f"⚠️ {error_message}\n\nПожалуйста, подождите перед повторной попыткой.")
                     except Exception as e:
                         logger.error(f"❌ Ошибка при отправке сообщения о rate limit: {e}")
                     return
             return await handler(event, data)
     
-    dp.message.middleware(RateLimitMiddleware())
-    dp.callback_query.middleware(RateLimitMiddleware())
+    dp.message.middleware(RateLimitMiddleware('message'))
+    dp.callback_query.middleware(RateLimitMiddleware('callback'))
 
 # Middleware для rate limiting будет добавлен после setup_handlers
 
@@ -113,16 +122,41 @@ async def main():
     # Настраиваем обработчики
     await setup_handlers()
     
-    # Загружаем настройки при старте
-    from utils.settings import load_settings
+    # Загружаем настройки при старте и запускаем их фоновое обновление
+    from utils.settings import load_settings, start_settings_refresher, stop_settings_refresher
     try:
         await load_settings()
         logger.info("✅ Настройки загружены")
     except Exception as e:
         logger.warning(f"⚠️ Не удалось загрузить настройки при старте: {e}")
+    start_settings_refresher()
     
-    # Запускаем бота
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    # Шаблон QR-кода строится один раз заранее
+    from utils.qr_generator import prepare_qr_template
+    await prepare_qr_template()
+    
+    # Тексты с премиум эмодзи разбираются в шаблоны при старте
+    from utils.texts import prepare_templates
+    prepare_templates()
+    
+    # Восстанавливаем состояния пользователей (сохраняются при закрытии хранилища FSM)
+    await user_states.start(storage, bot.id)
+    # Таймеры депозита: перезапуск незавершенных, отмена истекших за время простоя
+    from utils.timer import restore_timers
+    await restore_timers(bot, user_states)
+    
+    # Запускаем бота: webhook, если задан BOT_NEW_WEBHOOK_URL, иначе long polling
+    allowed_updates = dp.resolve_used_update_types()
+    try:
+        if Config.WEBHOOK_URL:
+            from utils.webhook import run_webhook
+            await run_webhook(dp, bot, allowed_updates)
+        else:
+            # Если раньше был включен webhook, getUpdates без его удаления не работает
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=allowed_updates)
+    finally:
+        await stop_settings_refresher()
 
 if __name__ == '__main__':
     try:
@@ -27,9 +27,39 @@ class Config:
     WEBSITE_URL = os.getenv("MINI_APP_URL", "https://lux-on.org")
     API_URL = os.getenv("ADMIN_PUBLIC_URL", os.getenv("NEXT_PUBLIC_API_URL", "https://pipiska.net"))
     SUPPORT_BOT_URL = os.getenv("SUPPORT_BOT_URL", "https://t.me/operator_luxon_bot")
+    # Старый JSON-файл ожиданий фото чека (переносится в SQLite при первом запуске)
     PENDING_DEPOSIT_STATE_FILE = Path(__file__).parent / 'pending_deposit_states.json'
+    PENDING_DEPOSIT_DB_FILE = Path(__file__).parent / 'pending_deposit_states.db'
     DEPOSIT_TIMEOUT_SECONDS = 300  # 5 минут
     
+    # Хранилище FSM и состояний пользователей: Redis, если задан REDIS_URL, иначе SQLite
+    REDIS_URL = os.getenv("REDIS_URL", "")
+    FSM_DB_FILE = Path(os.getenv("FSM_DB_FILE", str(Path(__file__).parent / 'fsm_states.db')))
+    # Брошенные сценарии (нет активности дольше этого) удаляются
+    FSM_TTL_SECONDS = float(os.getenv("FSM_TTL_SECONDS", str(24 * 3600)))
+    # Как часто сохранять измененные состояния пользователей
+    USER_STATES_FLUSH_SECONDS = float(os.getenv("USER_STATES_FLUSH_SECONDS", "2"))
+    
+    # Фоновое обновление настроек из админки
+    SETTINGS_REFRESH_SECONDS = float(os.getenv("SETTINGS_REFRESH_SECONDS", "30"))
+    # Если настройки старше этого (например, фоновая задача упала) - обработчик запустит обновление сам
+    SETTINGS_MAX_AGE_SECONDS = float(os.getenv("SETTINGS_MAX_AGE_SECONDS", "300"))
+    # Необязательный SSE-канал админки: любое событие сразу сбрасывает кеш настроек
+    # (админка: https://<домен админки>/api/public/settings-events, событие после каждого сохранения настроек)
+    SETTINGS_EVENTS_URL = os.getenv("SETTINGS_EVENTS_URL", "")
+    
+    # Webhook вместо long polling: включается, если задан BOT_NEW_WEBHOOK_URL (публичный https-адрес за nginx).
+    # Переменные с префиксом: bot/bot.py читает тот же .env, но свои LEGACY_WEBHOOK_*
+    WEBHOOK_URL = os.getenv("BOT_NEW_WEBHOOK_URL", "")
+    WEBHOOK_PATH = os.getenv("BOT_NEW_WEBHOOK_PATH", "/telegram/bot_new/webhook")
+    # Секрет, который Telegram присылает в заголовке X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -)
+    WEBHOOK_SECRET = os.getenv("BOT_NEW_WEBHOOK_SECRET", "")
+    # Локальный адрес aiohttp-сервера (на него проксирует nginx)
+    WEBHOOK_HOST = os.getenv("BOT_NEW_WEBHOOK_HOST", "127.0.0.1")
+    WEBHOOK_PORT = int(os.getenv("BOT_NEW_WEBHOOK_PORT", "8081"))
+    # Сколько одновременных HTTPS-соединений Telegram открывает к webhook (1-100)
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("BOT_NEW_WEBHOOK_MAX_CONNECTIONS", "40"))
+    
     # Премиум эмодзи (custom_emoji_id)
     # Получить ID можно через @BotFather или из сообщений с премиум эмодзи
     # Формат: {"обычный_эмодзи": "custom_emoji_id"}
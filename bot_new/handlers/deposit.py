@@ -5,7 +5,7 @@
 import logging
 import asyncio
 import random
-import base64
+import time
 import httpx
 from aiogram import Router, F
 from aiogram.types import Message
@@ -13,21 +13,24 @@ from aiogram.fsm.context import FSMContext
 from aiogram.enums import ParseMode
 from states import DepositStates
 from config import Config
-from utils.texts import get_text, get_casino_name, get_text_with_premium_emoji
+from utils.texts import get_text, get_casino_name, get_text_with_premium_emoji, compose_texts
 from utils.premium_emoji import add_premium_emoji_to_text
 from utils.answer_helper import answer_with_text, answer_with_custom_text
 from utils.keyboards import get_casino_keyboard, get_amount_keyboard, get_cancel_keyboard, get_bank_keyboard
-from utils.settings import load_settings, get_settings
+from utils.settings import ensure_settings_fresh, get_settings
 from utils.qr_generator import generate_qr_image, get_casino_id_image_path
 from utils.state_manager import set_pending_deposit_state, clear_pending_deposit_state, get_pending_deposit_state
-from utils.timer import update_timer, cancel_timer, active_timers
+from utils.timer import start_timer, cancel_timer, active_timers, is_deposit_expired, expire_deposit
+from utils.fsm_storage import user_states
+from utils.receipt_upload import post_with_telegram_file
+from security import check_rate_limit_async
 # bot будет импортирован позже, когда он будет создан
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-# Глобальное хранилище состояний (в памяти, как в старом боте)
-user_states = {}
+# Глобальное хранилище состояний: в памяти, сохраняется в хранилище FSM (utils/fsm_storage.py)
+# user_states импортируется отсюда остальными обработчиками
 
 ALL_CASINOS = [
     ('1xbet', '1XBET'),
@@ -46,10 +49,8 @@ async def start_deposit(message: Message, state: FSMContext):
         
         # Загружаем настройки
         try:
+            await ensure_settings_fresh()
             settings = get_settings()
-            if asyncio.get_event_loop().time() - settings.get('last_update', 0) > 300:
-                await load_settings()
-                settings = get_settings()
         except Exception as settings_error:
             logger.error(f"❌ Ошибка при загрузке настроек: {settings_error}")
             settings = get_settings()  # Используем кэшированные настройки
@@ -116,24 +117,11 @@ async def start_deposit(message: Message, state: FSMContext):
             
             reply_markup = get_casino_keyboard(enabled_casinos)
             
-            deposit_title, title_entities = get_text_with_premium_emoji('deposit_title')
-            select_casino = get_text('select_casino')
-            menu_text = f"{deposit_title}\n\n{select_casino}"
-            # Применяем премиум эмодзи ко всему тексту (включая select_casino)
-            text_with_emoji, entities = add_premium_emoji_to_text(menu_text, Config.PREMIUM_EMOJI_MAP)
-            # Объединяем entities: сначала из deposit_title, затем из общего текста
-            all_entities = list(title_entities) if title_entities else []
-            # Добавляем entities из общего текста, исключая те, что уже есть в title_entities
-            if entities:
-                for entity in entities:
-                    # Проверяем, не пересекается ли entity с title_entities
-                    overlaps = False
-                    if title_entities:
-                        title_end = max(e.offset + e.length for e in title_entities) if title_entities else 0
-                        if entity.offset < title_end:
-                            overlaps = True
-                    if not overlaps:
-                        all_entities.append(entity)
+            # Заголовок и подсказка - готовые шаблоны, entities только сдвигаются
+            text_with_emoji, all_entities = compose_texts(
+                get_text_with_premium_emoji('deposit_title'),
+                get_text_with_premium_emoji('select_casino')
+            )
             await message.answer(text_with_emoji, reply_markup=reply_markup, entities=all_entities if all_entities else None, parse_mode=None)
         except Exception as e:
             logger.error(f"❌ Ошибка при начале депозита для пользователя {user_id}: {e}", exc_info=True)
@@ -230,25 +218,11 @@ async def process_bookmaker(message: Message, state: FSMContext):
         )
     
     casino_name = get_casino_name(bookmaker)
-    deposit_title, title_entities = get_text_with_premium_emoji('deposit_title')
-    casino_label = get_text('casino_label', casino_name=casino_name)
-    enter_player_id = get_text('enter_player_id')
-    
-    message_text = f"{deposit_title}\n\n{casino_label}\n\n{enter_player_id}"
-    text_with_emoji, entities = add_premium_emoji_to_text(message_text, Config.PREMIUM_EMOJI_MAP)
-    
-    # Объединяем entities
-    all_entities = list(title_entities) if title_entities else []
-    if entities:
-        for entity in entities:
-            overlaps = False
-            if title_entities:
-                for t_entity in title_entities:
-                    if max(entity.offset, t_entity.offset) < min(entity.offset + entity.length, t_entity.offset + t_entity.length):
-                        overlaps = True
-                        break
-            if not overlaps:
-                all_entities.append(entity)
+    text_with_emoji, all_entities = compose_texts(
+        get_text_with_premium_emoji('deposit_title'),
+        get_text_with_premium_emoji('casino_label', casino_name=casino_name),
+        get_text_with_premium_emoji('enter_player_id')
+    )
     
     # Пытаемся отправить фото с примером ID
     casino_image_path = get_casino_id_image_path(bookmaker)
@@ -327,8 +301,6 @@ async def process_player_id(message: Message, state: FSMContext):
     
     reply_markup = get_amount_keyboard()
     
-    deposit_title_text, title_entities = get_text_with_premium_emoji('deposit_title')
-    deposit_amount_prompt = get_text('deposit_amount_prompt')
     bookmaker = user_states[user_id]['data'].get('bookmaker', '').lower()
     if bookmaker == '1win':
         min_amount_value = 100
@@ -337,22 +309,17 @@ async def process_player_id(message: Message, state: FSMContext):
     else:
         min_amount_value = 35
     max_amount_value = 500000
-    min_amount = get_text('min_amount', min=min_amount_value)
     max_amount = f"Максимум: {max_amount_value:,} KGS".replace(',', ' ')
-    amount_text = f"{deposit_title_text}\n\n{min_amount}\n{max_amount}\n\n{deposit_amount_prompt}"
-    text_with_emoji, entities = add_premium_emoji_to_text(amount_text, Config.PREMIUM_EMOJI_MAP)
-    
-    all_entities = list(title_entities) if title_entities else []
-    if entities:
-        for entity in entities:
-            overlaps = False
-            if title_entities:
-                for t_entity in title_entities:
-                    if max(entity.offset, t_entity.offset) < min(entity.offset + entity.length, t_entity.offset + t_entity.length):
-                        overlaps = True
-                        break
-            if not overlaps:
-                all_entities.append(entity)
+    limits = compose_texts(
+        get_text_with_premium_emoji('min_amount', min=min_amount_value),
+        max_amount,
+        separator="\n"
+    )
+    text_with_emoji, all_entities = compose_texts(
+        get_text_with_premium_emoji('deposit_title'),
+        limits,
+        get_text_with_premium_emoji('deposit_amount_prompt')
+    )
     
     await message.answer(
         text_with_emoji, 
@@ -412,12 +379,11 @@ async def process_amount(message: Message, state: FSMContext):
     
     # Отправляем сообщение о генерации QR (очищаем клавиатуру)
     from aiogram.types import ReplyKeyboardRemove
-    qr_text, qr_entities = get_text_with_premium_emoji('qr_generating')
-    generating_text = f"⏳ {qr_text}"
-    text_with_emoji, entities = add_premium_emoji_to_text(generating_text, Config.PREMIUM_EMOJI_MAP)
-    all_entities = list(qr_entities) if qr_entities else []
-    if entities:
-        all_entities.extend(entities)
+    text_with_emoji, all_entities = compose_texts(
+        "⏳",
+        get_text_with_premium_emoji('qr_generating'),
+        separator=" "
+    )
     generating_message = await message.answer(text_with_emoji, reply_markup=ReplyKeyboardRemove(), entities=all_entities if all_entities else None, parse_mode=None)
     
     # Получаем QR ссылки
@@ -449,10 +415,8 @@ async def process_amount(message: Message, state: FSMContext):
                     timer_text = f"{minutes}:{seconds:02d}"
                     
                     # Загружаем настройки
+                    await ensure_settings_fresh()
                     settings = get_settings()
-                    if asyncio.get_event_loop().time() - settings.get('last_update', 0) > 300:
-                        await load_settings()
-                        settings = get_settings()
                     
                     enabled_banks = settings.get('deposit_banks', [])
                     reply_markup = get_bank_keyboard(bank_links, enabled_banks)
@@ -512,6 +476,8 @@ async def process_amount(message: Message, state: FSMContext):
                     user_states[user_id]['data']['timer_chat_id'] = timer_message.chat.id
                     user_states[user_id]['data']['bank_links'] = bank_links
                     user_states[user_id]['data']['timer_seconds'] = timer_seconds
+                    # Срок оплаты переживает рестарт: по нему restore_timers() перезапускает таймер
+                    user_states[user_id]['data']['timer_deadline'] = time.time() + timer_seconds
                     
                     # Сохраняем ожидание фото чека
                     pending_data = {
@@ -519,7 +485,7 @@ async def process_amount(message: Message, state: FSMContext):
                         'player_id': user_states[user_id]['data'].get('player_id'),
                         'bookmaker': user_states[user_id]['data'].get('bookmaker')
                     }
-                    set_pending_deposit_state(user_id, pending_data, asyncio.get_event_loop().time() + timer_seconds)
+                    set_pending_deposit_state(user_id, pending_data, time.time() + timer_seconds)
                     
                     # Удаляем сообщение "Генерирую QR code..."
                     try:
@@ -529,10 +495,7 @@ async def process_amount(message: Message, state: FSMContext):
                     
                     # Запускаем таймер
                     from bot import bot
-                    timer_task = asyncio.create_task(
-                        update_timer(bot, user_id, timer_seconds, user_states[user_id]['data'], timer_message.message_id, timer_message.chat.id, user_states)
-                    )
-                    active_timers[user_id] = timer_task
+                    start_timer(bot, user_id, timer_seconds, user_states[user_id]['data'], timer_message.message_id, timer_message.chat.id, user_states)
                     
                     logger.info(f"✅ Сообщение с кнопками банков отправлено пользователю {user_id}, таймер запущен")
                     return
@@ -570,6 +533,12 @@ async def process_receipt_photo(message: Message, state: FSMContext):
         await answer_with_custom_text(message, "❌ Сейчас не требуется отправка фото. Следуйте инструкциям выше.")
         return
     
+    # Срок оплаты прошел (таймер не успел отменить заявку) - чек по старым реквизитам не принимаем
+    if user_id in user_states and is_deposit_expired(user_states[user_id].get('data', {})):
+        from bot import bot
+        await expire_deposit(bot, user_id, user_states[user_id]['data'], user_states)
+        return
+    
     if user_id not in user_states:
         # Пытаемся восстановить состояние
         photo_file_id = None
@@ -605,24 +574,21 @@ async def process_receipt_photo(message: Message, state: FSMContext):
         await answer_with_text(message, 'please_send_receipt')
         return
     
+    # Создание заявок ограничено строже, чем обычные сообщения
+    is_allowed, error_message = await check_rate_limit_async(user_id, 'deposit_create')
+    if not is_allowed:
+        await answer_with_custom_text(message, f"⚠️ {error_message}")
+        return
+    
     # Останавливаем таймер
     cancel_timer(user_id)
     
-    # Получаем фото в base64
+    # Загружаем фото чека и создаем заявку
     processing_text = "⏳ Обрабатываю фото чека и создаю заявку..."
     text_with_emoji, entities = add_premium_emoji_to_text(processing_text, Config.PREMIUM_EMOJI_MAP)
     processing_message = await message.answer(text_with_emoji, entities=entities if entities else None, parse_mode=None)
     try:
         from bot import bot
-        from io import BytesIO
-        file = await bot.get_file(photo_file_id)
-        # В aiogram 3 используем bot.download() который возвращает BytesIO
-        file_data = BytesIO()
-        await bot.download(file, destination=file_data)
-        file_data.seek(0)
-        base64_data = base64.b64encode(file_data.read()).decode('utf-8')
-        receipt_photo_base64 = f"data:image/jpeg;base64,{base64_data}"
-        
         data = user_states[user_id]['data']
         
         if not data.get('amount') or not data.get('player_id') or not data.get('bookmaker'):
@@ -632,9 +598,12 @@ async def process_receipt_photo(message: Message, state: FSMContext):
             clear_pending_deposit_state(user_id)
             return
         
-        # Создаем заявку
+        file = await bot.get_file(photo_file_id)
+        file_url = bot.session.api.file_url(bot.token, file.file_path)
+        
+        # Создаем заявку: фото уходит файлом в multipart/form-data потоком из Telegram (без base64)
         user = message.from_user
-        request_body = {
+        request_fields = {
             "type": "deposit",
             "bookmaker": data['bookmaker'],
             "userId": str(user_id),
@@ -643,7 +612,6 @@ async def process_receipt_photo(message: Message, state: FSMContext):
             "bank": "omoney",
             "account_id": data['player_id'],
             "playerId": data['player_id'],
-            "receipt_photo": receipt_photo_base64,
             "telegram_username": user.username,
             "telegram_first_name": user.first_name,
             "telegram_last_name": user.last_name,
@@ -651,10 +619,13 @@ async def process_receipt_photo(message: Message, state: FSMContext):
         }
         
         async with httpx.AsyncClient(timeout=30.0) as client:
-            payment_response = await client.post(
+            payment_response = await post_with_telegram_file(
+                client,
                 f"{Config.API_URL}/api/payment",
-                json=request_body,
-                headers={"Content-Type": "application/json"}
+                request_fields,
+                "receipt_photo",
+                file_url,
+                file_size=file.file_size
             )
             
             if payment_response.status_code == 200:
@@ -663,14 +634,13 @@ async def process_receipt_photo(message: Message, state: FSMContext):
                     request_id = result.get('id') or result.get('data', {}).get('id') or 'N/A'
                     
                     casino_name = get_casino_name(data.get('bookmaker', ''))
-                    success_message = get_text(
+                    success_text, success_entities = get_text_with_premium_emoji(
                         'deposit_request_sent',
                         request_id=request_id,
                         amount=float(data.get('amount', 0)),
                         account_id=data.get('player_id', ''),
                         casino_name=casino_name
                     )
-                    success_text, success_entities = add_premium_emoji_to_text(success_message, Config.PREMIUM_EMOJI_MAP)
                     await message.answer(
                         success_text, 
                         reply_markup=None,
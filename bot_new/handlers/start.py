@@ -11,7 +11,7 @@ from aiogram.fsm.context import FSMContext
 from config import Config
 from utils.texts import get_text, get_text_with_premium_emoji
 from utils.keyboards import get_main_menu_keyboard, get_main_menu_inline_keyboard
-from utils.settings import load_settings, get_settings
+from utils.settings import ensure_settings_fresh, get_settings
 from utils.state_manager import clear_pending_deposit_state
 
 logger = logging.getLogger(__name__)
@@ -102,7 +102,6 @@ async def send_main_menu(message_or_chat_id, user_name: str = "", bot_instance=N
     safe_name = user_name if user_name else "друг"
     # Используем get_text_with_premium_emoji для main_menu_text, чтобы обработать логотип
     main_menu_text_with_emoji, main_menu_entities = get_text_with_premium_emoji('main_menu_text', user_name=safe_name)
-    menu_ready_text, menu_ready_entities_temp = get_text_with_premium_emoji('menu_ready_text')
     menu_ready_text_with_emoji, menu_ready_entities = get_text_with_premium_emoji('menu_ready_text')
     
     inline_keyboard = get_main_menu_inline_keyboard(Config.WEBSITE_URL)
@@ -172,10 +171,8 @@ async def cmd_start(message: Message, state: FSMContext):
         
         # Загружаем настройки если они устарели
         try:
+            await ensure_settings_fresh()
             settings = get_settings()
-            if asyncio.get_event_loop().time() - settings.get('last_update', 0) > 300:
-                await load_settings()
-                settings = get_settings()
         except Exception as settings_error:
             logger.error(f"❌ Ошибка при загрузке настроек: {settings_error}")
             settings = get_settings()  # Используем кэшированные настройки
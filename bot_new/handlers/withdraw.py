@@ -14,9 +14,10 @@ from utils.texts import get_text, get_casino_name, get_text_with_premium_emoji
 from utils.premium_emoji import add_premium_emoji_to_text
 from utils.answer_helper import answer_with_text, answer_with_custom_text
 from utils.keyboards import get_casino_keyboard, get_cancel_keyboard
-from utils.settings import load_settings, get_settings
+from utils.settings import ensure_settings_fresh, get_settings
 from utils.qr_generator import get_casino_id_image_path
 from handlers.deposit import user_states, ALL_CASINOS
+from security import check_rate_limit_async
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -44,10 +45,8 @@ async def start_withdraw(message: Message, state: FSMContext):
     
     # Загружаем настройки
     import asyncio
+    await ensure_settings_fresh()
     settings = get_settings()
-    if asyncio.get_event_loop().time() - settings.get('last_update', 0) > 300:
-        await load_settings()
-        settings = get_settings()
     
     # Проверяем паузу
     if settings.get('pause', False):
@@ -526,6 +525,12 @@ async def process_withdraw_code(message: Message, state: FSMContext):
 
 async def submit_withdraw_request(message: Message, user_id: int, data: dict, withdraw_amount: float) -> None:
     """Отправляет заявку на вывод"""
+    # Создание заявок ограничено строже, чем обычные сообщения
+    is_allowed, error_message = await check_rate_limit_async(user_id, 'withdraw_create')
+    if not is_allowed:
+        await answer_with_custom_text(message, f"⚠️ {error_message}")
+        return
+    
     try:
         import base64
         
@@ -0,0 +1,324 @@
+"""
+Постоянное хранилище FSM и состояний пользователей
+
+- SQLiteStorage: хранилище aiogram FSM на SQLite (WAL), запросы выполняются
+  в отдельном потоке, записи старше FSM_TTL_SECONDS удаляются в фоне;
+- Redis (если задан REDIS_URL и установлен пакет redis): штатный RedisStorage
+  aiogram с TTL на ключах;
+- PersistentUserStates: словарь user_states из handlers.deposit, который
+  хранится в том же хранилище (отдельный destiny) и переживает рестарт.
+"""
+
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+from pathlib import Path
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from config import Config
+
+try:
+    from aiogram.fsm.storage.redis import RedisStorage, DefaultKeyBuilder
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+USER_STATES_DESTINY = "user_states"
+# Как часто удалять устаревшие записи FSM (секунд)
+SWEEP_INTERVAL = 300
+
+
+class _CloseHooksMixin:
+    """
+    Dispatcher закрывает хранилище FSM при остановке раньше, чем выполняется код
+    после start_polling, поэтому user_states сохраняется из хука перед закрытием.
+    """
+
+    _close_hooks: List[Callable[[], Awaitable[None]]]
+
+    def add_close_hook(self, hook: Callable[[], Awaitable[None]]) -> None:
+        if not hasattr(self, "_close_hooks"):
+            self._close_hooks = []
+        self._close_hooks.append(hook)
+
+    async def _run_close_hooks(self) -> None:
+        hooks, self._close_hooks = getattr(self, "_close_hooks", []), []
+        for hook in hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка при закрытии хранилища FSM: {e}")
+
+
+class SQLiteStorage(_CloseHooksMixin, BaseStorage):
+    """Хранилище FSM на SQLite с TTL"""
+
+    def __init__(self, path: Union[str, Path], ttl: float = Config.FSM_TTL_SECONDS):
+        self.ttl = ttl
+        self._closed = False
+        # Один поток - все запросы к соединению сериализованы
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._conn = sqlite3.connect(str(path), timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            " key TEXT PRIMARY KEY,"
+            " destiny TEXT NOT NULL,"
+            " user_id INTEGER NOT NULL,"
+            " state TEXT,"
+            " data TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm(updated_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_destiny ON fsm(destiny)")
+        self._conn.commit()
+        self._last_sweep = 0.0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        thread_id = getattr(key, "thread_id", None) or ""
+        return f"{key.bot_id}:{key.chat_id}:{thread_id}:{key.user_id}:{key.destiny}"
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # ---------- синхронная часть (выполняется в потоке хранилища) ----------
+
+    def _sweep(self, now: float) -> None:
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        deleted = self._conn.execute("DELETE FROM fsm WHERE updated_at < ?", (now - self.ttl,)).rowcount
+        self._conn.commit()
+        if deleted:
+            logger.info(f"🧹 Удалено {deleted} заброшенных FSM-записей")
+
+    def _write(self, key: StorageKey, field: str, value: Optional[str]) -> None:
+        now = time.time()
+        skey = self._key(key)
+        self._conn.execute(
+            f"INSERT INTO fsm(key, destiny, user_id, {field}, updated_at) VALUES (?, ?, ?, ?, ?) "
+            f"ON CONFLICT(key) DO UPDATE SET {field} = excluded.{field}, updated_at = excluded.updated_at",
+            (skey, key.destiny, key.user_id, value, now)
+        )
+        # Пустая запись (нет ни состояния, ни данных) не нужна
+        self._conn.execute("DELETE FROM fsm WHERE key = ? AND state IS NULL AND (data IS NULL OR data = '{}')", (skey,))
+        self._conn.commit()
+        self._sweep(now)
+
+    def _read(self, key: StorageKey, field: str) -> Optional[str]:
+        row = self._conn.execute(
+            f"SELECT {field} FROM fsm WHERE key = ? AND updated_at >= ?",
+            (self._key(key), time.time() - self.ttl)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _iter_destiny(self, destiny: str) -> List[Tuple[int, str]]:
+        return self._conn.execute(
+            "SELECT user_id, data FROM fsm WHERE destiny = ? AND data IS NOT NULL AND updated_at >= ?",
+            (destiny, time.time() - self.ttl)
+        ).fetchall()
+
+    # ---------- API BaseStorage ----------
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._run(self._write, key, "state", value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._run(self._read, key, "state")
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._run(self._write, key, "data", json.dumps(data, ensure_ascii=False, default=str))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        raw = await self._run(self._read, key, "data")
+        return json.loads(raw) if raw else {}
+
+    async def iter_destiny(self, destiny: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """Все актуальные данные с указанным destiny: [(user_id, data), ...]"""
+        rows = await self._run(self._iter_destiny, destiny)
+        return [(user_id, json.loads(raw)) for user_id, raw in rows]
+
+    async def close(self) -> None:
+        await self._run_close_hooks()
+        if self._closed:
+            return
+        self._closed = True
+        await self._run(self._conn.close)
+        self._executor.shutdown(wait=True)
+
+
+if REDIS_AVAILABLE:
+    class TTLRedisStorage(_CloseHooksMixin, RedisStorage):
+        """RedisStorage с возможностью прочитать все записи одного destiny"""
+
+        async def close(self) -> None:
+            await self._run_close_hooks()
+            await super().close()
+
+        async def iter_destiny(self, destiny: str) -> List[Tuple[int, Dict[str, Any]]]:
+            result = []
+            pattern = f"{self.key_builder.prefix}:*:{destiny}:data"
+            async for raw_key in self.redis.scan_iter(match=pattern, count=500):
+                key = raw_key.decode() if isinstance(raw_key, bytes) else raw_key
+                raw = await self.redis.get(raw_key)
+                if not raw:
+                    continue
+                try:
+                    result.append((int(key.split(":")[-3]), json.loads(raw)))
+                except Exception:
+                    continue
+            return result
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Redis, если он настроен и доступен, иначе SQLite"""
+    if Config.REDIS_URL:
+        if REDIS_AVAILABLE:
+            logger.info("✅ FSM хранится в Redis")
+            return TTLRedisStorage.from_url(
+                Config.REDIS_URL,
+                key_builder=DefaultKeyBuilder(with_destiny=True),
+                state_ttl=int(Config.FSM_TTL_SECONDS),
+                data_ttl=int(Config.FSM_TTL_SECONDS),
+            )
+        logger.warning("⚠️ REDIS_URL задан, но пакет redis не установлен - используем SQLite")
+    logger.info(f"✅ FSM хранится в SQLite: {Config.FSM_DB_FILE}")
+    return SQLiteStorage(Config.FSM_DB_FILE)
+
+
+class PersistentUserStates(MutableMapping):
+    """
+    user_id -> {'step': ..., 'data': {...}} в памяти с отложенной записью в хранилище FSM.
+
+    Обработчики меняют вложенные словари напрямую (user_states[uid]['data'][k] = v),
+    поэтому любое обращение по ключу помечает запись измененной; фоновая задача
+    раз в USER_STATES_FLUSH_SECONDS сохраняет измененные записи и удаляет те,
+    к которым не обращались дольше FSM_TTL_SECONDS (брошенные сценарии).
+    """
+
+    def __init__(self, destiny: str = USER_STATES_DESTINY):
+        self.destiny = destiny
+        self._data: Dict[int, dict] = {}
+        self._touched: Dict[int, float] = {}
+        self._dirty: set = set()
+        self._deleted: set = set()
+        self._storage: Optional[BaseStorage] = None
+        self._bot_id: Optional[int] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # ---------- MutableMapping ----------
+
+    def __getitem__(self, user_id: int) -> dict:
+        value = self._data[user_id]
+        self._dirty.add(user_id)
+        self._touched[user_id] = time.time()
+        return value
+
+    def __setitem__(self, user_id: int, value: dict) -> None:
+        self._data[user_id] = value
+        self._dirty.add(user_id)
+        self._deleted.discard(user_id)
+        self._touched[user_id] = time.time()
+
+    def __delitem__(self, user_id: int) -> None:
+        del self._data[user_id]
+        self._dirty.discard(user_id)
+        self._touched.pop(user_id, None)
+        self._deleted.add(user_id)
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._data
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    # ---------- сохранение ----------
+
+    def _key(self, user_id: int) -> StorageKey:
+        return StorageKey(bot_id=self._bot_id, chat_id=user_id, user_id=user_id, destiny=self.destiny)
+
+    async def start(self, storage: BaseStorage, bot_id: int) -> None:
+        """Загружает сохраненные состояния и запускает фоновую запись"""
+        self._storage = storage
+        self._bot_id = bot_id
+        if hasattr(storage, "add_close_hook"):
+            storage.add_close_hook(self.stop)
+        if hasattr(storage, "iter_destiny"):
+            try:
+                now = time.time()
+                for user_id, value in await storage.iter_destiny(self.destiny):
+                    if user_id not in self._data and value:
+                        self._data[user_id] = value
+                        self._touched[user_id] = now
+                logger.info(f"📋 Восстановлено {len(self._data)} состояний пользователей")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось восстановить состояния пользователей: {e}")
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        logger.info(f"💾 Состояния пользователей сохранены ({len(self._data)})")
+
+    async def flush(self) -> None:
+        """Сохраняет измененные записи и удаляет брошенные"""
+        if self._storage is None:
+            return
+        now = time.time()
+        for user_id in [u for u, t in self._touched.items() if now - t > Config.FSM_TTL_SECONDS]:
+            self._data.pop(user_id, None)
+            self._touched.pop(user_id, None)
+            self._dirty.discard(user_id)
+            self._deleted.add(user_id)
+
+        dirty, self._dirty = self._dirty, set()
+        deleted, self._deleted = self._deleted, set()
+        for user_id in dirty:
+            value = self._data.get(user_id)
+            if value is None:
+                continue
+            try:
+                await self._storage.set_data(self._key(user_id), value)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось сохранить состояние пользователя {user_id}: {e}")
+                self._dirty.add(user_id)
+        for user_id in deleted:
+            try:
+                await self._storage.set_data(self._key(user_id), {})
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось удалить состояние пользователя {user_id}: {e}")
+                self._deleted.add(user_id)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(Config.USER_STATES_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка фоновой записи состояний: {e}")
+
+
+# Одно хранилище на процесс: FSM aiogram и user_states используют его вместе
+fsm_storage = create_fsm_storage()
+user_states = PersistentUserStates()
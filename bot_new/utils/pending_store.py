@@ -0,0 +1,202 @@
+"""
+Хранилище ожиданий фото чека на SQLite (WAL)
+
+- чтение из памяти (O(1)), запись - точечный upsert/delete по ключу;
+- все записи в БД выполняет отдельный поток-писатель пачками,
+  поэтому event loop никогда не ждет диск;
+- истекшие записи удаляются в фоне, WAL периодически сжимается (checkpoint);
+- при первом запуске переносит данные из старого pending_deposit_states.json.
+"""
+
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Как часто удалять истекшие записи и делать checkpoint WAL (секунд)
+SWEEP_INTERVAL = 60
+# Максимум операций в одной транзакции писателя
+WRITE_BATCH_SIZE = 500
+
+_STOP = object()
+
+
+class PendingDepositStore:
+    """Ожидания фото чека: user_id -> {data, expires_at (unix time)}"""
+
+    def __init__(self, db_path: Union[str, Path], legacy_json_path: Union[str, Path, None] = None):
+        self.db_path = str(db_path)
+        self._cache: Dict[str, dict] = {}
+        self._ops: "queue.Queue" = queue.Queue()
+        self._last_memory_sweep = time.time()
+
+        conn = self._connect()
+        try:
+            self._init_schema(conn)
+            if legacy_json_path:
+                self._migrate_legacy_json(conn, Path(legacy_json_path))
+            self._load(conn)
+        finally:
+            conn.close()
+
+        self._writer = threading.Thread(target=self._writer_loop, name="pending-deposit-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    # ---------- публичный API (вызывается из event loop, не блокирует) ----------
+
+    def set(self, user_id: int, data: dict, expires_at: float) -> None:
+        if not data:
+            return
+        key = str(user_id)
+        self._cache[key] = {'data': data, 'expires_at': expires_at}
+        self._ops.put(('upsert', key, json.dumps(data, ensure_ascii=True), float(expires_at)))
+        self._maybe_sweep_memory()
+
+    def get(self, user_id: int) -> Optional[dict]:
+        key = str(user_id)
+        state = self._cache.get(key)
+        if not state:
+            return None
+        expires_at = state.get('expires_at')
+        if not isinstance(expires_at, (int, float)) or expires_at <= time.time():
+            self.clear(user_id)
+            return None
+        return state.get('data')
+
+    def expires_at(self, user_id: int) -> Optional[float]:
+        """Срок ожидания (unix time) или None, если ожидания нет"""
+        state = self._cache.get(str(user_id))
+        return state.get('expires_at') if state else None
+
+    def clear(self, user_id: int) -> None:
+        key = str(user_id)
+        if self._cache.pop(key, None) is not None:
+            self._ops.put(('delete', key))
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Ждет, пока писатель сохранит все изменения (для корректной остановки)"""
+        deadline = time.time() + timeout
+        while self._ops.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+
+    def close(self) -> None:
+        if self._writer.is_alive():
+            self._ops.put(_STOP)
+            self._writer.join(timeout=5)
+
+    # ---------- внутреннее ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _init_schema(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_deposits ("
+            " user_id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pending_deposits_expires ON pending_deposits(expires_at)")
+        conn.commit()
+
+    def _migrate_legacy_json(self, conn: sqlite3.Connection, json_path: Path) -> None:
+        """Переносит ожидания из старого JSON-файла (один раз)"""
+        if not json_path.exists():
+            return
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            rows = []
+            if isinstance(data, dict):
+                for key, value in data.items():
+                    if isinstance(value, dict) and isinstance(value.get('expires_at'), (int, float)) and value.get('data'):
+                        rows.append((str(key), json.dumps(value['data'], ensure_ascii=True), float(value['expires_at'])))
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO pending_deposits(user_id, data, expires_at) VALUES (?, ?, ?)",
+                    rows
+                )
+            json_path.replace(json_path.with_name(json_path.name + '.migrated'))
+            logger.info(f"✅ Перенесено {len(rows)} ожиданий фото чека из {json_path.name} в SQLite")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось перенести {json_path.name} в SQLite: {e}")
+
+    def _load(self, conn: sqlite3.Connection) -> None:
+        """Загружает актуальные записи в память и удаляет истекшие"""
+        now_ts = time.time()
+        with conn:
+            conn.execute("DELETE FROM pending_deposits WHERE expires_at <= ?", (now_ts,))
+        for key, data, expires_at in conn.execute("SELECT user_id, data, expires_at FROM pending_deposits"):
+            try:
+                self._cache[key] = {'data': json.loads(data), 'expires_at': expires_at}
+            except Exception:
+                continue
+        logger.info(f"📋 Загружено {len(self._cache)} ожиданий фото чека")
+
+    def _maybe_sweep_memory(self) -> None:
+        """Изредка убирает истекшие записи из памяти (в БД их удаляет писатель)"""
+        now_ts = time.time()
+        if now_ts - self._last_memory_sweep < SWEEP_INTERVAL:
+            return
+        self._last_memory_sweep = now_ts
+        for key in [k for k, v in self._cache.items() if v.get('expires_at', 0) <= now_ts]:
+            self._cache.pop(key, None)
+
+    def _writer_loop(self) -> None:
+        conn = self._connect()
+        last_sweep = time.time()
+        stopping = False
+        while not stopping:
+            try:
+                first = self._ops.get(timeout=SWEEP_INTERVAL)
+                batch = [first]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._ops.get_nowait())
+                except queue.Empty:
+                    break
+
+            ops = [op for op in batch if op is not _STOP]
+            stopping = len(ops) != len(batch)
+            try:
+                if ops:
+                    with conn:
+                        for op in ops:
+                            if op[0] == 'upsert':
+                                conn.execute(
+                                    "INSERT INTO pending_deposits(user_id, data, expires_at) VALUES (?, ?, ?) "
+                                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+                                    op[1:]
+                                )
+                            else:
+                                conn.execute("DELETE FROM pending_deposits WHERE user_id = ?", (op[1],))
+                if time.time() - last_sweep >= SWEEP_INTERVAL or stopping:
+                    last_sweep = time.time()
+                    with conn:
+                        deleted = conn.execute("DELETE FROM pending_deposits WHERE expires_at <= ?", (last_sweep,)).rowcount
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    if deleted:
+                        logger.info(f"🧹 Удалено {deleted} истекших ожиданий фото чека")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось сохранить ожидания фото чека: {e}")
+            finally:
+                for _ in batch:
+                    self._ops.task_done()
+        conn.close()
@@ -8,12 +8,20 @@
 3. Найдите entity с type="custom_emoji" и получите custom_emoji_id
 """
 
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from aiogram.types import MessageEntity
 from aiogram.enums import MessageEntityType
 from aiogram import Bot
 import re
 
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+# Скомпилированные карты эмодзи: id(emoji_map) -> (копия карты, regex, {эмодзи: длина в UTF-16})
+_emoji_patterns: Dict[int, tuple] = {}
+# Готовые entities статичных шаблонов: (текст, id карты) -> (regex карты, текст без HTML, ((emoji_id, offset, length), ...))
+_static_cache: Dict[Tuple[str, int], tuple] = {}
+_STATIC_CACHE_MAX = 512
+
 
 def _utf16_len(text: str) -> int:
     """Вычисляет длину строки в UTF-16 (для Telegram API)"""
@@ -28,8 +36,64 @@ def _remove_html_tags(text: str) -> str:
     Удаляет HTML теги из текста
     Returns: текст без HTML тегов
     """
-    pattern = r'<[^>]+>'
-    return re.sub(pattern, '', text)
+    return _HTML_TAG_RE.sub('', text)
+
+
+def _trie_regex(keys) -> str:
+    """
+    Строит regex из префиксного дерева эмодзи: общие префиксы (например,
+    вариационный селектор U+FE0F) проверяются один раз, а при совпадении
+    нескольких эмодзи выбирается самый длинный
+    """
+    trie: dict = {}
+    for key in keys:
+        node = trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        alternatives = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alternatives:
+            return ''
+        body = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+        # Эмодзи заканчивается в этом узле - продолжение необязательно (жадно, длинное первым)
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+def _get_emoji_pattern(emoji_map: Dict[str, str]) -> tuple:
+    """(regex, длины эмодзи в UTF-16) по карте эмодзи; пересобирается, только если карта изменилась"""
+    cached = _emoji_patterns.get(id(emoji_map))
+    if cached is None or cached[0] != emoji_map:
+        keys = [key for key in emoji_map if key]
+        pattern = re.compile(_trie_regex(keys)) if keys else None
+        cached = (dict(emoji_map), pattern, {key: _utf16_len(key) for key in keys})
+        _emoji_patterns[id(emoji_map)] = cached
+    return cached[1], cached[2]
+
+
+def _scan_emoji(text: str, emoji_map: Dict[str, str]) -> tuple:
+    """
+    Один проход слева направо: находит эмодзи из карты и считает
+    UTF-16 offset нарастающим итогом (каждый символ кодируется один раз)
+    Returns: кортеж (custom_emoji_id, offset, length)
+    """
+    pattern, emoji_lengths = _get_emoji_pattern(emoji_map)
+    if pattern is None:
+        return ()
+    spans = []
+    utf16_offset = 0
+    last_end = 0
+    for match in pattern.finditer(text):
+        utf16_offset += _utf16_len(text[last_end:match.start()])
+        emoji_char = match.group()
+        utf16_length = emoji_lengths[emoji_char]
+        spans.append((emoji_map[emoji_char], utf16_offset, utf16_length))
+        utf16_offset += utf16_length
+        last_end = match.end()
+    return tuple(spans)
 
 
 def create_premium_emoji_entity(
@@ -58,7 +122,8 @@ def create_premium_emoji_entity(
 
 def add_premium_emoji_to_text(
     text: str,
-    emoji_map: Dict[str, str]
+    emoji_map: Dict[str, str],
+    cache: bool = False
 ) -> tuple[str, List[MessageEntity]]:
     """
     Добавляет премиум эмодзи в текст, заменяя обычные эмодзи
@@ -67,6 +132,7 @@ def add_premium_emoji_to_text(
     Args:
         text: Исходный текст с обычными эмодзи (может содержать HTML теги)
         emoji_map: Словарь {обычный_эмодзи: custom_emoji_id}
+        cache: Запомнить результат (для статичных шаблонов без подстановок)
     
     Returns:
         Кортеж (текст_без_HTML_с_эмодзи, список_entities)
@@ -78,32 +144,26 @@ def add_premium_emoji_to_text(
             {"😊": "1234567890123456789", "🎉": "9876543210987654321"}
         )
     """
-    # Удаляем HTML теги
-    text_without_html = _remove_html_tags(text)
-    
-    entities = []
-    new_text = text_without_html
+    pattern = _get_emoji_pattern(emoji_map)[0]
+    cache_key = (text, id(emoji_map))
+    cached = _static_cache.get(cache_key) if cache else None
+    # Запомненный результат годится, только если карта эмодзи не менялась
+    if cached is not None and cached[0] is pattern:
+        _, new_text, spans = cached
+    else:
+        # Удаляем HTML теги
+        new_text = _remove_html_tags(text)
+        spans = _scan_emoji(new_text, emoji_map)
+        if cache:
+            if len(_static_cache) >= _STATIC_CACHE_MAX:
+                _static_cache.clear()
+            _static_cache[cache_key] = (pattern, new_text, spans)
     
-    # Проходим по тексту и создаем entities для каждого найденного эмодзи
-    for emoji_char, emoji_id in emoji_map.items():
-        offset = 0
-        while True:
-            pos = new_text.find(emoji_char, offset)
-            if pos == -1:
-                break
-            
-            # Вычисляем offset и length в UTF-16 (требуется для Telegram API)
-            utf16_offset = _utf16_offset(new_text, pos)
-            utf16_length = _utf16_len(emoji_char)
-            
-            # Создаем entity для премиум эмодзи
-            entity = create_premium_emoji_entity(
-                custom_emoji_id=emoji_id,
-                offset=utf16_offset,
-                length=utf16_length
-            )
-            entities.append(entity)
-            offset = pos + len(emoji_char)
+    # Entities создаются заново на каждый вызов - вызывающий код может их менять
+    entities = [
+        create_premium_emoji_entity(custom_emoji_id=emoji_id, offset=offset, length=length)
+        for emoji_id, offset, length in spans
+    ]
     
     return new_text, entities
 
@@ -0,0 +1,232 @@
+"""
+Глобальный ограничитель исходящих запросов к Bot API (token bucket)
+
+- общий бакет на весь бот (лимит Telegram ~30 сообщений/сек);
+- бакет на каждый чат (~1 сообщение/сек в личке, ~20/мин в группе);
+- приоритеты: ответы пользователю ждут своей очереди, а косметические
+  обновления таймеров получают токен только при запасе и без ожидания;
+- под нагрузкой таймеры автоматически реже обновляют сообщение.
+
+Отправка и редактирование сообщений проходят через GovernorRequestMiddleware
+(aiogram session middleware).
+"""
+
+import time
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Hashable, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram
+GLOBAL_RATE = 30.0            # сообщений в секунду на бота
+GLOBAL_BURST = 30.0
+PRIVATE_CHAT_RATE = 1.0       # сообщений в секунду в личном чате
+PRIVATE_CHAT_BURST = 3.0
+GROUP_CHAT_RATE = 20.0 / 60   # сообщений в секунду в группе
+GROUP_CHAT_BURST = 5.0
+# Доля общего бакета, которую косметические запросы не могут занять
+COSMETIC_RESERVE = 0.5
+# Сколько бакетов чатов держать в памяти до очистки полных
+MAX_CHAT_BUCKETS = 10000
+
+# Методы, на которые распространяются лимиты Telegram на сообщения
+LIMITED_METHODS = frozenset({
+    "sendMessage", "sendPhoto", "sendDocument", "sendVideo", "sendAnimation",
+    "sendVoice", "sendAudio", "sendSticker", "sendMediaGroup", "sendLocation",
+    "copyMessage", "forwardMessage",
+    "editMessageText", "editMessageCaption", "editMessageReplyMarkup", "editMessageMedia",
+})
+
+PRIORITY_USER = 0
+PRIORITY_COSMETIC = 1
+
+# Запрос уже оплачен токеном (например, таймер получил его через try_acquire)
+_prepaid: contextvars.ContextVar[bool] = contextvars.ContextVar("rate_governor_prepaid", default=False)
+
+
+class TokenBucket:
+    """Классический token bucket на monotonic-времени"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.tokens
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Через сколько секунд в бакете будет amount токенов"""
+        self._refill(now)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float = 1.0) -> None:
+        self.tokens -= amount
+
+
+class RateGovernor:
+    """Общий лимитер исходящих запросов с учетом чатов и приоритетов"""
+
+    def __init__(self):
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self._chats: Dict[Hashable, TokenBucket] = {}
+        # chat_id (или None для всего бота) -> monotonic время окончания штрафа RetryAfter
+        self._penalties: Dict[Optional[Hashable], float] = {}
+        self._waiting_user_requests = 0
+        self.stats = {"user": 0, "cosmetic": 0, "cosmetic_denied": 0, "waited_ms": 0.0, "retry_after": 0}
+
+    # ---------- бакеты ----------
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._evict_full_buckets()
+            is_group = isinstance(chat_id, int) and chat_id < 0
+            if is_group:
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+            else:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _evict_full_buckets(self) -> None:
+        """Удаляет бакеты чатов, которые уже полностью восстановились (они эквивалентны новым)"""
+        now = time.monotonic()
+        for chat_id in [c for c, b in self._chats.items() if b.available(now) >= b.capacity]:
+            del self._chats[chat_id]
+
+    def _penalty_wait(self, chat_id: Optional[Hashable], now: float) -> float:
+        wait = 0.0
+        for key in (None, chat_id):
+            until = self._penalties.get(key)
+            if until is not None:
+                if until <= now:
+                    del self._penalties[key]
+                else:
+                    wait = max(wait, until - now)
+        return wait
+
+    # ---------- публичный API ----------
+
+    async def acquire(self, chat_id: Optional[Hashable] = None) -> None:
+        """Ждет токен для запроса, видимого пользователю (высокий приоритет)"""
+        started = time.monotonic()
+        self._waiting_user_requests += 1
+        try:
+            while True:
+                now = time.monotonic()
+                wait = max(self._global.time_until(1, now), self._penalty_wait(chat_id, now))
+                if chat_id is not None:
+                    wait = max(wait, self._chat_bucket(chat_id).time_until(1, now))
+                if wait <= 0:
+                    self._global.take()
+                    if chat_id is not None:
+                        self._chat_bucket(chat_id).take()
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            self._waiting_user_requests -= 1
+        self.stats["user"] += 1
+        self.stats["waited_ms"] += (time.monotonic() - started) * 1000
+
+    def try_acquire(self, chat_id: Optional[Hashable] = None, priority: int = PRIORITY_COSMETIC) -> bool:
+        """
+        Неблокирующая попытка получить токен.
+        Косметическим запросам токен выдается, только если никто из пользователей
+        не ждет и в общем бакете остается резерв.
+        """
+        now = time.monotonic()
+        if self._penalty_wait(chat_id, now) > 0:
+            self.stats["cosmetic_denied"] += 1
+            return False
+        reserve = GLOBAL_BURST * COSMETIC_RESERVE if priority >= PRIORITY_COSMETIC else 0.0
+        if priority >= PRIORITY_COSMETIC and self._waiting_user_requests:
+            self.stats["cosmetic_denied"] += 1
+            return False
+        if self._global.available(now) < 1 + reserve:
+            self.stats["cosmetic_denied"] += 1
+            return False
+        if chat_id is not None and self._chat_bucket(chat_id).available(now) < 1:
+            self.stats["cosmetic_denied"] += 1
+            return False
+        self._global.take()
+        if chat_id is not None:
+            self._chat_bucket(chat_id).take()
+        self.stats["cosmetic"] += 1
+        return True
+
+    def penalize(self, chat_id: Optional[Hashable], retry_after: float) -> None:
+        """Учитывает RetryAfter от Telegram: запросы в этот чат ждут указанное время"""
+        until = time.monotonic() + float(retry_after)
+        self._penalties[chat_id] = max(self._penalties.get(chat_id, 0.0), until)
+        self.stats["retry_after"] += 1
+        logger.warning(f"⚠️ Telegram RetryAfter {retry_after} сек (чат {chat_id}), запросы приостановлены")
+
+    def load(self) -> float:
+        """Загрузка общего бакета: 0 - свободен, 1 - исчерпан"""
+        now = time.monotonic()
+        if self._penalty_wait(None, now) > 0:
+            return 1.0
+        return 1.0 - self._global.available(now) / GLOBAL_BURST
+
+    def timer_interval(self, base_interval: float, max_interval: float = 30.0) -> float:
+        """Интервал обновления таймеров с учетом загрузки: чем выше нагрузка, тем реже"""
+        load = self.load()
+        if self._waiting_user_requests or load >= 0.8:
+            factor = 4
+        elif load >= 0.5:
+            factor = 2
+        else:
+            factor = 1
+        return min(max_interval, base_interval * factor)
+
+    @contextmanager
+    def prepaid(self):
+        """Помечает запросы внутри блока как уже оплаченные токеном"""
+        token = _prepaid.set(True)
+        try:
+            yield
+        finally:
+            _prepaid.reset(token)
+
+
+# Один лимитер на процесс
+rate_governor = RateGovernor()
+
+
+class GovernorRequestMiddleware(BaseRequestMiddleware):
+    """Пропускает отправку и редактирование сообщений через общий лимитер"""
+
+    def __init__(self, governor: RateGovernor = rate_governor):
+        self.governor = governor
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot, method: TelegramMethod):
+        if getattr(method, "__api_method__", None) not in LIMITED_METHODS:
+            return await make_request(bot, method)
+        chat_id = getattr(method, "chat_id", None)
+        if not _prepaid.get():
+            await self.governor.acquire(chat_id)
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            self.governor.penalize(chat_id, e.retry_after)
+            raise
@@ -0,0 +1,175 @@
+"""
+Единый планировщик дедлайнов на куче (heapq)
+
+Вместо отдельной asyncio-задачи на каждого пользователя, которая просыпается
+каждую секунду, все дедлайны хранятся в одной куче. Планировщик спит до
+ближайшего дедлайна и запускает только те задания, которым действительно пора.
+Задание возвращает время следующего запуска (loop time) или None, если оно завершено.
+"""
+
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Задание: async-функция без аргументов, возвращает следующий дедлайн или None
+Job = Callable[[], Awaitable[Optional[float]]]
+
+# Как часто писать метрики в лог (секунд)
+METRICS_LOG_INTERVAL = 300
+
+
+class ScheduledHandle:
+    """Хендл задания в планировщике (совместим с прежним API asyncio.Task: .cancel())"""
+
+    def __init__(self, scheduler: "DeadlineScheduler", key: Hashable):
+        self._scheduler = scheduler
+        self._key = key
+
+    def cancel(self) -> bool:
+        return self._scheduler.cancel(self._key)
+
+    def done(self) -> bool:
+        return self._key not in self._scheduler
+
+    def __repr__(self) -> str:
+        return f"<ScheduledHandle key={self._key!r} done={self.done()}>"
+
+
+class DeadlineScheduler:
+    """Планировщик: одна фоновая задача на все дедлайны"""
+
+    def __init__(self, name: str = "scheduler", max_concurrency: int = 50):
+        self.name = name
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._seq = itertools.count()
+        # key -> (seq актуальной записи в куче, задание); устаревшие записи в куче пропускаются
+        self._jobs: Dict[Hashable, Tuple[int, Job]] = {}
+        self._running: Dict[Hashable, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Метрики
+        self._fired = 0
+        self._lateness_total = 0.0
+        self._lateness_max = 0.0
+        self._last_metrics_log = 0.0
+
+    # ---------- публичный API ----------
+
+    def schedule(self, key: Hashable, when: float, job: Job) -> ScheduledHandle:
+        """Ставит (или переставляет) задание key на момент when (asyncio loop time)"""
+        self._ensure_runner()
+        running = self._running.pop(key, None)
+        if running and running is not asyncio.current_task():
+            running.cancel()
+        seq = next(self._seq)
+        self._jobs[key] = (seq, job)
+        heapq.heappush(self._heap, (when, seq, key))
+        if self._heap[0][1] == seq:
+            # Новый дедлайн раньше текущего - будим планировщик
+            self._wakeup.set()
+        return ScheduledHandle(self, key)
+
+    def cancel(self, key: Hashable) -> bool:
+        """Снимает задание. Запись в куче удаляется лениво"""
+        removed = self._jobs.pop(key, None) is not None
+        running = self._running.pop(key, None)
+        if running and running is not asyncio.current_task():
+            running.cancel()
+            removed = True
+        return removed
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._jobs or key in self._running
+
+    def metrics(self) -> dict:
+        """Глубина очереди и опоздания срабатываний"""
+        return {
+            'queue_depth': len(self._jobs),
+            'heap_size': len(self._heap),
+            'running': len(self._running),
+            'fired': self._fired,
+            'lateness_avg_ms': round(self._lateness_total / self._fired * 1000, 1) if self._fired else 0.0,
+            'lateness_max_ms': round(self._lateness_max * 1000, 1),
+        }
+
+    async def stop(self) -> None:
+        """Останавливает планировщик и все выполняющиеся задания"""
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        for task in list(self._running.values()):
+            task.cancel()
+        self._running.clear()
+        self._jobs.clear()
+        self._heap.clear()
+
+    # ---------- внутреннее ----------
+
+    def _ensure_runner(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            # Чистим устаревшие записи с вершины кучи
+            while self._heap and self._jobs.get(self._heap[0][2], (None,))[0] != self._heap[0][1]:
+                heapq.heappop(self._heap)
+
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            when = self._heap[0][0]
+            delay = when - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            when, seq, key = heapq.heappop(self._heap)
+            _, job = self._jobs.pop(key)
+            lateness = max(0.0, loop.time() - when)
+            self._fired += 1
+            self._lateness_total += lateness
+            self._lateness_max = max(self._lateness_max, lateness)
+            self._running[key] = asyncio.create_task(self._execute(key, job))
+            self._maybe_log_metrics(loop.time())
+
+    async def _execute(self, key: Hashable, job: Job) -> None:
+        """Выполняет задание и ставит его следующий запуск"""
+        task = asyncio.current_task()
+        next_when = None
+        try:
+            async with self._semaphore:
+                next_when = await job()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"❌ Ошибка задания {key} в планировщике {self.name}: {e}", exc_info=True)
+        finally:
+            # Задание могли отменить или переставить, пока оно выполнялось
+            if self._running.get(key) is task:
+                del self._running[key]
+                if next_when is not None and key not in self._jobs:
+                    self.schedule(key, next_when, job)
+
+    def _maybe_log_metrics(self, now: float) -> None:
+        if now - self._last_metrics_log < METRICS_LOG_INTERVAL:
+            return
+        self._last_metrics_log = now
+        logger.info(f"📊 Планировщик {self.name}: {self.metrics()}")
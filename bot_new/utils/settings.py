@@ -1,9 +1,14 @@
 """
 Утилиты для загрузки настроек
+
+Настройки обновляются фоновой задачей (условные запросы с If-None-Match),
+параллельные вызовы load_settings() ждут один общий запрос, а необязательный
+SSE-канал админки сбрасывает кеш сразу после изменения настроек.
 """
 
 import logging
 import asyncio
+from typing import Optional
 import httpx
 from config import Config
 
@@ -22,40 +27,95 @@ settings_cache = {
     'bookmaker_settings': {}
 }
 
-async def load_settings():
-    """Загружает настройки из API"""
+# ETag последнего успешного ответа (для If-None-Match)
+_settings_etag: Optional[str] = None
+# Текущий запрос настроек (single-flight)
+_settings_inflight: Optional[asyncio.Task] = None
+# Безусловный запрос по событию изменения уже запланирован, но еще не отправлен
+_settings_forced_queued = False
+# Фоновые задачи обновления
+_refresher_task: Optional[asyncio.Task] = None
+_events_task: Optional[asyncio.Task] = None
+
+
+async def load_settings(force: bool = False):
+    """
+    Загружает настройки из API.
+    Если запрос уже выполняется - ждет его, а не запускает второй параллельно.
+    force=True (событие изменения настроек) отправляет безусловный запрос (без If-None-Match).
+    Уже идущий запрос мог уйти до изменения и вернуть 304 или старые данные, поэтому
+    безусловный запрос выполняется после него; события, пришедшие до его отправки, ждут его же.
+    """
+    global _settings_inflight, _settings_forced_queued
+    if force:
+        if not _settings_forced_queued:
+            _settings_forced_queued = True
+            _settings_inflight = asyncio.create_task(_fetch_settings_after(_settings_inflight))
+    elif _settings_inflight is None or _settings_inflight.done():
+        _settings_inflight = asyncio.create_task(_fetch_settings())
+    # shield: отмена одного ожидающего не отменяет общий запрос для остальных
+    await asyncio.shield(_settings_inflight)
+
+
+async def _fetch_settings_after(previous):
+    """Безусловный запрос настроек после завершения предыдущего запроса"""
+    global _settings_forced_queued
     try:
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+    finally:
+        _settings_forced_queued = False
+    await _fetch_settings(force=True)
+
+
+async def _fetch_settings(force: bool = False):
+    """Выполняет запрос настроек и обновляет кеш"""
+    global _settings_etag
+    try:
+        headers = {}
+        if _settings_etag and not force and settings_cache.get('last_update', 0):
+            headers['If-None-Match'] = _settings_etag
         async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{Config.API_URL}/api/public/payment-settings")
+            response = await client.get(f"{Config.API_URL}/api/public/payment-settings", headers=headers)
+            if response.status_code == 304:
+                # Настройки не менялись
+                settings_cache['last_update'] = asyncio.get_event_loop().time()
+                logger.debug("✅ Настройки не изменились (304)")
+                return
             if response.status_code == 200:
                 result = response.json()
                 data = result
-                
+
                 settings_cache['casinos'] = data.get('casinos', {})
                 deposits_data = data.get('deposits', {})
                 withdrawals_data = data.get('withdrawals', {})
                 bookmaker_settings = data.get('bookmaker_settings', {})
-                
+
                 if isinstance(deposits_data, dict):
                     settings_cache['deposit_banks'] = deposits_data.get('banks', [])
                     settings_cache['deposits_enabled'] = deposits_data.get('enabled', True)
                 else:
                     settings_cache['deposit_banks'] = []
                     settings_cache['deposits_enabled'] = True
-                
+
                 if isinstance(withdrawals_data, dict):
                     settings_cache['withdrawal_banks'] = withdrawals_data.get('banks', [])
                     settings_cache['withdrawals_enabled'] = withdrawals_data.get('enabled', True)
                 else:
                     settings_cache['withdrawal_banks'] = []
                     settings_cache['withdrawals_enabled'] = True
-                
+
                 settings_cache['bookmaker_settings'] = bookmaker_settings
                 settings_cache['pause'] = data.get('pause', False)
                 settings_cache['maintenance_message'] = data.get('maintenance_message', 'Технические работы. Попробуйте позже.')
                 settings_cache['last_update'] = asyncio.get_event_loop().time()
+                _settings_etag = response.headers.get('ETag')
                 logger.info(f"✅ Настройки загружены: букмекеры={len(settings_cache['casinos'])}, депозиты={settings_cache['deposits_enabled']}")
     except Exception as e:
+        if settings_cache.get('last_update', 0):
+            # Уже есть актуальные настройки - не затираем их значениями по умолчанию
+            logger.warning(f"⚠️ Не удалось обновить настройки: {e}, оставляем предыдущие")
+            return
         logger.warning(f"⚠️ Не удалось загрузить настройки: {e}, используем значения по умолчанию")
         settings_cache['casinos'] = {'1xbet': True, '1win': True, 'melbet': True, 'mostbet': True, 'winwin': True, '888starz': True}
         settings_cache['deposit_banks'] = ['mbank', 'bakai', 'balance', 'demir', 'omoney', 'megapay']
@@ -66,8 +126,85 @@ async def load_settings():
         settings_cache['pause'] = False
         settings_cache['maintenance_message'] = 'Технические работы. Попробуйте позже.'
 
+
+async def ensure_settings_fresh():
+    """
+    Вызывается из обработчиков вместо проверки возраста кеша.
+    Ждет загрузку только если настройки еще ни разу не загружались;
+    устаревший кеш обновляется в фоне, не задерживая ответ пользователю.
+    """
+    last_update = settings_cache.get('last_update', 0)
+    if not last_update:
+        await load_settings()
+        return
+    if asyncio.get_event_loop().time() - last_update > Config.SETTINGS_MAX_AGE_SECONDS:
+        if _settings_inflight is None or _settings_inflight.done():
+            asyncio.create_task(load_settings())
+
+
+async def _settings_refresher():
+    """Периодически обновляет настройки (условными запросами)"""
+    while True:
+        await asyncio.sleep(Config.SETTINGS_REFRESH_SECONDS)
+        try:
+            await load_settings()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка фонового обновления настроек: {e}")
+
+
+async def _settings_events_listener():
+    """Слушает SSE-канал админки и перезагружает настройки на каждое событие"""
+    backoff = 1
+    while True:
+        try:
+            timeout = httpx.Timeout(10.0, read=None)
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                async with client.stream(
+                    'GET',
+                    Config.SETTINGS_EVENTS_URL,
+                    headers={'Accept': 'text/event-stream'}
+                ) as response:
+                    if response.status_code != 200:
+                        raise RuntimeError(f"HTTP {response.status_code}")
+                    logger.info("✅ Подписка на изменения настроек установлена")
+                    backoff = 1
+                    async for line in response.aiter_lines():
+                        if line.startswith('data:'):
+                            logger.info("🔄 Получено событие изменения настроек, обновляю кеш")
+                            await load_settings(force=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Канал изменений настроек недоступен: {e}, переподключение через {backoff} сек")
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def start_settings_refresher():
+    """Запускает фоновое обновление настроек (и SSE-подписку, если задан SETTINGS_EVENTS_URL)"""
+    global _refresher_task, _events_task
+    if _refresher_task is None or _refresher_task.done():
+        _refresher_task = asyncio.create_task(_settings_refresher())
+    if Config.SETTINGS_EVENTS_URL and (_events_task is None or _events_task.done()):
+        _events_task = asyncio.create_task(_settings_events_listener())
+
+
+async def stop_settings_refresher():
+    """Останавливает фоновые задачи обновления настроек"""
+    global _refresher_task, _events_task
+    for task in (_refresher_task, _events_task):
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    _refresher_task = None
+    _events_task = None
+
+
 def get_settings():
     """Возвращает кеш настроек"""
     return settings_cache
-
-
@@ -2,6 +2,16 @@
 Тексты и переводы для бота
 """
 
+import string
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Логотип в main_menu_text: обычный эмодзи-заглушка, поверх которого ставится премиум эмодзи
+LOGO_PLACEHOLDER_EMOJI = "🔷"
+LOGO_CUSTOM_EMOJI_ID = "5188543703018408791"
+
 CASINO_NAMES = {
     '1xbet': '1XBET',
     '1win': '1WIN',
@@ -180,12 +190,193 @@ def get_text(key: str, lang: str = 'ru', **kwargs) -> str:
         return text
 
 
+class CompiledTemplate:
+    """
+    Шаблон из TRANSLATIONS, разобранный один раз: литеральные куски уже без
+    HTML и с готовыми премиум эмодзи (offset от начала куска), между ними -
+    слоты {user_name}, {amount:.2f} и т.п. При заполнении обрабатываются
+    только подставленные значения, entities литералов лишь сдвигаются.
+    """
+    
+    _formatter = string.Formatter()
+    
+    def __init__(self, pieces: List[Tuple[str, int, tuple]], slots: List[Tuple[str, Optional[str], str]]):
+        # pieces: (текст, длина в UTF-16, ((custom_emoji_id, offset, length), ...)); их на один больше, чем слотов
+        self.pieces = pieces
+        # slots: (имя поля, конверсия !r/!s, формат)
+        self.slots = slots
+        self.field_names = {field_name for field_name, _, _ in slots}
+    
+    def render(self, kwargs: dict) -> Tuple[str, tuple]:
+        """(текст, спаны премиум эмодзи). KeyError/ValueError - если значения не подходят к шаблону"""
+        from utils.premium_emoji import _remove_html_tags, _scan_emoji, _utf16_len
+        from config import Config
+        
+        if not self.slots:
+            text, _, spans = self.pieces[0]
+            return text, spans
+        
+        if 'casino_name' in self.field_names and 'casino_name' not in kwargs:
+            kwargs = dict(kwargs, casino_name=get_casino_name(kwargs.get('bookmaker') or kwargs.get('casino') or ''))
+        
+        parts = []
+        spans = []
+        offset = 0
+        for index, (piece_text, piece_length, piece_spans) in enumerate(self.pieces):
+            if piece_text:
+                parts.append(piece_text)
+                spans.extend((emoji_id, offset + span_offset, length) for emoji_id, span_offset, length in piece_spans)
+                offset += piece_length
+            if index == len(self.slots):
+                break
+            field_name, conversion, format_spec = self.slots[index]
+            value = self._formatter.get_field(field_name, (), kwargs)[0]
+            value = self._formatter.format_field(self._formatter.convert_field(value, conversion), format_spec)
+            if value:
+                # Подставленное значение обрабатывается так же, как раньше весь текст
+                value = _remove_html_tags(value)
+                parts.append(value)
+                spans.extend(
+                    (emoji_id, offset + span_offset, length)
+                    for emoji_id, span_offset, length in _scan_emoji(value, Config.PREMIUM_EMOJI_MAP)
+                )
+                offset += _utf16_len(value)
+        return ''.join(parts), tuple(spans)
+
+
+def _insert_logo_placeholder(text: str) -> str:
+    """Ставит заглушку логотипа после "LUX ON!" (или в конец первой строки) вместо {logo_emoji}"""
+    # Как и get_text, убираем только сам плейсхолдер - пробелы вокруг остаются
+    text_clean = text.replace('{logo_emoji}', '')
+    for marker in ('LUX ON!', 'LUX ON'):
+        marker_pos = text_clean.find(marker)
+        if marker_pos != -1:
+            insert_pos = marker_pos + len(marker)
+            break
+    else:
+        insert_pos = text_clean.find('\n')
+        if insert_pos == -1:
+            insert_pos = len(text_clean)
+    return text_clean[:insert_pos] + ' ' + LOGO_PLACEHOLDER_EMOJI + text_clean[insert_pos:]
+
+
+def compile_template(text: str) -> Optional[CompiledTemplate]:
+    """Разбирает шаблон. None - если шаблон нельзя собрать по кускам (тогда текст строится по-старому)"""
+    from utils.premium_emoji import _remove_html_tags, _scan_emoji, _utf16_len
+    from config import Config
+    
+    has_logo = '{logo_emoji}' in text
+    if has_logo:
+        text = _insert_logo_placeholder(text)
+    
+    pieces = []
+    slots = []
+    try:
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(text):
+            piece_text = _remove_html_tags(literal)
+            # HTML-тег, разорванный слотом, нельзя убрать по кускам
+            if '<' in piece_text or '>' in piece_text:
+                return None
+            pieces.append([piece_text, _utf16_len(piece_text), _scan_emoji(piece_text, Config.PREMIUM_EMOJI_MAP)])
+            if field_name is not None:
+                # Вложенные поля в формате и позиционные {} не поддерживаются
+                if not field_name or '{' in (format_spec or ''):
+                    return None
+                slots.append((field_name, conversion, format_spec or ''))
+    except ValueError:
+        return None
+    if len(pieces) == len(slots):
+        pieces.append(['', 0, ()])
+    
+    if has_logo:
+        for piece in pieces:
+            logo_pos = piece[0].find(LOGO_PLACEHOLDER_EMOJI)
+            if logo_pos != -1:
+                logo_offset = _utf16_len(piece[0][:logo_pos])
+                logo_end = logo_offset + _utf16_len(LOGO_PLACEHOLDER_EMOJI)
+                # Логотип имеет приоритет над пересекающимися эмодзи
+                piece[2] = tuple(
+                    span for span in piece[2] if not (logo_offset < span[1] + span[2] and logo_end > span[1])
+                ) + ((LOGO_CUSTOM_EMOJI_ID, logo_offset, logo_end - logo_offset),)
+                break
+    
+    return CompiledTemplate([tuple(piece) for piece in pieces], slots)
+
+
+# lang -> key -> скомпилированный шаблон (None - собирается по-старому)
+_compiled_templates: Dict[str, Dict[str, Optional[CompiledTemplate]]] = {}
+
+
+def prepare_templates() -> None:
+    """Компилирует все шаблоны TRANSLATIONS (при старте бота)"""
+    for lang, translations in TRANSLATIONS.items():
+        compiled = {key: compile_template(text) for key, text in translations.items()}
+        _compiled_templates[lang] = compiled
+        fallback = [key for key, template in compiled.items() if template is None]
+        logger.info(f"✅ Шаблоны текстов ({lang}) скомпилированы: {len(compiled) - len(fallback)}, без компиляции: {len(fallback)}")
+
+
+def get_compiled_template(key: str, lang: str = 'ru') -> Optional[CompiledTemplate]:
+    if not _compiled_templates:
+        prepare_templates()
+    if lang not in _compiled_templates:
+        lang = 'ru'
+    return _compiled_templates[lang].get(key)
+
+
+def _spans_to_entities(spans) -> list:
+    from utils.premium_emoji import create_premium_emoji_entity
+    return [
+        create_premium_emoji_entity(custom_emoji_id=emoji_id, offset=offset, length=length)
+        for emoji_id, offset, length in spans
+    ]
+
+
 def get_text_with_premium_emoji(key: str, lang: str = 'ru', **kwargs) -> tuple[str, list]:
     """Получает текст с премиум эмодзи
     
     Returns:
         tuple: (текст, список entities для премиум эмодзи)
     """
+    template = get_compiled_template(key, lang)
+    if template is not None:
+        try:
+            text, spans = template.render(kwargs)
+            return text, _spans_to_entities(spans)
+        except (KeyError, IndexError, AttributeError, ValueError, TypeError):
+            # Не хватает переменной или значение не подходит к формату - как раньше через get_text
+            pass
+    return _build_text_with_premium_emoji(key, lang, **kwargs)
+
+
+def compose_texts(*pieces, separator: str = "\n\n") -> tuple[str, list]:
+    """
+    Склеивает готовые тексты с entities в одно сообщение, сдвигая offset.
+    pieces: кортежи (текст, entities) или строки (к ним применяются премиум эмодзи)
+    """
+    from utils.premium_emoji import add_premium_emoji_to_text, _utf16_len
+    from config import Config
+    
+    parts = []
+    entities = []
+    offset = 0
+    separator_length = _utf16_len(separator)
+    for index, piece in enumerate(pieces):
+        if isinstance(piece, str):
+            piece = add_premium_emoji_to_text(piece, Config.PREMIUM_EMOJI_MAP)
+        piece_text, piece_entities = piece
+        if index:
+            parts.append(separator)
+            offset += separator_length
+        parts.append(piece_text)
+        for entity in piece_entities or ():
+            entities.append(entity.model_copy(update={'offset': entity.offset + offset}) if offset else entity)
+        offset += _utf16_len(piece_text)
+    return ''.join(parts), entities
+
+
+def _build_text_with_premium_emoji(key: str, lang: str = 'ru', **kwargs) -> tuple[str, list]:
+    """Строит текст с премиум эмодзи без скомпилированного шаблона"""
     from utils.premium_emoji import add_premium_emoji_to_text
     from utils.premium_emoji import _utf16_offset, _utf16_len
     from config import Config
@@ -205,7 +396,7 @@ def get_text_with_premium_emoji(key: str, lang: str = 'ru', **kwargs) -> tuple[s
             luxon_pos = text_clean.find('LUX ON')
         
         # Используем обычный эмодзи как заглушку (будет заменен на премиум логотип)
-        logo_placeholder_emoji = "🔷"  # Временный эмодзи, который заменим на логотип
+        logo_placeholder_emoji = LOGO_PLACEHOLDER_EMOJI  # Временный эмодзи, который заменим на логотип
         
         if luxon_pos != -1:
             # Вставляем эмодзи-заглушку после "LUX ON!"
@@ -236,7 +427,7 @@ def get_text_with_premium_emoji(key: str, lang: str = 'ru', **kwargs) -> tuple[s
                 type=MessageEntityType.CUSTOM_EMOJI,
                 offset=logo_utf16_offset,
                 length=logo_utf16_length,  # Длина заглушки в UTF-16
-                custom_emoji_id="5188543703018408791"
+                custom_emoji_id=LOGO_CUSTOM_EMOJI_ID
             )
             
             # Проверяем, что entity не перекрывается с другими entities
@@ -257,7 +448,8 @@ def get_text_with_premium_emoji(key: str, lang: str = 'ru', **kwargs) -> tuple[s
             # Если заглушка не найдена, просто применяем премиум эмодзи
             text = text_with_emoji
     else:
-        text, entities = add_premium_emoji_to_text(text, Config.PREMIUM_EMOJI_MAP)
+        # Шаблон без подстановок всегда дает один и тот же результат - запоминаем его
+        text, entities = add_premium_emoji_to_text(text, Config.PREMIUM_EMOJI_MAP, cache=not kwargs)
     
     return text, entities
 
@@ -1,216 +1,323 @@
 """
 Таймер для депозитов
+
+Все таймеры обслуживаются одним планировщиком (utils.scheduler): задание
+просыпается только когда пора обновить сообщение или отменить заявку.
+Срок оплаты (timer_deadline, unix time) хранится в user_states, поэтому после
+рестарта restore_timers() перезапускает таймеры или отменяет истекшие заявки.
 """
 
+import time
 import logging
 import asyncio
-from typing import Dict
+from typing import Dict, Optional
 from aiogram import Bot
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import StorageKey
 from utils.keyboards import get_bank_keyboard
-from utils.settings import load_settings, get_settings
+from utils.settings import ensure_settings_fresh, get_settings
 from utils.texts import get_casino_name, get_text
 from utils.premium_emoji import add_premium_emoji_to_text
+from utils.scheduler import DeadlineScheduler, ScheduledHandle
+from utils.rate_governor import rate_governor
+from utils.fsm_storage import fsm_storage
 from config import Config
 from html import escape
 
 logger = logging.getLogger(__name__)
 
-# Словарь активных таймеров
-active_timers: Dict[int, asyncio.Task] = {}
-
-async def update_timer(bot: Bot, user_id: int, total_seconds: int, data: dict, message_id: int, chat_id: int, user_states: dict) -> None:
-    """Обновляет таймер с оптимизацией для большого количества пользователей"""
-    try:
-        start_time = asyncio.get_event_loop().time()
-        remaining_seconds = total_seconds
-        last_update_time = 0
-        last_displayed_minutes = -1
-        update_interval = 5  # Обновляем каждые 5 секунд (вместо каждой секунды)
-        consecutive_errors = 0
-        max_consecutive_errors = 3
-        
+# Единый планировщик всех таймеров депозита
+timer_scheduler = DeadlineScheduler("deposit_timers")
+
+# Словарь активных таймеров (user_id -> хендл в планировщике)
+active_timers: Dict[int, ScheduledHandle] = {}
+
+
+class DepositTimer:
+    """Состояние таймера одного пользователя; tick() вызывается планировщиком"""
+
+    def __init__(self, bot: Bot, user_id: int, total_seconds: int, data: dict, message_id: int, chat_id: int, user_states: dict):
+        self.bot = bot
+        self.user_id = user_id
+        self.total_seconds = total_seconds
+        self.data = data
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.user_states = user_states
+        self.start_time = asyncio.get_event_loop().time()
+        self.last_update_time = 0
+        self.last_displayed_minutes = -1
+        self.update_interval = 5  # Обновляем каждые 5 секунд (вместо каждой секунды)
+        self.consecutive_errors = 0
+        self.max_consecutive_errors = 3
         # Кэшируем настройки
-        settings_cache_time = 0
-        settings_cache = None
-        
-        while remaining_seconds > 0:
-            await asyncio.sleep(1)
-            
+        self.settings_cache_time = 0
+        self.settings_cache = None
+
+    def _forget(self) -> None:
+        active_timers.pop(self.user_id, None)
+
+    def _remaining(self, now: float) -> int:
+        elapsed = int(now - self.start_time)
+        return max(0, self.total_seconds - elapsed)
+
+    def _next_wakeup(self, now: float) -> float:
+        """
+        Следующий момент, когда нужно обновить сообщение:
+        1. прошел update_interval с последнего обновления;
+        2. или сменится минута;
+        3. или осталось меньше минуты (каждую секунду);
+        и в любом случае - не позже истечения времени.
+        """
+        elapsed = int(now - self.start_time)
+        remaining = self._remaining(now)
+        deadline = self.start_time + self.total_seconds
+        # Под нагрузкой лимитер растягивает интервал обновления
+        interval = rate_governor.timer_interval(self.update_interval)
+        candidates = [
+            self.last_update_time + interval,
+            # Минута сменится, когда remaining станет меньше (remaining // 60) * 60
+            self.start_time + self.total_seconds - (remaining // 60) * 60 + 1,
+            deadline,
+        ]
+        if remaining - 1 < 60 and interval <= self.update_interval:
+            candidates.append(self.start_time + elapsed + 1)
+        return max(now, min(candidates))
+
+    async def tick(self) -> Optional[float]:
+        """Один шаг таймера. Возвращает время следующего запуска или None, если таймер завершен"""
+        user_id = self.user_id
+        user_states = self.user_states
+        try:
             # Проверяем, не была ли заявка уже создана
             if user_id not in user_states:
                 logger.info(f"⏹️ Таймер остановлен для пользователя {user_id} - состояние очищено")
-                if user_id in active_timers:
-                    del active_timers[user_id]
-                break
-            
+                self._forget()
+                return None
+
             current_state = user_states.get(user_id, {})
             current_step = current_state.get('step', '')
-            
+
             # Если заявка уже создана, останавливаем таймер
             if current_step not in ['deposit_bank', 'deposit_receipt_photo']:
                 logger.info(f"⏹️ Таймер остановлен для пользователя {user_id} - заявка создана")
-                if user_id in active_timers:
-                    del active_timers[user_id]
-                break
-            
-            # Вычисляем оставшееся время
-            elapsed = int(asyncio.get_event_loop().time() - start_time)
-            remaining_seconds = max(0, total_seconds - elapsed)
-            
+                self._forget()
+                return None
+
+            current_time = asyncio.get_event_loop().time()
+            remaining_seconds = self._remaining(current_time)
+            if remaining_seconds <= 0:
+                await self._expire()
+                return None
+
             # Форматируем таймер
             minutes = remaining_seconds // 60
             seconds = remaining_seconds % 60
-            
-            # Обновляем сообщение только если:
-            # 1. Прошло достаточно времени (update_interval секунд)
-            # 2. Или изменилась минута (для более точного отображения)
-            # 3. Или осталось меньше минуты (обновляем каждую секунду)
-            current_time = asyncio.get_event_loop().time()
-            should_update = (
-                (current_time - last_update_time >= update_interval) or
-                (minutes != last_displayed_minutes) or
-                (remaining_seconds < 60)
-            )
-            
-            if should_update:
-                timer_text = f"{minutes}:{seconds:02d}"
-                last_displayed_minutes = minutes
-                
-                # Обновляем сообщение
-                try:
-                    current_data = user_states.get(user_id, {}).get('data', data)
-                    bank_links = current_data.get('bank_links', {})
-                    
-                    # Загружаем настройки если они устарели (кэшируем на 5 минут)
-                    if current_time - settings_cache_time > 300:
-                        try:
-                            settings = get_settings()
-                            if asyncio.get_event_loop().time() - settings.get('last_update', 0) > 300:
-                                await load_settings()
-                                settings = get_settings()
-                            settings_cache = settings
-                            settings_cache_time = current_time
-                        except Exception as settings_error:
-                            logger.warning(f"⚠️ Ошибка загрузки настроек в таймере: {settings_error}")
-                            if settings_cache is None:
-                                settings_cache = get_settings()
-                            settings = settings_cache
-                    else:
-                        settings = settings_cache or get_settings()
-                    
-                    enabled_banks = settings.get('deposit_banks', [])
-                    reply_markup = get_bank_keyboard(bank_links, enabled_banks)
-                    
-                    casino_name = get_casino_name(current_data.get('bookmaker', ''))
-                    
-                    # Формируем текст без HTML тегов (они будут удалены при применении премиум эмодзи)
-                    amount_str = f"{current_data.get('amount', 0):.2f}"
-                    player_id_str = str(current_data.get('player_id', ''))
-                    
-                    updated_text = (
-                        f"💰 Сумма: {amount_str} сом\n"
-                        f"🆔 ID: {player_id_str}\n\n"
-                        f"⏳ Время на оплату: {timer_text}\n"
-                        f"‼️ Оплата строго до копеек\n"
-                        f"📸 После оплаты отправьте фото чека"
-                    )
-                    
-                    # Применяем премиум эмодзи
-                    text_with_emoji, caption_entities = add_premium_emoji_to_text(updated_text, Config.PREMIUM_EMOJI_MAP)
-                    
-                    is_photo_message = current_data.get('is_photo_message', False)
+            timer_text = f"{minutes}:{seconds:02d}"
+            self.last_displayed_minutes = minutes
+
+            # Косметическое обновление - только если лимитер дает токен без ожидания
+            if not rate_governor.try_acquire(self.chat_id):
+                self.last_update_time = current_time
+                return self._next_wakeup(current_time)
+
+            # Обновляем сообщение
+            try:
+                current_data = user_states.get(user_id, {}).get('data', self.data)
+                bank_links = current_data.get('bank_links', {})
+
+                # Загружаем настройки если они устарели (кэшируем на 5 минут)
+                if current_time - self.settings_cache_time > 300:
+                    try:
+                        await ensure_settings_fresh()
+                        settings = get_settings()
+                        self.settings_cache = settings
+                        self.settings_cache_time = current_time
+                    except Exception as settings_error:
+                        logger.warning(f"⚠️ Ошибка загрузки настроек в таймере: {settings_error}")
+                        if self.settings_cache is None:
+                            self.settings_cache = get_settings()
+                        settings = self.settings_cache
+                else:
+                    settings = self.settings_cache or get_settings()
+
+                enabled_banks = settings.get('deposit_banks', [])
+                reply_markup = get_bank_keyboard(bank_links, enabled_banks)
+
+                # Формируем текст без HTML тегов (они будут удалены при применении премиум эмодзи)
+                amount_str = f"{current_data.get('amount', 0):.2f}"
+                player_id_str = str(current_data.get('player_id', ''))
+
+                updated_text = (
+                    f"💰 Сумма: {amount_str} сом\n"
+                    f"🆔 ID: {player_id_str}\n\n"
+                    f"⏳ Время на оплату: {timer_text}\n"
+                    f"‼️ Оплата строго до копеек\n"
+                    f"📸 После оплаты отправьте фото чека"
+                )
+
+                # Применяем премиум эмодзи
+                text_with_emoji, caption_entities = add_premium_emoji_to_text(updated_text, Config.PREMIUM_EMOJI_MAP)
+
+                is_photo_message = current_data.get('is_photo_message', False)
+                with rate_governor.prepaid():
                     if is_photo_message:
-                        await bot.edit_message_caption(
-                            chat_id=chat_id,
-                            message_id=message_id,
+                        await self.bot.edit_message_caption(
+                            chat_id=self.chat_id,
+                            message_id=self.message_id,
                             caption=text_with_emoji,
                             caption_entities=caption_entities if caption_entities else None,
                             reply_markup=reply_markup,
                             parse_mode=None
                         )
                     else:
-                        await bot.edit_message_text(
-                            chat_id=chat_id,
-                            message_id=message_id,
+                        await self.bot.edit_message_text(
+                            chat_id=self.chat_id,
+                            message_id=self.message_id,
                             text=text_with_emoji,
                             entities=caption_entities if caption_entities else None,
                             reply_markup=reply_markup,
                             parse_mode=None
                         )
-                    
-                    # Успешное обновление - сбрасываем счетчик ошибок
-                    consecutive_errors = 0
-                    last_update_time = current_time
-                    
-                except Exception as e:
-                    consecutive_errors += 1
-                    error_msg = str(e).lower()
-                    
-                    # Если слишком много ошибок подряд, останавливаем таймер
-                    if consecutive_errors >= max_consecutive_errors:
-                        logger.error(f"❌ Таймер остановлен для пользователя {user_id} - слишком много ошибок подряд: {e}")
-                        if user_id in active_timers:
-                            del active_timers[user_id]
-                        break
-                    
-                    # Если это rate limit ошибка, увеличиваем интервал обновления
-                    if 'rate limit' in error_msg or 'too many requests' in error_msg or 'flood' in error_msg:
-                        logger.warning(f"⚠️ Rate limit для пользователя {user_id}, увеличиваю интервал обновления")
-                        update_interval = min(update_interval * 2, 30)  # Максимум 30 секунд
-                        last_update_time = current_time  # Сбрасываем таймер, чтобы не обновлять сразу
-                    else:
-                        logger.warning(f"⚠️ Не удалось обновить таймер для пользователя {user_id}: {e}")
-        
-        # Время истекло - отменяем заявку
-        if user_id in user_states:
-            logger.info(f"⏰ Таймер истек для пользователя {user_id}, отменяю заявку")
-            
-            current_data = user_states.get(user_id, {}).get('data', data)
-            
-            # Очищаем состояние
-            del user_states[user_id]
-            from utils.state_manager import clear_pending_deposit_state
-            clear_pending_deposit_state(user_id)
-            
-            # Удаляем таймер из активных
-            if user_id in active_timers:
-                del active_timers[user_id]
-            
-            # Отправляем сообщение об отмене
-            try:
-                cancel_text = "⏰ Пополнение отменено, время оплаты прошло\n\n❌ Не переводите по старым реквизитам\n\nНачните заново, нажав на Пополнить"
-                
-                # Применяем премиум эмодзи
-                cancel_text_with_emoji, cancel_entities = add_premium_emoji_to_text(cancel_text, Config.PREMIUM_EMOJI_MAP)
-                
+
+                # Успешное обновление - сбрасываем счетчик ошибок
+                self.consecutive_errors = 0
+                self.last_update_time = current_time
+
+            except Exception as e:
+                self.consecutive_errors += 1
+                error_msg = str(e).lower()
+
+                # Если слишком много ошибок подряд, останавливаем таймер
+                if self.consecutive_errors >= self.max_consecutive_errors:
+                    logger.error(f"❌ Таймер остановлен для пользователя {user_id} - слишком много ошибок подряд: {e}")
+                    self._forget()
+                    return None
+
+                # Если это rate limit ошибка, увеличиваем интервал обновления
+                if 'rate limit' in error_msg or 'too many requests' in error_msg or 'flood' in error_msg:
+                    logger.warning(f"⚠️ Rate limit для пользователя {user_id}, увеличиваю интервал обновления")
+                    self.update_interval = min(self.update_interval * 2, 30)  # Максимум 30 секунд
+                    self.last_update_time = current_time  # Сбрасываем таймер, чтобы не обновлять сразу
+                else:
+                    logger.warning(f"⚠️ Не удалось обновить таймер для пользователя {user_id}: {e}")
+
+            return self._next_wakeup(asyncio.get_event_loop().time())
+        except asyncio.CancelledError:
+            logger.info(f"⏹️ Таймер отменен для пользователя {user_id}")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Ошибка в таймере для пользователя {user_id}: {e}", exc_info=True)
+            self._forget()
+            return None
+
+    async def _expire(self) -> None:
+        """Время истекло - отменяем заявку"""
+        user_id = self.user_id
+        bot = self.bot
+        chat_id = self.chat_id
+        if user_id not in self.user_states:
+            self._forget()
+            return
+        logger.info(f"⏰ Таймер истек для пользователя {user_id}, отменяю заявку")
+
+        # Очищаем состояние
+        del self.user_states[user_id]
+        from utils.state_manager import clear_pending_deposit_state
+        clear_pending_deposit_state(user_id)
+
+        # Удаляем таймер из активных
+        self._forget()
+
+        # Сбрасываем FSM: иначе пользователь остается в DepositStates.bank/receipt_photo
+        try:
+            key = StorageKey(bot_id=bot.id, chat_id=chat_id, user_id=user_id)
+            await fsm_storage.set_state(key, None)
+            await fsm_storage.set_data(key, {})
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сбросить FSM пользователя {user_id}: {e}")
+
+        # Отправляем сообщение об отмене
+        try:
+            cancel_text = "⏰ Пополнение отменено, время оплаты прошло\n\n❌ Не переводите по старым реквизитам\n\nНачните заново, нажав на Пополнить"
+
+            # Применяем премиум эмодзи
+            cancel_text_with_emoji, cancel_entities = add_premium_emoji_to_text(cancel_text, Config.PREMIUM_EMOJI_MAP)
+
+            if self.message_id:
                 try:
-                    await bot.delete_message(chat_id=chat_id, message_id=message_id)
+                    await bot.delete_message(chat_id=chat_id, message_id=self.message_id)
                     logger.info(f"✅ Сообщение с QR-кодом удалено для пользователя {user_id} после истечения таймера")
                 except Exception as delete_error:
                     logger.warning(f"⚠️ Не удалось удалить сообщение с QR-кодом для пользователя {user_id}: {delete_error}")
-                
-                await bot.send_message(
-                    chat_id=chat_id, 
-                    text=cancel_text_with_emoji,
-                    entities=cancel_entities if cancel_entities else None,
-                    parse_mode=None
-                )
-                from handlers.start import send_main_menu
-                await send_main_menu(chat_id, "", bot)
-            except Exception as e:
-                logger.error(f"❌ Ошибка при отправке сообщения об отмене для пользователя {user_id}: {e}")
-    except asyncio.CancelledError:
-        logger.info(f"⏹️ Таймер отменен для пользователя {user_id}")
-        if user_id in active_timers:
-            del active_timers[user_id]
-    except Exception as e:
-        logger.error(f"❌ Ошибка в таймере для пользователя {user_id}: {e}", exc_info=True)
-        if user_id in active_timers:
-            del active_timers[user_id]
-    finally:
-        if user_id in active_timers:
-            del active_timers[user_id]
+
+            await bot.send_message(
+                chat_id=chat_id,
+                text=cancel_text_with_emoji,
+                entities=cancel_entities if cancel_entities else None,
+                parse_mode=None
+            )
+            from handlers.start import send_main_menu
+            await send_main_menu(chat_id, "", bot)
+        except Exception as e:
+            logger.error(f"❌ Ошибка при отправке сообщения об отмене для пользователя {user_id}: {e}")
+
+
+def start_timer(bot: Bot, user_id: int, total_seconds: int, data: dict, message_id: int, chat_id: int, user_states: dict) -> ScheduledHandle:
+    """Запускает таймер депозита в общем планировщике (заменяет предыдущий таймер пользователя)"""
+    timer = DepositTimer(bot, user_id, total_seconds, data, message_id, chat_id, user_states)
+    # Первое обновление - через секунду, как и раньше
+    handle = timer_scheduler.schedule(user_id, timer.start_time + 1, timer.tick)
+    active_timers[user_id] = handle
+    return handle
+
+
+def is_deposit_expired(data: dict) -> bool:
+    """Срок оплаты прошел (например, пока бот был остановлен)"""
+    deadline = data.get('timer_deadline')
+    return bool(deadline) and deadline <= time.time()
+
+
+async def expire_deposit(bot: Bot, user_id: int, data: dict, user_states: dict) -> None:
+    """Отменяет заявку сразу, как при истечении таймера (удаляет QR, сбрасывает состояния)"""
+    cancel_timer(user_id)
+    timer = DepositTimer(bot, user_id, 0, data, data.get('timer_message_id'), data.get('timer_chat_id', user_id), user_states)
+    await timer._expire()
+
+
+async def restore_timers(bot: Bot, user_states: dict) -> None:
+    """
+    Вызывается при старте после восстановления user_states: перезапускает таймеры
+    заявок, срок оплаты которых еще не прошел, и отменяет истекшие за время простоя.
+    """
+    from utils.state_manager import get_pending_deposit_deadline
+    now = time.time()
+    restored = expired = 0
+    for user_id in list(user_states):
+        state = user_states.get(user_id) or {}
+        if state.get('step') not in ['deposit_bank', 'deposit_receipt_photo'] or user_id in active_timers:
+            continue
+        data = state.get('data') or {}
+        # Состояния, сохраненные до появления timer_deadline, - по сроку ожидания фото чека
+        deadline = data.get('timer_deadline') or get_pending_deposit_deadline(user_id) or 0
+        try:
+            if deadline <= now:
+                await expire_deposit(bot, user_id, data, user_states)
+                expired += 1
+            elif 'timer_message_id' in data and 'timer_chat_id' in data:
+                data['timer_deadline'] = deadline
+                start_timer(bot, user_id, int(deadline - now), data, data['timer_message_id'], data['timer_chat_id'], user_states)
+                restored += 1
+        except Exception as e:
+            logger.error(f"❌ Не удалось восстановить таймер пользователя {user_id}: {e}")
+    if restored or expired:
+        logger.info(f"⏳ Таймеры депозита после рестарта: {restored} перезапущено, {expired} истекших заявок отменено")
+
+
+def get_timer_metrics() -> dict:
+    """Метрики планировщика таймеров (глубина очереди, опоздания)"""
+    return timer_scheduler.metrics()
+
 
 def cancel_timer(user_id: int):
     """Отменяет таймер для пользователя"""
@@ -221,5 +328,3 @@ def cancel_timer(user_id: int):
         except Exception as e:
             logger.warning(f"⚠️ Ошибка при остановке таймера: {e}")
         del active_timers[user_id]
-
-
@@ -0,0 +1,67 @@
+"""
+Запуск бота в режиме webhook (локальный aiohttp-сервер за nginx)
+
+Telegram сам присылает обновления POST-запросами - нет задержки цикла
+getUpdates, а несколько процессов могут принимать обновления за одним nginx.
+Запросы без правильного X-Telegram-Bot-Api-Secret-Token отклоняются (401),
+обновление обрабатывается в фоне, Telegram сразу получает ответ 200.
+"""
+
+import asyncio
+import logging
+import signal
+from typing import List
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def get_webhook_url() -> str:
+    return Config.WEBHOOK_URL.rstrip('/') + Config.WEBHOOK_PATH
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates: List[str]) -> None:
+    """Поднимает aiohttp-сервер, регистрирует webhook и работает до остановки"""
+    if not Config.WEBHOOK_SECRET:
+        raise ValueError("BOT_NEW_WEBHOOK_SECRET не задан - без него любой может отправлять боту поддельные обновления")
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=Config.WEBHOOK_SECRET
+    ).register(app, path=Config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, host=Config.WEBHOOK_HOST, port=Config.WEBHOOK_PORT)
+        await site.start()
+        logger.info(f"🌐 Webhook-сервер слушает {Config.WEBHOOK_HOST}:{Config.WEBHOOK_PORT}{Config.WEBHOOK_PATH}")
+
+        # Обновления, пришедшие пока бот был остановлен, Telegram доставит после регистрации
+        await bot.set_webhook(
+            url=get_webhook_url(),
+            secret_token=Config.WEBHOOK_SECRET,
+            max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=allowed_updates
+        )
+        logger.info(f"✅ Webhook зарегистрирован: {get_webhook_url()} (max_connections={Config.WEBHOOK_MAX_CONNECTIONS}, updates={allowed_updates})")
+
+        # Как start_polling: SIGTERM/SIGINT останавливают сервер штатно - runner.cleanup()
+        # вызывает shutdown диспетчера (закрытие хранилища FSM, сохранение состояний)
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+        await stop_event.wait()
+        logger.info("🛑 Получен сигнал остановки, webhook-сервер завершает работу")
+    finally:
+        await runner.cleanup()
@@ -143,6 +143,10 @@ else
     echo "⚠️ Файл $NGINX_CONFIG_DIR/lux-on.org.ssl.conf не найден, пропускаем..."
 fi
 
+# Общие настройки webhook Telegram-ботов (подключаются из pipiska.net.ssl.conf)
+mkdir -p /etc/nginx/snippets
+cp "$NGINX_CONFIG_DIR/telegram-webhook.conf" /etc/nginx/snippets/telegram-webhook.conf
+
 if [ -f "$NGINX_CONFIG_DIR/pipiska.net.ssl.conf" ]; then
     cp "$NGINX_CONFIG_DIR/pipiska.net.ssl.conf" /etc/nginx/sites-available/pipiska.net
     echo "✅ Применена SSL конфигурация для pipiska.net"